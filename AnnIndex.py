@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+AnnIndex.py : Índex aproximat de veïns més propers (IVF) per a RecommenderSystem.
+
+Índex IVF (inverted file) sobre embeddings normalitzats:
+    - Un k-means esfèric (similitud cosinus) reparteix els vectors en
+      'nlist' grups, cadascun representat pel seu centroide.
+    - Per a una consulta es miren només els 'nprobe' grups amb el centroide
+      més similar i es calcula la similitud exacta dels seus vectors.
+
+Més 'nprobe' => més recall i més latència (nprobe = nlist és la cerca exacta).
+
+Mètodes:
+    - build(matrix) -> None
+        Entrena els centroides i assigna cada fila de la matriu a un grup.
+
+    - search(matrix, query, k, nprobe=None, exclude=None) -> np.ndarray
+        Files dels k vectors més similars a 'query' (de més a menys).
+        'exclude' és una fila o una llista de files que no es retornen.
+
+    - save(path) / IVFIndex.load(path)
+        Desa / carrega l'índex en format .npz. La matriu de vectors no es
+        desa: és la de RecommenderSystem.
+
+Notes:
+    - Les llistes de cada grup es guarden en format CSR (offsets + files).
+"""
+import numpy as np
+
+# Files per bloc en calcular assignacions (limita la memòria temporal)
+ASSIGN_BLOCK = 65536
+
+
+class IVFIndex:
+    def __init__(self, nlist: int = None, nprobe: int = 8, iterations: int = 10, seed: int = 0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self.list_offsets = np.zeros(1, dtype=np.int64)
+        self.list_rows = np.zeros(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.list_rows)
+
+    def __str__(self) -> str:
+        return f"IVFIndex ({len(self.list_rows)} vectors, {len(self.centroids)} grups, nprobe={self.nprobe})"
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        assign = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), ASSIGN_BLOCK):
+            block = vectors[start:start + ASSIGN_BLOCK]
+            assign[start:start + ASSIGN_BLOCK] = np.argmax(block @ self.centroids.T, axis=1)
+        return assign
+
+    def build(self, matrix: np.ndarray) -> None:
+        n = len(matrix)
+        if n == 0:
+            raise ValueError("No es pot construir un índex buit")
+        nlist = min(n, self.nlist or max(1, int(4 * np.sqrt(n))))
+        rng = np.random.default_rng(self.seed)
+
+        # Entrenem sobre una mostra (com a molt 64 vectors per grup)
+        sample = matrix[rng.choice(n, size=min(n, nlist * 64), replace=False)]
+        self.centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(self.iterations):
+            assign = self._assign(sample)
+            counts = np.bincount(assign, minlength=nlist)
+            order = np.argsort(assign, kind="stable")
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            sums = np.zeros_like(self.centroids)
+            filled = counts > 0
+            sums[filled] = np.add.reduceat(sample[order], starts[filled], axis=0)
+            # Els grups buits es tornen a sembrar amb vectors a l'atzar
+            empty = np.flatnonzero(~filled)
+            if len(empty):
+                sums[empty] = sample[rng.choice(len(sample), size=len(empty), replace=False)]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            self.centroids = (sums / np.where(norms > 0, norms, 1)).astype(np.float32)
+
+        assign = self._assign(matrix)
+        self.list_rows = np.argsort(assign, kind="stable")
+        self.list_offsets = np.concatenate(([0], np.cumsum(np.bincount(assign, minlength=nlist))))
+        self.nlist = nlist
+
+    def search(self, matrix: np.ndarray, query: np.ndarray, k: int,
+               nprobe: int = None, exclude: int = None) -> np.ndarray:
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        probes = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        candidates = np.concatenate([self.list_rows[self.list_offsets[p]:self.list_offsets[p + 1]]
+                                     for p in probes])
+        if exclude is not None:
+            candidates = candidates[~np.isin(candidates, exclude)]
+        if len(candidates) == 0 or k <= 0:
+            return candidates[:0]
+        scores = matrix[candidates] @ query
+        k = min(k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.lexsort((candidates[top], -scores[top]))]
+        return candidates[top]
+
+    def save(self, path: str) -> None:
+        np.savez(path, centroids=self.centroids, list_offsets=self.list_offsets,
+                 list_rows=self.list_rows,
+                 params=np.array([self.nprobe, self.iterations, self.seed], dtype=np.int64))
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as data:
+            nprobe, iterations, seed = (int(value) for value in data["params"])
+            index = cls(nlist=len(data["centroids"]), nprobe=nprobe, iterations=iterations, seed=seed)
+            index.centroids = data["centroids"]
+            index.list_offsets = data["list_offsets"]
+            index.list_rows = data["list_rows"]
+        return index
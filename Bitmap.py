@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Bitmap.py : Conjunts de resultats com a bitmaps sobre identificadors de fila.
+
+Les cerques treballen amb identificadors de fila enters i densos en lloc
+d'UUID (strings). Un conjunt de resultats és un Bitmap: un enter de Python
+on el bit 'r' indica que la fila 'r' hi pertany. Les operacions AND, OR i
+NOT són operacions bit a bit sobre l'enter (fetes en C, N/64 paraules),
+sense crear cap referència a strings.
+
+Classes:
+    - RowIndex: assigna una fila a cada UUID (en ordre d'inserció) i
+      converteix entre llistes d'UUID i Bitmaps.
+    - Bitmap: conjunt immutable de files amb &, |, -, ^, len, in i iter
+      (les files surten en ordre creixent, és a dir, en ordre d'inserció).
+
+Notes:
+    - Els Bitmaps amb poques files (SPARSE_ROWS) es construeixen i recorren
+      bit a bit, sense passar per tots els bytes de l'univers.
+    - Les files no es reaprofiten: un UUID eliminat deixa un forat, i si es
+      torna a afegir rep una fila nova al final (com l'ordre d'un dict).
+"""
+import re
+
+# Amb com a molt SPARSE_ROWS files, el Bitmap es construeix i es recorre bit a
+# bit (cost proporcional a les files) en lloc de passar pels size/8 bytes
+SPARSE_ROWS = 8
+# Trams de bytes diferents de zero (la cerca dels trams es fa en C)
+_NONZERO = re.compile(rb"[^\x00]+")
+# Per a cada valor d'un byte, les posicions dels bits actius
+_BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+
+class Bitmap:
+    __slots__ = ("bits",)
+
+    def __init__(self, bits: int = 0):
+        self.bits = bits
+
+    @classmethod
+    def from_rows(cls, rows, size: int):
+        """Crea un Bitmap a partir de files (enters < size) en O(k + size/8)."""
+        if not isinstance(rows, (list, tuple, set)):
+            rows = list(rows)
+        if len(rows) <= SPARSE_ROWS:
+            bits = 0
+            for row in rows:
+                bits |= 1 << row
+            return cls(bits)
+        buffer = bytearray((size + 7) >> 3)
+        for row in rows:
+            buffer[row >> 3] |= 1 << (row & 7)
+        return cls(int.from_bytes(buffer, "little"))
+
+    def __and__(self, other):
+        return Bitmap(self.bits & other.bits)
+
+    def __or__(self, other):
+        return Bitmap(self.bits | other.bits)
+
+    def __sub__(self, other):
+        return Bitmap(self.bits & ~other.bits)
+
+    def __xor__(self, other):
+        return Bitmap(self.bits ^ other.bits)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Bitmap) and self.bits == other.bits
+
+    def __hash__(self) -> int:
+        return hash(self.bits)
+
+    def __len__(self) -> int:
+        return self.bits.bit_count()
+
+    def __bool__(self) -> bool:
+        return self.bits != 0
+
+    def __contains__(self, row: int) -> bool:
+        return row >= 0 and (self.bits >> row) & 1 == 1
+
+    def __iter__(self):
+        bits = self.bits
+        if bits.bit_count() <= SPARSE_ROWS:
+            rows = []
+            while bits:
+                low = bits & -bits
+                rows.append(low.bit_length() - 1)
+                bits ^= low
+            yield from rows
+            return
+        # Només es recorren (en Python) els trams de bytes amb alguna fila
+        data = bits.to_bytes((bits.bit_length() + 7) >> 3, "little")
+        for run in _NONZERO.finditer(data):
+            base = run.start() << 3
+            for byte in run.group():
+                for bit in _BYTE_BITS[byte]:
+                    yield base + bit
+                base += 8
+
+    def __repr__(self) -> str:
+        return f"Bitmap({len(self)} files)"
+
+
+class RowIndex:
+    def __init__(self, uuids=()):
+        self._rows = {}     # uuid -> fila
+        self._uuids = []    # fila -> uuid (None si s'ha eliminat)
+        self._live = None   # Bitmap de files vives (es recalcula si cal)
+        for uuid in uuids:
+            self.add(uuid)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, uuid: str) -> bool:
+        return uuid in self._rows
+
+    @property
+    def size(self) -> int:
+        """Nombre de files assignades (incloent-hi els forats)."""
+        return len(self._uuids)
+
+    def add(self, uuid: str) -> int:
+        row = self._rows.get(uuid)
+        if row is None:
+            row = len(self._uuids)
+            self._rows[uuid] = row
+            self._uuids.append(uuid)
+            self._live = None
+        return row
+
+    def remove(self, uuid: str) -> None:
+        row = self._rows.pop(uuid, None)
+        if row is not None:
+            self._uuids[row] = None
+            self._live = None
+
+    def row_of(self, uuid: str) -> int:
+        return self._rows.get(uuid)
+
+    def uuid_of(self, row: int) -> str:
+        return self._uuids[row]
+
+    def live(self) -> Bitmap:
+        """Bitmap amb totes les files vives (l'univers per a NOT)."""
+        if self._live is None:
+            self._live = Bitmap.from_rows(self._rows.values(), len(self._uuids))
+        return self._live
+
+    def bitmap(self, uuids) -> Bitmap:
+        """Bitmap dels UUID indicats (els desconeguts s'ignoren)."""
+        rows = self._rows
+        return Bitmap.from_rows((rows[uuid] for uuid in uuids if uuid in rows), len(self._uuids))
+
+    def to_uuids(self, bitmap: Bitmap) -> list:
+        """Llista d'UUID del Bitmap, en ordre d'inserció."""
+        uuids = self._uuids
+        return [uuids[row] for row in bitmap]
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+ColumnStore.py : Emmagatzematge en columnes per a la base de dades d'ImageData.
+
+En lloc d'un diccionari per imatge, cada camp és una columna indexada per un
+identificador de fila enter i dens:
+    - Camps amb molts valors diferents (file_path, prompt, seed): una llista.
+    - Camps amb pocs valors diferents (model, sampler, steps, ...): un
+      array('I') de codis cap a un pool de strings compartit (interning).
+    - width / height: array('i'), amb -1 per indicar "sense valor".
+
+La classe es comporta com el diccionari {uuid: {camp: valor}} que feia
+servir ImageData (in, len, get, [], keys, del), de manera que la resta del
+codi no canvia. Els valors d'una fila s'obtenen amb vistes lleugeres (_Row).
+
+Notes:
+    - Les files eliminades es reaprofiten (llista de files lliures).
+    - rows(uuids, fields) llegeix molts UUID columna a columna, sense crear
+      una vista per fila (per als llistats grans d'ImageViewer).
+"""
+from array import array
+
+STRING_FIELDS = ("file_path", "prompt", "seed")
+POOLED_FIELDS = ("cfg_scale", "steps", "sampler", "model", "generated", "created_date")
+INT_FIELDS = ("width", "height")
+FIELDS = STRING_FIELDS + POOLED_FIELDS + INT_FIELDS
+
+
+class _Row:
+    """Vista d'una fila amb la interfície d'un diccionari de camps."""
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, store, row: int):
+        self._store = store
+        self._row = row
+
+    def __getitem__(self, key: str):
+        if key not in self._store._kinds:
+            raise KeyError(key)
+        return self._store._read(self._row, key)
+
+    def __setitem__(self, key: str, value) -> None:
+        if key not in self._store._kinds:
+            raise KeyError(key)
+        self._store._write(self._row, key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._store._kinds
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def get(self, key: str, default=None):
+        if key not in self._store._kinds:
+            return default
+        return self._store._read(self._row, key)
+
+    def keys(self):
+        return list(FIELDS)
+
+    def items(self):
+        return [(key, self._store._read(self._row, key)) for key in FIELDS]
+
+    def to_dict(self) -> dict:
+        return dict(self.items())
+
+
+class ColumnStore:
+    def __init__(self):
+        self._rows = {}         # uuid -> fila
+        self._size = 0          # files creades (incloses les lliures)
+        self._free = []         # files lliures per reaprofitar
+        self._strings = {field: [] for field in STRING_FIELDS}
+        self._codes = {field: array('I') for field in POOLED_FIELDS}
+        self._ints = {field: array('i') for field in INT_FIELDS}
+        # Pool de strings compartit pels camps de pocs valors (codi 0 = None)
+        self._pool = [None]
+        self._pool_index = {}
+        self._kinds = {}
+        for field in STRING_FIELDS:
+            self._kinds[field] = self._strings[field]
+        for field in POOLED_FIELDS:
+            self._kinds[field] = self._codes[field]
+        for field in INT_FIELDS:
+            self._kinds[field] = self._ints[field]
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __str__(self) -> str:
+        return f"ColumnStore ({len(self._rows)} files, {len(self._pool) - 1} strings al pool)"
+
+    def __contains__(self, uuid: str) -> bool:
+        return uuid in self._rows
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def keys(self):
+        return self._rows.keys()
+
+    def __getitem__(self, uuid: str) -> _Row:
+        return _Row(self, self._rows[uuid])
+
+    def get(self, uuid: str, default=None):
+        row = self._rows.get(uuid)
+        if row is None:
+            return default
+        return _Row(self, row)
+
+    def row_of(self, uuid: str) -> int:
+        return self._rows.get(uuid)
+
+    def rows(self, uuids, fields=FIELDS) -> list:
+        """
+        Valors dels camps 'fields' de molts UUID d'un sol cop: una tupla per
+        UUID (None si no hi és). Es llegeix columna a columna, sense vistes.
+        """
+        rows = [self._rows.get(uuid) for uuid in uuids]
+        present = [row for row in rows if row is not None]
+        columns = []
+        for field in fields:
+            if field in self._codes:
+                pool, codes = self._pool, self._codes[field]
+                columns.append([pool[codes[row]] for row in present])
+            elif field in self._ints:
+                ints = self._ints[field]
+                columns.append([None if ints[row] < 0 else ints[row] for row in present])
+            else:
+                strings = self._kinds[field]
+                columns.append([strings[row] for row in present])
+        values = iter(zip(*columns)) if columns else iter(() for _ in present)
+        return [None if row is None else next(values) for row in rows]
+
+    def __setitem__(self, uuid: str, values: dict) -> None:
+        row = self._rows.get(uuid)
+        if row is None:
+            row = self._new_row()
+            self._rows[uuid] = row
+        else:
+            self._clear_row(row)
+        for key, value in values.items():
+            self._kinds[key]  # KeyError si el camp no existeix
+            self._write(row, key, value)
+
+    def __delitem__(self, uuid: str) -> None:
+        row = self._rows.pop(uuid)
+        self._clear_row(row)
+        self._free.append(row)
+
+    def pop(self, uuid: str, default=None):
+        if uuid not in self._rows:
+            return default
+        values = self[uuid].to_dict()
+        del self[uuid]
+        return values
+
+    def _new_row(self) -> int:
+        if self._free:
+            return self._free.pop()
+        for column in self._strings.values():
+            column.append(None)
+        for column in self._codes.values():
+            column.append(0)
+        for column in self._ints.values():
+            column.append(-1)
+        self._size += 1
+        return self._size - 1
+
+    def _clear_row(self, row: int) -> None:
+        for column in self._strings.values():
+            column[row] = None
+        for column in self._codes.values():
+            column[row] = 0
+        for column in self._ints.values():
+            column[row] = -1
+
+    def _intern(self, value) -> int:
+        if value is None:
+            return 0
+        code = self._pool_index.get(value)
+        if code is None:
+            code = len(self._pool)
+            self._pool.append(value)
+            self._pool_index[value] = code
+        return code
+
+    def _read(self, row: int, key: str):
+        if key in self._codes:
+            return self._pool[self._codes[key][row]]
+        if key in self._ints:
+            value = self._ints[key][row]
+            return None if value < 0 else value
+        return self._strings[key][row]
+
+    def _write(self, row: int, key: str, value) -> None:
+        if key in self._codes:
+            self._codes[key][row] = self._intern(value)
+        elif key in self._ints:
+            self._ints[key][row] = -1 if value is None else value
+        else:
+            self._strings[key][row] = value
@@ -38,19 +38,44 @@ Mètodes a implementar:
     - remove_last_image() -> None
         Elimina l'última imatge de la galeria.
 
+    - save_file(file: str) -> None
+        Desa la galeria en el mateix format JSON (paths relatius a ROOT_DIR).
+
 Notes:
     - Utilitzeu la llibreria json per llegir els arxius
     - Els paths dins el JSON són relatius a ROOT_DIR
     - Cada galeria és un objecte independent (instància de Gallery)
     - Podeu tenir múltiples galeries actives simultàniament
-    - Les operacions d'afegir/eliminar són ràpides (no busquen a la llista)
+    - load_file(file, mode="batch") resol tots els paths d'un cop, valida amb
+      les metadades ja carregades (o a la cau d'ImageData) i llegeix la resta
+      de PNG en paral·lel. Amb mode="lazy" aquestes lectures es fan en
+      mostrar la galeria (o amb validate()). Els temps de cada fase queden
+      a self.load_timings.
+    - load_file llegeix la llista "images" de manera incremental (JsonStream)
+      i save_file(file) desa la galeria en streaming i de manera atòmica
+      (arxiu temporal + os.replace).
+    - Les operacions d'afegir/eliminar són ràpides (no busquen a la llista):
+      els UUID es guarden en un deque intern (O(1) pels dos extrems) amb un
+      diccionari de comptadors per saber en O(1) si un UUID hi és. L'atribut
+      uuids continua sent una llista (una còpia, en ordre); per recórrer la
+      galeria sense copiar-la, iter(gallery).
 """
 import cfg
 import json
 import os.path
+import time
+from collections import deque
+from itertools import islice
+import JsonStream
+from Bitmap import Bitmap, RowIndex
 from ImageID import ImageID
 from ImageData import ImageData
 
+# Entrades de la llista "images" per cada escriptura a save_file
+SAVE_BLOCK = 4096
+# Paths que load_file (modes "batch" i "lazy") resol i valida de cop
+RESOLVE_BLOCK = 4096
+
 
 class Gallery:
     def __init__(self,
@@ -60,28 +85,79 @@ class Gallery:
         self.name = name
         self.description = ""
         self.created_date = ""
-        self.uuids = []
+        # Ordre de la galeria i nombre d'aparicions de cada UUID (un arxiu de
+        # galeria pot repetir una imatge)
+        self._order = deque()
+        self._counts = {}
+        # Imatges acceptades sense validar (mode "lazy"): uuid -> path relatiu
+        self._pending = {}
+        # Temps (segons) de cada fase de l'última càrrega
+        self.load_timings = {}
 
         self._image_id = image_id
         self._image_data = image_data
 
     def __len__(self) -> int:
-        return len(self.uuids)
+        return len(self._order)
 
     def __str__(self) -> str:
-        return f"Gallery '{self.name}' ({len(self.uuids)} imatges, Descripció: {self.description})"
+        return f"Gallery '{self.name}' ({len(self._order)} imatges, Descripció: {self.description})"
+
+    def __contains__(self, uuid: str) -> bool:
+        return uuid in self._counts
+
+    def __iter__(self):
+        return iter(self._order)
+
+    def _append(self, uuid: str) -> None:
+        self._order.append(uuid)
+        self._counts[uuid] = self._counts.get(uuid, 0) + 1
+
+    def _forget(self, uuid: str) -> None:
+        count = self._counts[uuid] - 1
+        if count:
+            self._counts[uuid] = count
+        else:
+            del self._counts[uuid]
+
+    @property
+    def uuids(self) -> list:
+        """UUID de la galeria, en ordre, com a llista (còpia del deque intern)."""
+        return list(self._order)
+
+    @uuids.setter
+    def uuids(self, uuids) -> None:
+        self._clear()
+        for uuid in uuids:
+            self._append(uuid)
+
+    def _clear(self) -> None:
+        self._order = deque()
+        self._counts = {}
+        self._pending = {}
 
-    def load_file(self, file: str) -> None:
+    def to_bitmap(self, rows: RowIndex) -> Bitmap:
+        """Bitmap amb les files de les imatges de la galeria (veure SearchMetadata.rows)."""
+        return rows.bitmap(self._order)
+
+    def load_file(self, file: str, mode: str = "sync", workers: int = 8) -> None:
         """
         Llegeix un arxiu JSON amb la definició de la galeria.
         IMPORTANT: En cas d'error, la galeria ha de quedar BUIDA.
+
+        mode "sync":  llegeix les metadades de cada imatge, una a una.
+        mode "batch": resol tots els paths d'un cop i només llegeix (en
+                      paral·lel) les imatges sense metadades carregades.
+        mode "lazy":  com "batch", però aquestes lectures es deixen per
+                      quan es mostri la galeria (veure validate()).
         """
         # Primer, buidem la galeria completament
         original_name = self.name
         self.name = "Unnamed Gallery"
         self.description = ""
         self.created_date = ""
-        self.uuids = []
+        self._clear()
+        self.load_timings = {}
 
         if self._image_id is None or self._image_data is None:
             print("ERROR (Gallery): Dependències ImageID o ImageData no inicialitzades.")
@@ -93,72 +169,214 @@ class Gallery:
             return
 
         try:
+            # Capçalera per defecte: els camps poden aparèixer en qualsevol
+            # ordre (també després de la llista d'imatges)
+            self.name = original_name
+            self.description = "N/A"
+            self.created_date = "N/A"
             with open(file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-
-            # Restaurar el nom original si la càrrega és exitosa
-            self.name = data.get("gallery_name", original_name)
-            self.description = data.get("description", "N/A")
-            self.created_date = data.get("created_date", "N/A")
-
-            image_paths = data.get("images", [])
-            loaded_count = 0
-
-            for relative_path in image_paths:
-                # Path absolut basat en ROOT_DIR
-                absolute_path = os.path.join(cfg.ROOT_DIR, relative_path)
-
-                uuid = self._image_id.get_uuid(absolute_path)
-                if uuid:
-                    # Verificar que les metadades existeixen
-                    try:
-                        # Intentar carregar metadades per verificar que existeixen
-                        self._image_data.load_metadata(uuid)
-                        prompt = self._image_data.get_prompt(uuid)
-                        if prompt is not None:
-                            self.uuids.append(uuid)
-                            loaded_count += 1
-                        else:
-                            print(f"WARNING (Gallery): Imatge '{relative_path}' no té metadades vàlides.")
-                    except Exception:
-                        print(f"WARNING (Gallery): No s'han pogut carregar metadades per {uuid}")
-                else:
-                    print(f"WARNING (Gallery): Imatge '{relative_path}' no té UUID registrat.")
+                # La llista "images" es llegeix element a element: cada path es
+                # resol mentre es continua llegint l'arxiu
+                image_paths = self._read_members(JsonStream.iter_members(f, streamed=("images",)))
+                if mode != "sync":
+                    self._load_batch(image_paths, mode == "lazy", workers)
+                    return
+
+                start = time.perf_counter()
+                loaded_count = 0
+
+                for relative_path in image_paths:
+                    # Path absolut basat en ROOT_DIR
+                    absolute_path = os.path.join(cfg.ROOT_DIR, relative_path)
+
+                    uuid = self._image_id.get_uuid(absolute_path)
+                    if uuid:
+                        # Verificar que les metadades existeixen
+                        try:
+                            # Intentar carregar metadades per verificar que existeixen
+                            self._image_data.load_metadata(uuid)
+                            prompt = self._image_data.get_prompt(uuid)
+                            if prompt is not None:
+                                self._append(uuid)
+                                loaded_count += 1
+                            else:
+                                print(f"WARNING (Gallery): Imatge '{relative_path}' no té metadades vàlides.")
+                        except Exception:
+                            print(f"WARNING (Gallery): No s'han pogut carregar metadades per {uuid}")
+                    else:
+                        print(f"WARNING (Gallery): Imatge '{relative_path}' no té UUID registrat.")
+                self.load_timings["validate"] = time.perf_counter() - start - self.load_timings["parse"]
 
         except json.JSONDecodeError:
             print(f"ERROR (Gallery): Format JSON invàlid a l'arxiu: {file}")
             # Assegurar que la galeria queda COMPLETAMENT buida
             self.name = original_name
-            self.uuids = []
+            self.description = ""
+            self.created_date = ""
+            self._clear()
         except Exception as e:
             print(f"ERROR (Gallery): Error inesperat carregant {file}: {e}")
             # Assegurar que la galeria queda COMPLETAMENT buida
             self.name = original_name
-            self.uuids = []
+            self.description = ""
+            self.created_date = ""
+            self._clear()
+
+    def _read_members(self, members):
+        """
+        Aplica els camps de capçalera de la galeria i genera els paths de
+        "images" a mesura que es llegeixen. El temps de lectura es suma a
+        self.load_timings["parse"].
+        """
+        self.load_timings["parse"] = 0.0
+        members = iter(members)
+        while True:
+            start = time.perf_counter()
+            member = next(members, None)
+            self.load_timings["parse"] += time.perf_counter() - start
+            if member is None:
+                return
+            path, value = member
+            if path[0] == "images" and len(path) == 2:
+                yield value
+            elif path == ("gallery_name",):
+                self.name = value
+            elif path == ("description",):
+                self.description = value
+            elif path == ("created_date",):
+                self.created_date = value
+
+    def _load_batch(self, image_paths, lazy: bool, workers: int) -> None:
+        # 1) Els paths es processen en blocs de RESOLVE_BLOCK a mesura que es
+        # llegeixen: primer es resol tot el bloc a UUID (os.path.join amb
+        # ROOT_DIR sense la crida per path: un path absolut es queda tal
+        # qual) i després es valida amb les metadades que ja hi ha a memòria
+        prefix = os.path.join(cfg.ROOT_DIR, "")
+        get_uuid = self._image_id.get_uuid
+        get_prompt = self._image_data.get_prompt
+        is_loaded = self._image_data.is_loaded
+        self.load_timings["resolve"] = 0.0
+        self.load_timings["validate"] = 0.0
+        image_paths = iter(image_paths)
+        while True:
+            block = list(islice(image_paths, RESOLVE_BLOCK))
+            if not block:
+                break
+            start = time.perf_counter()
+            uuids = [get_uuid(path if path.startswith("/") else prefix + path) for path in block]
+            resolved = time.perf_counter()
+            for relative_path, uuid in zip(block, uuids):
+                if not uuid:
+                    print(f"WARNING (Gallery): Imatge '{relative_path}' no té UUID registrat.")
+                elif get_prompt(uuid) is not None:
+                    self._append(uuid)
+                elif is_loaded(uuid):
+                    print(f"WARNING (Gallery): Imatge '{relative_path}' no té metadades vàlides.")
+                else:
+                    # Sense llegir: s'accepta provisionalment fins a validate()
+                    self._append(uuid)
+                    self._pending[uuid] = relative_path
+            self.load_timings["resolve"] += resolved - start
+            self.load_timings["validate"] += time.perf_counter() - resolved
+
+        # 2) La resta es llegeix en paral·lel (ara o en mostrar la galeria)
+        if not lazy:
+            self.validate(workers)
+
+    def validate(self, workers: int = 8) -> None:
+        """
+        Llegeix (en paral·lel) les metadades de les imatges acceptades
+        provisionalment i treu de la galeria les que no tenen prompt.
+        """
+        if not self._pending:
+            return
+        start = time.perf_counter()
+        pending, self._pending = self._pending, {}
+        self._image_data.load_metadata_many(list(pending), workers=workers)
+        invalid = set()
+        for uuid, relative_path in pending.items():
+            if self._image_data.get_prompt(uuid) is None:
+                print(f"WARNING (Gallery): Imatge '{relative_path}' no té metadades vàlides.")
+                invalid.add(uuid)
+        if invalid:
+            kept = [uuid for uuid in self._order if uuid not in invalid]
+            self._clear()
+            for uuid in kept:
+                self._append(uuid)
+        self.load_timings["read"] = time.perf_counter() - start
+
+    def save_file(self, file: str) -> None:
+        """
+        Desa la galeria en format JSON (el mateix que llegeix load_file).
+        S'escriu imatge a imatge a un arxiu temporal que després substitueix
+        'file' (os.replace): si falla, l'arxiu anterior queda intacte.
+        """
+        if self._image_id is None:
+            print("ERROR (Gallery): Dependència ImageID no inicialitzada.")
+            return
+        tmp_file = file + ".tmp"
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                f.write('{\n')
+                for key, value in (("gallery_name", self.name), ("description", self.description),
+                                   ("created_date", self.created_date)):
+                    f.write(f'  "{key}": {json.dumps(value, ensure_ascii=False)},\n')
+                f.write('  "images": [')
+                # Les entrades s'escriuen en blocs de SAVE_BLOCK (una crida a
+                # write per bloc, sense construir tot el document)
+                # Els paths es desen relatius a ROOT_DIR, com els llegeix load_file
+                prefix = os.path.join(cfg.ROOT_DIR, "")
+                uuid_to_path = self._image_id.uuid_to_path
+                block = []
+                written = 0
+                for uuid in self._order:
+                    path = uuid_to_path.get(uuid)
+                    if path is None:
+                        print(f"WARNING (Gallery): UUID {uuid} sense path registrat, no es desa.")
+                        continue
+                    if path.startswith(prefix):
+                        path = path[len(prefix):]
+                    block.append(json.dumps(path, ensure_ascii=False))
+                    if len(block) == SAVE_BLOCK:
+                        f.write((',\n    ' if written else '\n    ') + ',\n    '.join(block))
+                        written += len(block)
+                        block = []
+                if block:
+                    f.write((',\n    ' if written else '\n    ') + ',\n    '.join(block))
+                    written += len(block)
+                f.write('\n  ]\n}\n' if written else ']\n}\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, file)
+        except OSError as e:
+            print(f"ERROR (Gallery): No s'ha pogut desar la galeria a {file}: {e}")
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
 
     def show(self) -> None:
         """
         Versió simplificada per a la Fase 2 (sense ImageViewer).
         """
-        print(f"\n--- Galeria: {self.name} (Total: {len(self.uuids)} imatges) ---")
-        if not self.uuids:
+        self.validate()
+        print(f"\n--- Galeria: {self.name} (Total: {len(self._order)} imatges) ---")
+        if not self._order:
             print("La galeria està buida.")
             return
 
-        for i, uuid in enumerate(self.uuids):
-            print(f"[{i+1}/{len(self.uuids)}] UUID: {uuid}")
+        for i, uuid in enumerate(self._order):
+            print(f"[{i+1}/{len(self._order)}] UUID: {uuid}")
 
     def add_image_at_end(self, uuid: str) -> None:
         """Afegeix una imatge (UUID) al final de la galeria, si no hi és ja."""
-        if uuid and uuid not in self.uuids:
-            self.uuids.append(uuid)
+        if uuid and uuid not in self._counts:
+            self._append(uuid)
 
     def remove_first_image(self) -> None:
         """Elimina la primera imatge de la galeria (si existeix)."""
-        if self.uuids:
-            self.uuids.pop(0)
+        if self._order:
+            self._forget(self._order.popleft())
 
     def remove_last_image(self) -> None:
         """Elimina l'última imatge de la galeria (si existeix)."""
-        if self.uuids:
-            self.uuids.pop()
+        if self._order:
+            self._forget(self._order.pop())
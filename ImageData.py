@@ -56,43 +56,299 @@ Notes:
     - Si un camp no existeix, retorneu "None" (string)
     - Les dimensions es llegeixen amb img.width i img.height
     - Tots els camps de metadades es guarden com a strings
+    - load_metadata fa servir read_png_header(): un lector de chunks PNG que
+      obre l'arxiu una sola vegada, llegeix IHDR i els chunks de text
+      (tEXt, zTXt, iTXt) i s'atura al primer IDAT, sense llegir els píxels.
+      Un chunk comprimit que descomprimit supera MAX_TEXT_CHUNK (o està
+      incomplet) es descarta sencer, mai es guarda truncat.
+    - load_metadata_many(uuids) / load_all() llegeixen molts arxius en
+      paral·lel i retornen els errors per arxiu.
+    - ImageData(cache_file=...) activa una memòria cau persistent
+      (MetadataCache) indexada per (path relatiu, mida, mtime_ns): només es
+      llegeix el PNG si l'arxiu és nou o ha canviat.
+    - ImageData(columnar=True) guarda la base de dades en columnes
+      (ColumnStore) en lloc d'un diccionari per imatge, amb molta menys
+      memòria per a col·leccions grans. Els getters no canvien.
+    - get_rows(uuids, fields) retorna els camps de moltes imatges d'un sol
+      cop (una tupla per imatge), per als llistats grans.
+    - is_loaded(uuid) indica si ja s'han llegit les metadades de la imatge
+      (les dimensions només es coneixen després de llegir-les).
+    - subscribe(callback) registra un observador que rep cada canvi com a
+      callback(event, uuid, old, new), amb event "add", "remove" o "update"
+      i old/new diccionaris amb només els camps que han canviat.
 """
 import cfg
 import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from ColumnStore import ColumnStore
+from MetadataCache import MetadataCache
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Límit de mida d'un chunk de text descomprimit (protecció contra zip bombs)
+MAX_TEXT_CHUNK = 1024 * 1024
+
+
+def _inflate(data: bytes) -> bytes:
+    """Descomprimeix un valor de text. ValueError si supera MAX_TEXT_CHUNK o està incomplet."""
+    decompressor = zlib.decompressobj()
+    value = decompressor.decompress(data, MAX_TEXT_CHUNK)
+    if decompressor.unconsumed_tail or not decompressor.eof:
+        # Mai un valor truncat: el chunk es descarta
+        raise ValueError("Chunk de text massa gran o incomplet")
+    return value
+
+
+def _decode_text_chunk(ctype: bytes, data: bytes):
+    """Retorna (clau, valor) d'un chunk tEXt/zTXt/iTXt, o None si és invàlid."""
+    try:
+        key, rest = data.split(b"\0", 1)
+        if ctype == b"tEXt":
+            value = rest.decode("latin-1")
+        elif ctype == b"zTXt":
+            # rest[0] és el mètode de compressió (sempre 0 = zlib)
+            value = _inflate(rest[1:]).decode("latin-1")
+        else:
+            compressed = rest[0]
+            lang, translated, value = rest[2:].split(b"\0", 2)
+            if compressed:
+                value = _inflate(value)
+            value = value.decode("utf-8")
+    except (ValueError, IndexError, zlib.error):
+        return None
+    return key.decode("latin-1"), value
+
+
+def read_png_header(path: str):
+    """
+    Llegeix les metadades de text i les dimensions d'un PNG en una sola
+    passada. Retorna (metadata, (width, height)).
+    Llença ValueError si l'arxiu no és un PNG vàlid.
+    """
+    metadata = {}
+    dimensions = None
+    with open(path, 'rb') as f:
+        if f.read(8) != PNG_SIGNATURE:
+            raise ValueError(f"No és un arxiu PNG: {path}")
+        while True:
+            head = f.read(8)
+            if len(head) < 8:
+                break
+            length, ctype = struct.unpack(">I4s", head)
+            if ctype == b"IDAT" or ctype == b"IEND":
+                break
+            if ctype == b"IHDR":
+                data = f.read(length)
+                if len(data) < 8:
+                    raise ValueError(f"IHDR truncat: {path}")
+                dimensions = struct.unpack(">II", data[:8])
+            elif ctype in (b"tEXt", b"zTXt", b"iTXt"):
+                item = _decode_text_chunk(ctype, f.read(length))
+                if item is not None:
+                    metadata[item[0]] = item[1]
+            else:
+                f.seek(length, 1)
+            f.seek(4, 1)  # CRC
+    if dimensions is None:
+        raise ValueError(f"PNG sense IHDR: {path}")
+    return metadata, dimensions
+
+
+def _read_png_file(full_path: str):
+    """
+    Retorna (metadata, (width, height)) d'un arxiu. És una funció de mòdul
+    perquè es pugui enviar a un ProcessPoolExecutor.
+    """
+    try:
+        return read_png_header(full_path)
+    except ValueError:
+        # Format que el lector de chunks no entén: ho deixem a PIL
+        return cfg.read_png_metadata(full_path), cfg.get_png_dimensions(full_path)
+
 
 class ImageData:
-    def __init__(self):
-        self.database = {}
+    def __init__(self, cache_file: str = None, columnar: bool = False):
+        # Amb columnar=True, database és un ColumnStore amb la mateixa
+        # interfície que el diccionari {uuid: {camp: valor}}
+        self.database = ColumnStore() if columnar else {}
         self.key_map = {
             "Prompt": "prompt", "Seed": "seed", "CFG_Scale": "cfg_scale",
             "Steps": "steps", "Sampler": "sampler", "Model": "model",
             "Generated": "generated", "Created_Date": "created_date"
         }
+        self._cache = MetadataCache(cache_file) if cache_file else None
+        self._observers = []
+
+    def subscribe(self, callback) -> None:
+        """
+        Registra callback(event, uuid, old, new) per a cada canvi:
+            - "add":    old = {},  new = camps inicials de la imatge
+            - "remove": old = camps amb valor, new = {}
+            - "update": old/new = només els camps que han canviat
+        """
+        if callback not in self._observers:
+            self._observers.append(callback)
+
+    def unsubscribe(self, callback) -> None:
+        if callback in self._observers:
+            self._observers.remove(callback)
+
+    def _notify(self, event: str, uuid: str, old: dict, new: dict) -> None:
+        for callback in self._observers:
+            callback(event, uuid, old, new)
 
     def add_image(self, uuid: str, file: str) -> None:
         if uuid not in self.database:
             self.database[uuid] = {"file_path": file}
             for key in self.key_map.values():
                 self.database[uuid][key] = None
+            if self._observers:
+                self._notify("add", uuid, {}, {"file_path": file})
+
+    def remove_image(self, uuid: str) -> None:
+        entry = self.database.pop(uuid, None)
+        if entry is not None and self._observers:
+            old = {key: value for key, value in entry.items() if value is not None}
+            self._notify("remove", uuid, old, {})
+
+    def _full_path(self, entry: dict) -> str:
+        # El file_path ara és només el nom (ex: "imatge.png")
+        # El busquem directament dins del root definit per l'autograder
+        return os.path.join(cfg.get_root(), entry["file_path"])
+
+    def _store_metadata(self, uuid: str, entry: dict, png_metadata: dict, w: int, h: int) -> None:
+        values = {"width": w, "height": h}
+        if png_metadata:
+            for png_key, db_key in self.key_map.items():
+                val = png_metadata.get(png_key)
+                values[db_key] = str(val) if val is not None else None
+
+        old, new = {}, {}
+        for key, value in values.items():
+            previous = entry.get(key)
+            if previous != value:
+                old[key], new[key] = previous, value
+                entry[key] = value
+        if new and self._observers:
+            self._notify("update", uuid, old, new)
+
+    def _from_cache(self, uuid: str, entry: dict, full_path: str):
+        """
+        Intenta servir les metadades des de la cau. Retorna la clau de cau
+        (mida, mtime_ns) si cal llegir el PNG, o None si ja s'han servit.
+        """
+        st = os.stat(full_path)
+        cached = self._cache.get(entry["file_path"], st.st_size, st.st_mtime_ns)
+        if cached is None:
+            return st.st_size, st.st_mtime_ns
+        png_metadata, (w, h) = cached
+        self._store_metadata(uuid, entry, png_metadata, w, h)
+        return None
+
+    def _to_cache(self, entry: dict, cache_key: tuple, png_metadata: dict, w: int, h: int) -> None:
+        # Només guardem els camps que fa servir key_map
+        fields = {key: png_metadata[key] for key in self.key_map if key in png_metadata} if png_metadata else {}
+        self._cache.put(entry["file_path"], cache_key[0], cache_key[1], fields, (w, h))
 
     def load_metadata(self, uuid: str) -> None:
         if uuid not in self.database: return
         entry = self.database[uuid]
-        
-        # El file_path ara és només el nom (ex: "imatge.png")
-        # El busquem directament dins del root definit per l'autograder
-        full_path = os.path.join(cfg.get_root(), entry["file_path"])
 
         try:
-            png_metadata = cfg.read_png_metadata(full_path)
-            if png_metadata:
-                for png_key, db_key in self.key_map.items():
-                    val = png_metadata.get(png_key)
-                    entry[db_key] = str(val) if val is not None else None
-            
-            w, h = cfg.get_png_dimensions(full_path)
-            entry["width"], entry["height"] = w, h
-        except: pass
+            full_path = self._full_path(entry)
+            cache_key = None
+            if self._cache is not None:
+                cache_key = self._from_cache(uuid, entry, full_path)
+                if cache_key is None:
+                    return
+            png_metadata, (w, h) = _read_png_file(full_path)
+            self._store_metadata(uuid, entry, png_metadata, w, h)
+            if cache_key is not None:
+                self._to_cache(entry, cache_key, png_metadata, w, h)
+        except Exception: pass
+
+    def load_metadata_many(self, uuids, workers: int = 8, window: int = None,
+                           use_processes: bool = False) -> dict:
+        """
+        Carrega les metadades de molts UUID repartint les lectures en un pool
+        de fils (o de processos amb use_processes=True). Com a màxim hi ha
+        'window' lectures en curs (per defecte 4 * workers) i els resultats
+        s'escriuen a la base de dades a mesura que acaben, des del fil que
+        crida el mètode.
+        Retorna un diccionari {uuid: missatge d'error} amb els que han fallat.
+        """
+        failures = {}
+        window = window or workers * 4
+        in_flight = {}
+
+        def collect(done):
+            for future in done:
+                uuid, cache_key = in_flight.pop(future)
+                entry = self.database.get(uuid)
+                try:
+                    png_metadata, (w, h) = future.result()
+                except Exception as e:
+                    failures[uuid] = f"{type(e).__name__}: {e}"
+                    continue
+                if entry is not None:
+                    self._store_metadata(uuid, entry, png_metadata, w, h)
+                    if cache_key is not None:
+                        self._to_cache(entry, cache_key, png_metadata, w, h)
+
+        executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        with executor_class(max_workers=workers) as pool:
+            for uuid in uuids:
+                entry = self.database.get(uuid)
+                if entry is None:
+                    failures[uuid] = "UUID no registrat"
+                    continue
+                full_path = self._full_path(entry)
+                cache_key = None
+                if self._cache is not None:
+                    try:
+                        cache_key = self._from_cache(uuid, entry, full_path)
+                    except OSError as e:
+                        failures[uuid] = f"{type(e).__name__}: {e}"
+                        continue
+                    if cache_key is None:
+                        continue
+                if len(in_flight) >= window:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                in_flight[pool.submit(_read_png_file, full_path)] = (uuid, cache_key)
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+        if self._cache is not None:
+            self._cache.flush()
+        return failures
+
+    def flush_cache(self) -> None:
+        """Escriu a disc les entrades pendents de la memòria cau."""
+        if self._cache is not None:
+            self._cache.flush()
+
+    def load_all(self, workers: int = 8, use_processes: bool = False) -> dict:
+        """Carrega les metadades de totes les imatges (veure load_metadata_many)."""
+        return self.load_metadata_many(self.get_all_uuids(), workers=workers,
+                                       use_processes=use_processes)
+
+    def is_loaded(self, uuid: str) -> bool:
+        return self.database.get(uuid, {}).get("width") is not None
+
+    def get_rows(self, uuids, fields) -> list:
+        """
+        Retorna, per a cada UUID, una tupla amb els valors dels camps
+        'fields' (None si l'UUID no existeix), en una sola passada.
+        """
+        if isinstance(self.database, ColumnStore):
+            return self.database.rows(uuids, fields)
+        rows = []
+        for uuid in uuids:
+            entry = self.database.get(uuid)
+            rows.append(None if entry is None else tuple(map(entry.get, fields)))
+        return rows
 
     def get_prompt(self, uuid: str): 
         return self.database.get(uuid, {}).get("prompt")
@@ -112,9 +368,19 @@ class ImageData:
     def get_sampler(self, uuid: str): 
         return self.database.get(uuid, {}).get("sampler")
     
+    def get_generated(self, uuid: str): 
+        return self.database.get(uuid, {}).get("generated")
+    
     def get_created_date(self, uuid: str): 
         return self.database.get(uuid, {}).get("created_date")
     
+    def get_dimensions(self, uuid: str): 
+        entry = self.database.get(uuid, {})
+        return entry.get("width"), entry.get("height")
+    
+    def get_file_path(self, uuid: str): 
+        return self.database.get(uuid, {}).get("file_path")
+    
     def get_all_uuids(self): 
         return list(self.database.keys())
     
@@ -22,20 +22,162 @@ Mètodes a implementar:
         Retorna una llista (de strings) amb els paths relatius dels arxius
         que s'han eliminat des de l'última crida a reload_fs().
 
+    - files_modified() -> list
+        Retorna una llista (de strings) amb els arxius que han canviat
+        (mida, mtime o inode) respecte de l'snapshot anterior. Només es
+        calcula en mode incremental.
+
 Notes:
     - Els paths han de ser sempre relatius a ROOT_DIR
     - Només considereu arxius amb extensió .png (case-insensitive)
     - Heu de recórrer tots els subdirectoris recursivament
+    - En mode incremental (reload_fs(path, incremental=True)) es guarda un
+      snapshot amb el mtime de cada directori i (mida, mtime, inode) de cada
+      PNG. Els directoris amb el mateix mtime no es tornen a llistar (només
+      es fa stat dels PNG que ja hi havia, per detectar-ne les modificacions).
+    - reload_fs(path, workers=N) reparteix el recorregut de directoris entre
+      N fils (combinable amb incremental=True).
+    - start_watch(path) / stop_watch() activen un mode de vigilància: un fil
+      escolta esdeveniments d'inotify (o fa polling si no n'hi ha) i manté
+      els canvis acumulats. Mentre està actiu, reload_fs() no recorre el disc:
+      només marca un punt de control per a files_added()/files_removed().
+      Un reload_fs() sobre un altre directori atura la vigilància (amb un
+      avís) i fa un escaneig normal d'aquell directori.
 """
+import ctypes
+import ctypes.util
+import errno
+import json
 import os
+import select
+import stat
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# Marge (ns) per considerar "dubtós" un directori modificat just abans de
+# l'últim escaneig: el mtime pot no haver canviat encara que el contingut sí.
+RACY_MARGIN_NS = 2 * 10**9
+
+# Constants de <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+WATCH_MASK = (IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_ONLYDIR)
+
+
+class _Inotify:
+    """Embolcall mínim (ctypes) sobre les crides inotify de la libc."""
+    _EVENT = struct.Struct("iIII")
 
-class ImageFiles:
     def __init__(self):
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            raise OSError("libc no disponible")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError("inotify no disponible")
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+
+    def add_watch(self, path: str) -> int:
+        """
+        Retorna el descriptor del watch, o None si el directori ja no hi és.
+        Llença OSError si el kernel no el pot afegir (p.ex. ENOSPC quan
+        s'arriba a max_user_watches).
+        """
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd >= 0:
+            return wd
+        err = ctypes.get_errno()
+        if err in (errno.ENOENT, errno.ENOTDIR):
+            return None
+        raise OSError(err, os.strerror(err), path)
+
+    def rm_watch(self, wd: int) -> None:
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout: float) -> list:
+        """Retorna una llista de (wd, mask, name) o [] si no n'arriba cap."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(buf):
+            wd, mask, _cookie, length = self._EVENT.unpack_from(buf, offset)
+            offset += self._EVENT.size
+            name = os.fsdecode(buf[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class ImageFiles:
+    def __init__(self, snapshot_file: str = None):
         self.current_files = set()
         self.previous_files = set()
+        self.modified_files = set()
+
+        # Snapshot per al mode incremental:
+        # {"root": str, "scan_ns": int,
+        #  "dirs": {dir_relatiu: {"mtime": ns, "dirs": [...], "files": {nom: [size, mtime_ns, ino]}}}}
+        self._snapshot_file = snapshot_file
+        self._snapshot = None
+
+        # Estat del mode vigilància (start_watch)
+        self._watch_thread = None
+        self._watch_stop = None
+        self._watch_lock = threading.Lock()
+        self._inotify = None
+        self._wd_to_dir = {}
+        # True si algun directori s'ha quedat sense watch: cal passar a polling
+        self._watch_failed = False
+        self._name_refs = {}
+        self._pending = (set(), set(), set())
+        self._checkpoint = (set(), set(), set())
+
+    def reload_fs(self, path: str, incremental: bool = False, workers: int = None) -> None:
+        if self._watch_thread is not None and os.path.abspath(path) != self._snapshot["root"]:
+            print(f"WARNING (ImageFiles): reload_fs('{path}') no és el directori vigilat "
+                  f"({self._snapshot['root']}): s'atura la vigilància.")
+            self.stop_watch()
+        if self._watch_thread is not None:
+            # Punt de control: el fil de vigilància ja manté l'estat al dia
+            with self._watch_lock:
+                self._checkpoint = self._pending
+                self._pending = (set(), set(), set())
+                self.modified_files = self._checkpoint[2]
+            return
 
-    def reload_fs(self, path: str) -> None:
         self.previous_files = self.current_files.copy()
+        if incremental:
+            self._reload_incremental(path, workers)
+            return
+
+        self.modified_files = set()
+        if workers and workers > 1:
+            new_dirs, _ = self._walk_tree(os.path.abspath(path), {}, 0, workers, stat_files=False)
+            self.current_files = self._files_in(new_dirs)
+            return
+
         new_files_set = set()
         
         # Recorrem el directori
@@ -48,11 +190,456 @@ class ImageFiles:
 
         self.current_files = new_files_set
 
+    def _reload_incremental(self, path: str, workers: int = None) -> None:
+        """
+        Escaneig incremental amb os.scandir a partir de l'snapshot anterior.
+        Un directori amb el mateix mtime conserva el llistat guardat (no es
+        fa readdir, només stat dels PNG coneguts, ja que reescriure un arxiu
+        no canvia el mtime del directori), però sempre es baixa als seus
+        subdirectoris, ja que el mtime d'un directori no reflecteix canvis
+        més avall de l'arbre.
+        """
+        root = os.path.abspath(path)
+        old = self._load_snapshot()
+        if old is None or old.get("root") != root:
+            old = {"root": root, "scan_ns": 0, "dirs": {}}
+        racy_ns = old["scan_ns"] - RACY_MARGIN_NS
+
+        scan_ns = time.time_ns()
+        new_dirs, modified = self._walk_tree(root, old["dirs"], racy_ns, workers)
+
+        self._snapshot = {"root": root, "scan_ns": scan_ns, "dirs": new_dirs}
+        self._save_snapshot()
+
+        self.current_files = self._files_in(new_dirs)
+        self.modified_files = modified
+
+    def _walk_tree(self, root: str, old_dirs: dict, racy_ns: int,
+                   workers: int = None, stat_files: bool = True):
+        """
+        Recorre l'arbre des de 'root' i retorna (dirs, modified).
+        Amb workers > 1 cada directori és una tasca d'un ThreadPoolExecutor
+        i els subdirectoris es reparteixen entre els fils a mesura que es
+        descobreixen (útil en NFS, on el temps se'n va esperant readdir/stat).
+        El resultat no depèn de l'ordre en què acaben les tasques.
+        """
+        new_dirs = {}
+        modified = set()
+
+        def visit(rel_dir):
+            return rel_dir, self._scan_dir(root, rel_dir, old_dirs.get(rel_dir), racy_ns, stat_files)
+
+        if not workers or workers <= 1:
+            pending = [""]
+            while pending:
+                rel_dir, (record, changed) = visit(pending.pop())
+                if record is None:
+                    continue
+                new_dirs[rel_dir] = record
+                modified.update(changed)
+                pending.extend(self._subdirs(rel_dir, record))
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                running = {pool.submit(visit, "")}
+                while running:
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        rel_dir, (record, changed) = future.result()
+                        if record is None:
+                            continue
+                        new_dirs[rel_dir] = record
+                        modified.update(changed)
+                        for sub in self._subdirs(rel_dir, record):
+                            running.add(pool.submit(visit, sub))
+
+        return {rel_dir: new_dirs[rel_dir] for rel_dir in sorted(new_dirs)}, modified
+
+    def _subdirs(self, rel_dir: str, record: dict) -> list:
+        return [os.path.join(rel_dir, name) if rel_dir else name for name in record["dirs"]]
+
+    def _files_in(self, dirs: dict) -> set:
+        files = set()
+        for record in dirs.values():
+            files.update(record["files"])
+        return files
+
+    def _scan_dir(self, root: str, rel_dir: str, old: dict, racy_ns: int, stat_files: bool = True):
+        """
+        Retorna (registre, modificats) d'un directori. Si el mtime no ha
+        canviat (i no és dubtós) es reaprofita el registre antic; si no, es
+        torna a llistar i es retornen els PNG que han canviat.
+        El registre és None si el directori ja no es pot llegir.
+        """
+        full_dir = os.path.join(root, rel_dir) if rel_dir else root
+        try:
+            dir_mtime = os.stat(full_dir).st_mtime_ns
+        except OSError:
+            return None, []
+        if old is not None and old["mtime"] == dir_mtime and dir_mtime < racy_ns:
+            if not stat_files:
+                return old, []
+            # Reescriure un arxiu no canvia el mtime del directori: no cal
+            # llistar-lo, però sí fer stat de cada PNG conegut
+            record = {"mtime": dir_mtime, "dirs": old["dirs"], "files": {}}
+            changed = []
+            for name, info in old["files"].items():
+                new_info = self._stat_path(os.path.join(full_dir, name))
+                record["files"][name] = new_info
+                if new_info != info:
+                    changed.append(name)
+            return record, changed
+
+        record = {"mtime": dir_mtime, "dirs": [], "files": {}}
+        try:
+            with os.scandir(full_dir) as it:
+                for entry in it:
+                    # Mateix criteri que os.walk: els enllaços a directoris
+                    # no es recorren ni compten com a arxius
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        if not entry.is_symlink():
+                            record["dirs"].append(entry.name)
+                    elif entry.name.lower().endswith('.png'):
+                        record["files"][entry.name] = self._stat_entry(entry) if stat_files else None
+        except OSError:
+            return record, []
+
+        changed = []
+        if old is not None:
+            old_files = old["files"]
+            for name, info in record["files"].items():
+                if name in old_files and old_files[name] != info:
+                    changed.append(name)
+        return record, changed
+
+    def _stat_entry(self, entry) -> list:
+        try:
+            st = entry.stat()
+        except OSError:
+            # Enllaç trencat: os.walk també el llista com a arxiu
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                return None
+        return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+    def _stat_path(self, path: str) -> list:
+        """Com _stat_entry, per a un arxiu conegut d'un directori que no es llista."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            try:
+                st = os.lstat(path)
+            except OSError:
+                return None
+        return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+    def _load_snapshot(self):
+        if self._snapshot is None and self._snapshot_file and os.path.exists(self._snapshot_file):
+            try:
+                with open(self._snapshot_file, 'r', encoding='utf-8') as f:
+                    self._snapshot = json.load(f)
+            except (OSError, ValueError):
+                print(f"WARNING (ImageFiles): Snapshot invàlid, es fa un escaneig complet: {self._snapshot_file}")
+                self._snapshot = None
+        return self._snapshot
+
+    def _save_snapshot(self) -> None:
+        if not self._snapshot_file:
+            return
+        tmp_file = self._snapshot_file + ".tmp"
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self._snapshot, f, separators=(',', ':'))
+            os.replace(tmp_file, self._snapshot_file)
+        except OSError as e:
+            print(f"WARNING (ImageFiles): No s'ha pogut desar l'snapshot {self._snapshot_file}: {e}")
+
+    def start_watch(self, path: str, backend: str = "auto", poll_interval: float = 1.0,
+                    coalesce: float = 0.05, workers: int = None) -> None:
+        """
+        Activa el mode vigilància sobre 'path'. Fa un escaneig incremental
+        inicial i després un fil de fons aplica els canvis:
+            - backend "inotify": esdeveniments del kernel; cada canvi costa
+              un stat de l'entrada afectada. Les ràfegues d'esdeveniments
+              s'agrupen fins que passen 'coalesce' segons sense cap de nou.
+              Si la cua del kernel es desborda, es fa un únic reescaneig.
+              Els watches es posen després de l'escaneig inicial i tot seguit
+              es fa un reescaneig, que recull el que hagi canviat entremig.
+              Si no es pot posar algun watch (p.ex. s'ha arribat a
+              max_user_watches), es mostra un avís i es passa a polling.
+            - backend "poll": reescaneig incremental cada 'poll_interval' s.
+            - "auto": inotify si està disponible, si no polling.
+        """
+        if self._watch_thread is not None:
+            self.stop_watch()
+
+        self.reload_fs(path, incremental=True, workers=workers)
+        self._pending = (set(), set(), set())
+        self._checkpoint = (self.current_files - self.previous_files,
+                            self.previous_files - self.current_files,
+                            set(self.modified_files))
+        self._rebuild_name_refs()
+
+        self._inotify = None
+        if backend in ("auto", "inotify"):
+            try:
+                self._inotify = _Inotify()
+            except (OSError, AttributeError) as e:
+                if backend == "inotify":
+                    raise
+                print(f"WARNING (ImageFiles): inotify no disponible ({e}), es fa servir polling.")
+
+        self._watch_stop = threading.Event()
+        self._watch_failed = False
+        if self._inotify is not None:
+            self._wd_to_dir = {}
+            for rel_dir in list(self._snapshot["dirs"]):
+                self._add_watch(rel_dir)
+                if self._watch_failed:
+                    self._stop_inotify()
+                    break
+        if self._inotify is not None:
+            # Un arxiu creat entre l'escaneig i el seu watch no genera cap
+            # esdeveniment: un reescaneig amb els watches ja posats el recull
+            self._watch_resync(workers)
+        if self._inotify is not None and not self._watch_failed:
+            target, args = self._inotify_loop, (coalesce, poll_interval, workers)
+        else:
+            self._stop_inotify()
+            target, args = self._poll_loop, (poll_interval, workers)
+        self._watch_thread = threading.Thread(target=target, args=args,
+                                              name="ImageFiles-watch", daemon=True)
+        self._watch_thread.start()
+
+    def stop_watch(self) -> None:
+        """Atura el fil de vigilància i desa l'snapshot."""
+        if self._watch_thread is None:
+            return
+        self._watch_stop.set()
+        self._watch_thread.join()
+        self._watch_thread = None
+        self._stop_inotify()
+        self._save_snapshot()
+
+        # Deixem previous_files coherent amb l'últim punt de control
+        added, removed, _ = self._checkpoint
+        self.previous_files = (self.current_files - added) | removed
+
+    def _stop_inotify(self) -> None:
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+            self._wd_to_dir = {}
+
+    def _poll_loop(self, interval: float, workers: int) -> None:
+        while not self._watch_stop.wait(interval):
+            self._watch_resync(workers)
+
+    def _inotify_loop(self, coalesce: float, poll_interval: float, workers: int) -> None:
+        max_delay = max(coalesce * 20, 1.0)
+        while not self._watch_stop.is_set():
+            if self._watch_failed:
+                # Un directori nou s'ha quedat sense watch: a partir d'ara
+                # polling, amb un reescaneig immediat per no perdre res
+                self._stop_inotify()
+                self._watch_resync(workers)
+                self._poll_loop(poll_interval, workers)
+                return
+            batch = self._inotify.read(0.2)
+            if not batch:
+                continue
+            # Agrupem la ràfega: esperem fins que hi hagi una pausa
+            deadline = time.monotonic() + max_delay
+            while time.monotonic() < deadline:
+                more = self._inotify.read(coalesce)
+                if not more:
+                    break
+                batch.extend(more)
+            self._apply_events(batch, workers)
+
+    def _apply_events(self, batch: list, workers: int) -> None:
+        dirty = {}
+        for wd, mask, name in batch:
+            if mask & IN_Q_OVERFLOW:
+                self._watch_resync(workers)
+                return
+            if mask & IN_IGNORED:
+                self._wd_to_dir.pop(wd, None)
+                continue
+            rel_dir = self._wd_to_dir.get(wd)
+            if rel_dir is not None and name:
+                dirty[(rel_dir, name)] = None
+
+        with self._watch_lock:
+            for rel_dir, name in dirty:
+                self._reconcile_entry(rel_dir, name)
+
+    def _reconcile_entry(self, rel_dir: str, name: str) -> None:
+        """
+        Posa al dia una sola entrada segons l'estat actual del disc. És
+        idempotent, de manera que l'ordre i els duplicats dels esdeveniments
+        agrupats no importen.
+        """
+        record = self._snapshot["dirs"].get(rel_dir)
+        if record is None:
+            return
+        rel = os.path.join(rel_dir, name) if rel_dir else name
+        full = os.path.join(self._snapshot["root"], rel)
+        try:
+            st = os.lstat(full)
+        except OSError:
+            st = None
+        is_dir = st is not None and stat.S_ISDIR(st.st_mode)
+
+        if name in record["dirs"] and not is_dir:
+            record["dirs"].remove(name)
+            self._drop_subtree(rel)
+        if is_dir:
+            if name not in record["dirs"]:
+                record["dirs"].append(name)
+                self._add_subtree(rel)
+            return
+        if not name.lower().endswith('.png'):
+            return
+        if st is not None and stat.S_ISLNK(st.st_mode) and os.path.isdir(full):
+            st = None  # Enllaç a directori: os.walk no el compta com a arxiu
+
+        files = record["files"]
+        if st is None:
+            if name in files:
+                del files[name]
+                self._name_gone(name)
+            return
+        try:
+            target = os.stat(full)
+        except OSError:
+            target = st
+        info = [target.st_size, target.st_mtime_ns, target.st_ino]
+        if name not in files:
+            files[name] = info
+            self._name_new(name)
+        elif files[name] != info:
+            files[name] = info
+            self._pending[2].add(name)
+
+    def _add_subtree(self, rel: str) -> None:
+        root = self._snapshot["root"]
+        dirs = self._snapshot["dirs"]
+        pending = [rel]
+        while pending:
+            rel_dir = pending.pop()
+            # El watch es posa abans de llistar per no perdre entrades noves
+            self._add_watch(rel_dir)
+            record, _ = self._scan_dir(root, rel_dir, None, 0)
+            if record is None:
+                continue
+            dirs[rel_dir] = record
+            for name in record["files"]:
+                self._name_new(name)
+            pending.extend(self._subdirs(rel_dir, record))
+
+    def _drop_subtree(self, rel: str) -> None:
+        dirs = self._snapshot["dirs"]
+        prefix = rel + os.sep
+        for rel_dir in [d for d in dirs if d == rel or d.startswith(prefix)]:
+            for name in dirs.pop(rel_dir)["files"]:
+                self._name_gone(name)
+        for wd in [wd for wd, d in self._wd_to_dir.items() if d == rel or d.startswith(prefix)]:
+            del self._wd_to_dir[wd]
+
+    def _add_watch(self, rel_dir: str) -> None:
+        if self._inotify is None or self._watch_failed:
+            return
+        full = os.path.join(self._snapshot["root"], rel_dir) if rel_dir else self._snapshot["root"]
+        try:
+            wd = self._inotify.add_watch(full)
+        except OSError as e:
+            print(f"WARNING (ImageFiles): No s'ha pogut vigilar {full} ({e}); "
+                  f"es passa a polling.")
+            self._watch_failed = True
+            return
+        if wd is not None:
+            self._wd_to_dir[wd] = rel_dir
+
+    def _name_new(self, name: str) -> None:
+        # Diversos directoris poden tenir el mateix nom d'arxiu: només
+        # comptem l'alta quan apareix la primera còpia
+        count = self._name_refs.get(name, 0) + 1
+        self._name_refs[name] = count
+        if count == 1:
+            self.current_files.add(name)
+            added, removed, _ = self._pending
+            if name in removed:
+                removed.discard(name)
+            else:
+                added.add(name)
+
+    def _name_gone(self, name: str) -> None:
+        count = self._name_refs.get(name, 0) - 1
+        if count > 0:
+            self._name_refs[name] = count
+            return
+        self._name_refs.pop(name, None)
+        self.current_files.discard(name)
+        added, removed, modified = self._pending
+        modified.discard(name)
+        if name in added:
+            added.discard(name)
+        else:
+            removed.add(name)
+
+    def _rebuild_name_refs(self) -> None:
+        refs = {}
+        for record in self._snapshot["dirs"].values():
+            for name in record["files"]:
+                refs[name] = refs.get(name, 0) + 1
+        self._name_refs = refs
+
+    def _watch_resync(self, workers: int = None) -> None:
+        """Reescaneig incremental complet (polling o desbordament d'inotify)."""
+        old = self._snapshot
+        scan_ns = time.time_ns()
+        new_dirs, modified = self._walk_tree(old["root"], old["dirs"],
+                                             old["scan_ns"] - RACY_MARGIN_NS, workers)
+        new_files = self._files_in(new_dirs)
+        with self._watch_lock:
+            self._snapshot = {"root": old["root"], "scan_ns": scan_ns, "dirs": new_dirs}
+            for name in new_files - self.current_files:
+                self._name_refs[name] = 0
+                self._name_new(name)
+            for name in self.current_files - new_files:
+                self._name_refs[name] = 1
+                self._name_gone(name)
+            self._rebuild_name_refs()
+            self._pending[2].update(modified)
+            if self._inotify is not None:
+                for rel_dir in new_dirs:
+                    self._add_watch(rel_dir)
+                # Els directoris nous s'han llistat abans de tenir watch: es
+                # tornen a llistar (ja vigilats) per recollir el que hi hagi
+                # aparegut entremig
+                for rel_dir in new_dirs.keys() - old["dirs"].keys():
+                    record, _ = self._scan_dir(old["root"], rel_dir, None, 0)
+                    if record is not None:
+                        for name in record["dirs"] + list(record["files"]):
+                            self._reconcile_entry(rel_dir, name)
+
     def files_added(self) -> list:
+        if self._watch_thread is not None:
+            return list(self._checkpoint[0])
         return list(self.current_files - self.previous_files)
 
     def files_removed(self) -> list:
+        if self._watch_thread is not None:
+            return list(self._checkpoint[1])
         return list(self.previous_files - self.current_files)
 
+    def files_modified(self) -> list:
+        return list(self.modified_files)
+
     def __len__(self) -> int:
-        return len(self.current_files))
+        return len(self.current_files)
@@ -27,10 +27,19 @@ Mètodes a implementar:
         - UUID
         - Path de l'arxiu
 
+    - print_images(uuids, format: str = "table", out=None) -> None
+        Imprimeix les metadades de moltes imatges, una línia per imatge,
+        en format "table" (columnes alineades), "csv" o "jsonl" (un objecte
+        JSON per línia). Escriu a 'out' (per defecte sys.stdout).
+
     - show_file(file: str) -> None
         Mostra la imatge especificada utilitzant PIL.
         Aquesta funció NO espera que la imatge es tanqui (asíncrona).
 
+    - show_images(uuids, mode: int = None, prefetch: int = PREFETCH) -> None
+        Mostra les imatges una darrera l'altra (com show_image). Mentre se'n
+        mostra una, les 'prefetch' següents es descodifiquen en segon pla.
+
     - show_image(uuid: str, mode: int) -> None
         Combina print_image() i show_file() segons el mode especificat:
         - mode 0: només metadades
@@ -45,6 +54,12 @@ Notes:
     - Per mostrar imatges: img.show() de PIL
     - Gestioneu les excepcions si la imatge no es pot mostrar
     - El format de sortida ha de ser llegible i ben organitzat
+    - Si es passa una ThumbnailCache, show_file mostra la miniatura desada
+      (descodificada un sol cop) en lloc del PNG original. Els encerts i
+      temps de descodificació es consulten amb thumbnails.stats().
+    - print_images obté tots els camps d'un sol cop (ImageData.get_rows) i
+      escriu la sortida en blocs de PRINT_BLOCK línies, en lloc de fer una
+      crida a print() i una consulta per camp i imatge.
 """
 
 # -*- coding: utf-8 -*-
@@ -53,19 +68,37 @@ ImageViewer.py : ** REQUIRED ** El vostre codi de la classe ImageViewer.
 """
 
 import cfg
+import csv
+import io
+import json
 import os.path
+import sys
 from PIL import Image
 from ImageID import ImageID
 from ImageData import ImageData
+from ThumbnailCache import ThumbnailCache
+
+# Imatges següents que show_images descodifica per avançat
+PREFETCH = 4
+# Línies per cada escriptura de print_images
+PRINT_BLOCK = 4096
+# Camps de print_images, en ordre de sortida (noms de la base de dades d'ImageData)
+PRINT_FIELDS = ("width", "height", "model", "seed", "cfg_scale", "steps", "sampler",
+                "generated", "created_date", "file_path", "prompt")
+# Columnes del format "table": (títol, amplada)
+TABLE_COLUMNS = (("UUID", 36), ("Dimensions", 11), ("Model", 20), ("Seed", 12),
+                 ("CFG", 5), ("Steps", 5), ("Sampler", 16), ("Generated", 9),
+                 ("Created", 10), ("Arxiu", 40), ("Prompt", 0))
 
 class ImageViewer:
 
     # 1. Constructor
-    def __init__(self, image_data: ImageData):
+    def __init__(self, image_data: ImageData, thumbnails: ThumbnailCache = None):
         """
         Inicialitza la classe amb les dependències necessàries.
         """
         self._image_data = image_data
+        self._thumbnails = thumbnails
 
     # Mètodes Màgics Obligatoris
     def __len__(self) -> int:
@@ -126,6 +159,52 @@ class ImageViewer:
         print("="*50)
 
 
+    def print_images(self, uuids, format: str = "table", out=None) -> None:
+        """
+        Imprimeix les metadades de totes les imatges en una sola passada.
+        Els UUID que no existeixen surten amb tots els camps buits.
+        """
+        if format not in ("table", "csv", "jsonl"):
+            print(f"ERROR: Format de sortida desconegut: {format} (table, csv o jsonl)")
+            return
+        out = out if out is not None else sys.stdout
+        uuids = list(uuids)
+        empty = (None,) * len(PRINT_FIELDS)
+
+        buffer = io.StringIO()
+        if format == "csv":
+            writer = csv.writer(buffer, lineterminator="\n")
+            writer.writerow(("uuid",) + PRINT_FIELDS)
+            write_row = lambda uuid, values: writer.writerow((uuid,) + values)
+        elif format == "jsonl":
+            encode = json.JSONEncoder(ensure_ascii=False).encode
+            names = ("uuid",) + PRINT_FIELDS
+            write_row = lambda uuid, values: buffer.write(encode(dict(zip(names, (uuid,) + values))) + "\n")
+        else:
+            line = "  ".join(f"{{:<{width}}}" if width else "{}" for _, width in TABLE_COLUMNS) + "\n"
+            buffer.write(line.format(*(title for title, _ in TABLE_COLUMNS)))
+            buffer.write("  ".join("-" * (width or 6) for _, width in TABLE_COLUMNS) + "\n")
+
+            def write_row(uuid, values):
+                width, height, model, seed, cfg_scale, steps, sampler, generated, created_date, file_path, prompt = \
+                    ("N/A" if value is None else value for value in values)
+                # Mateix truncament del prompt que print_image
+                if len(prompt) > 100:
+                    prompt = prompt[:100] + "..."
+                dimensions = f"{width}x{height}" if values[0] is not None else "N/A"
+                buffer.write(line.format(uuid, dimensions, model, seed, cfg_scale, steps, sampler,
+                                         generated, created_date, file_path, prompt))
+
+        for start in range(0, len(uuids), PRINT_BLOCK):
+            block = uuids[start:start + PRINT_BLOCK]
+            for uuid, values in zip(block, self._image_data.get_rows(block, PRINT_FIELDS)):
+                write_row(uuid, values if values is not None else empty)
+            out.write(buffer.getvalue())
+            buffer.seek(0)
+            buffer.truncate()
+        out.write(buffer.getvalue())
+        out.flush()
+
     def show_file(self, file: str) -> None:
         """
         Mostra la imatge especificada utilitzant PIL.
@@ -138,6 +217,10 @@ class ImageViewer:
              return
              
         print(f"\n[Image Viewer] Mostrant imatge: {full_path}")
+        if self._thumbnails is not None:
+            thumbnail = self._thumbnails.get(full_path)
+            if thumbnail is not None:
+                full_path = thumbnail
         try:
             img = Image.open(full_path)
             img.show()
@@ -146,6 +229,32 @@ class ImageViewer:
             print("Potser necessiteu instal·lar un visualitzador d'imatges o configurar PIL.")
 
     
+    def prefetch(self, uuids) -> int:
+        """
+        Encarrega a la ThumbnailCache la descodificació en segon pla de les
+        imatges indicades. Retorna quantes se n'han encarregat.
+        """
+        if self._thumbnails is None:
+            return 0
+        root = cfg.get_root()
+        files = []
+        for uuid in uuids:
+            file_path = self._image_data.get_file_path(uuid)
+            if isinstance(file_path, str):
+                files.append(os.path.join(root, file_path))
+        return self._thumbnails.prefetch(files)
+
+    def show_images(self, uuids, mode: int = None, prefetch: int = PREFETCH) -> None:
+        """
+        Mostra les imatges en ordre amb show_image(). Abans de mostrar-ne
+        cadascuna, es descodifiquen en segon pla les 'prefetch' següents.
+        """
+        uuids = list(uuids)
+        for i, uuid in enumerate(uuids):
+            if prefetch > 0:
+                self.prefetch(uuids[i + 1:i + 1 + prefetch])
+            self.show_image(uuid, mode)
+
     def show_image(self, uuid: str, mode: int = None) -> None:
         """
         Combina la impressió de metadades i la visualització de l'arxiu
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+JsonStream.py : Lectura incremental d'arxius JSON grans.
+
+json.load() construeix tot el document en memòria abans de retornar res.
+Aquí l'arxiu es llegeix a blocs i cada membre de l'objecte arrel es genera
+tan bon punt s'ha descodificat. Els membres indicats a 'streamed' (si són
+objectes o llistes) es recorren element a element, de manera que només hi
+ha un element descodificat alhora.
+
+Funcions:
+    - iter_members(f, streamed=(), chunk_size=CHUNK_SIZE)
+        Genera parelles (path, valor) a partir d'un arxiu obert en mode text:
+            ("gallery_name",)   -> "Cyberpunk Cities"
+            ("vectors", "img0") -> {"image_embedding": [...]}  (objecte a 'streamed')
+            ("images", 0)       -> "generated_images/city.png" (llista a 'streamed')
+        Llença json.JSONDecodeError si el document no és vàlid.
+
+Notes:
+    - Cada valor es descodifica amb l'escàner de json.JSONDecoder (en C). Si
+      el valor no cap al bloc llegit, es llegeix més i es torna a provar
+      (llegint cada cop tant com ja hi ha al buffer, cost lineal).
+"""
+import json
+import re
+
+CHUNK_SIZE = 1 << 16
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_SEPARATOR = re.compile(r"[ \t\n\r]*,[ \t\n\r]*")
+_NUMBER_TAIL = "0123456789.eE+-"
+_decoder = json.JSONDecoder()
+
+
+def _complete(buffer: str, end: int) -> bool:
+    """Fals si el valor que acaba a 'end' podria continuar al bloc següent (un número)."""
+    return end < len(buffer) and buffer[end] not in _NUMBER_TAIL
+
+
+class _Reader:
+    def __init__(self, f, chunk_size: int):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def error(self, message: str) -> json.JSONDecodeError:
+        return json.JSONDecodeError(message, self.buffer, self.pos)
+
+    def fill(self) -> bool:
+        """Afegeix dades al buffer (descartant les ja consumides). False al final."""
+        if self.eof:
+            return False
+        pending = len(self.buffer) - self.pos
+        chunk = self.f.read(max(self.chunk_size, pending))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Següent caràcter que no és espai (sense consumir-lo), o "" al final."""
+        while True:
+            pos = self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if pos < len(self.buffer):
+                return self.buffer[pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise self.error(f"Expecting '{char}'")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.scan_once(self.buffer, self.pos)
+            except (StopIteration, json.JSONDecodeError):
+                if not self.fill():
+                    # raw_decode dona el missatge d'error complet
+                    _decoder.raw_decode(self.buffer, self.pos)
+                    raise self.error("Expecting value")
+                continue
+            if _complete(self.buffer, end) or not self.fill():
+                self.pos = end
+                return value
+
+    def key(self) -> str:
+        if self.peek() != '"':
+            raise self.error("Expecting property name enclosed in double quotes")
+        key = self.value()
+        self.expect(":")
+        return key
+
+
+def _iter_array(reader: _Reader, path: tuple):
+    scan_once, separator = _decoder.scan_once, _SEPARATOR.match
+    index = 0
+    while True:
+        yield path + (index,), reader.value()
+        index += 1
+        # Camí ràpid: els elements que ja són sencers al buffer es llegeixen
+        # directament (sense peek/value per element)
+        buffer = reader.buffer
+        match = separator(buffer, reader.pos)
+        while match is not None:
+            try:
+                value, end = scan_once(buffer, match.end())
+            except (StopIteration, json.JSONDecodeError):
+                break
+            if not _complete(buffer, end):
+                break
+            reader.pos = end
+            yield path + (index,), value
+            index += 1
+            match = separator(buffer, end)
+        if reader.peek() != ",":
+            break
+        reader.pos += 1
+    reader.expect("]")
+
+
+def _iter_container(reader: _Reader, path: tuple):
+    opening = reader.peek()
+    reader.pos += 1
+    if opening == "[":
+        if reader.peek() == "]":
+            reader.pos += 1
+        else:
+            yield from _iter_array(reader, path)
+        return
+    if reader.peek() == "}":
+        reader.pos += 1
+        return
+    while True:
+        key = reader.key()
+        yield path + (key,), reader.value()
+        if reader.peek() != ",":
+            break
+        reader.pos += 1
+    reader.expect("}")
+
+
+def iter_members(f, streamed=(), chunk_size: int = CHUNK_SIZE):
+    reader = _Reader(f, chunk_size)
+    reader.expect("{")
+    if reader.peek() == "}":
+        reader.pos += 1
+    else:
+        while True:
+            key = reader.key()
+            if key in streamed and reader.peek() in ("{", "["):
+                yield from _iter_container(reader, (key,))
+            else:
+                yield (key,), reader.value()
+            if reader.peek() != ",":
+                break
+            reader.pos += 1
+        reader.expect("}")
+    if reader.peek() != "":
+        raise reader.error("Extra data")
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+KnnGraph.py : Graf dels k veïns més propers entre embeddings, per a
+RecommenderSystem.find_transition_prompts().
+
+Cada imatge (fila de la matriu d'embeddings normalitzats) té una aresta cap
+als seus k veïns més similars. Per buscar camins el graf es fa servir com a
+no dirigit (cada aresta es pot recórrer en els dos sentits), amb pes igual a
+la distància angular arccos(similitud): és una mètrica, de manera que la
+distància angular directa fins a l'objectiu és una heurística admissible i
+consistent per a A*.
+
+Mètodes:
+    - update(matrix, uuids, has_vector) -> int
+        Construeix o actualitza el graf per a la matriu actual. Les files
+        es reconeixen pel seu UUID: només es recalculen les llistes de les
+        imatges noves i de les que han perdut algun veí, i les noves
+        s'afegeixen a les llistes de les existents. Retorna el nombre de
+        llistes recalculades.
+
+    - shortest_path(matrix, source, target, budget=None, blocked=None) -> list
+        Camí de files entre 'source' i 'target' (inclosos), sense passar per
+        les files de 'blocked'. Primer es busca
+        un camí ràpid (best-first voraç) i després A* bidireccional el
+        millora fins al camí més curt. Si s'esgota 'budget' (segons) es
+        retorna el millor camí trobat fins aleshores, o [] si no n'hi ha cap.
+
+    - save(path) / KnnGraph.load(path)
+        Desa / carrega el graf en format .npz (sense la matriu de vectors).
+
+Notes:
+    - Es considera que l'embedding d'un UUID no canvia; per tornar a
+      calcular-ho tot, update(..., full=True).
+    - Les files sense embedding no tenen veïns ni són veïnes de ningú.
+    - Perquè sempre hi hagi camí, els components connexos separats s'uneixen
+      amb arestes extra ('bridges'), que es recalculen a cada update().
+"""
+import heapq
+import math
+import time
+
+import numpy as np
+
+# Memòria màxima (bytes) d'un bloc de similituds en construir el graf
+BLOCK_MEMORY = 256 * 2**20
+# Bytes per puntuació d'un bloc: la similitud (float32), l'índex que
+# retorna argpartition (int64) i una màscara booleana
+SCORE_BYTES = 13
+
+
+class KnnGraph:
+    def __init__(self, k: int = 10):
+        self.k = k
+        self.uuids = []
+        self.neighbours = np.zeros((0, k), dtype=np.int64)   # -1 = sense veí
+        self.scores = np.zeros((0, k), dtype=np.float32)
+        # Arestes extra que uneixen components connexos separats (n x 2)
+        self.bridges = np.zeros((0, 2), dtype=np.int64)
+        self._adjacency = None
+
+    def __len__(self) -> int:
+        return len(self.uuids)
+
+    def __str__(self) -> str:
+        return f"KnnGraph ({len(self.uuids)} nodes, k={self.k})"
+
+    def _blocks(self, rows: np.ndarray, n: int):
+        size = max(1, int(BLOCK_MEMORY // (max(n, 1) * SCORE_BYTES)))
+        for start in range(0, len(rows), size):
+            yield rows[start:start + size]
+
+    def _top(self, scores: np.ndarray, columns: np.ndarray):
+        """
+        Les k millors (columna, similitud) de cada fila, de més a menys
+        similar. 'scores' es nega al mateix bloc (sense còpia).
+        """
+        k = min(self.k, scores.shape[1])
+        np.negative(scores, out=scores)
+        top = np.argpartition(scores, k - 1, axis=1)[:, :k].copy()
+        top_scores = -np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        neighbours = np.where(np.isfinite(top_scores), columns[top], -1)
+        return neighbours, top_scores
+
+    def _store(self, rows, neighbours, scores) -> None:
+        width = neighbours.shape[1]
+        self.neighbours[rows] = -1
+        self.scores[rows] = -np.inf
+        self.neighbours[rows, :width] = neighbours
+        self.scores[rows, :width] = scores
+
+    def update(self, matrix: np.ndarray, uuids: list, has_vector: np.ndarray, full: bool = False) -> int:
+        n = len(uuids)
+        old_rows = {} if full else {uuid: row for row, uuid in enumerate(self.uuids)}
+        previous = np.array([old_rows.get(uuid, -1) for uuid in uuids], dtype=np.int64)
+        if len(previous) == len(self.uuids) and np.array_equal(previous, np.arange(n)):
+            return 0
+        kept = np.flatnonzero(previous >= 0)
+
+        # Traduïm les llistes conservades a les files noves (l'última posició
+        # d'old_to_new és per als veïns -1)
+        old_to_new = np.full(len(self.uuids) + 1, -1, dtype=np.int64)
+        old_to_new[previous[kept]] = kept
+        neighbours = np.full((n, self.k), -1, dtype=np.int64)
+        scores = np.full((n, self.k), -np.inf, dtype=np.float32)
+        neighbours[kept] = old_to_new[self.neighbours[previous[kept]]]
+        scores[kept] = self.scores[previous[kept]]
+        # Una llista que ha perdut algun veí (o que és incompleta) es recalcula
+        lost = ((neighbours[kept] < 0) & (self.neighbours[previous[kept]] >= 0)).any(axis=1)
+
+        self.uuids = list(uuids)
+        self.neighbours = neighbours
+        self.scores = scores
+        self.bridges = np.zeros((0, 2), dtype=np.int64)
+        self._adjacency = None
+
+        valid = np.flatnonzero(has_vector)
+        new = np.flatnonzero((previous < 0) & has_vector)
+        dirty = np.union1d(new, kept[lost & has_vector[kept]])
+        clean = np.setdiff1d(valid, dirty)
+        if len(valid) < 2:
+            return 0
+
+        # Llistes noves o incompletes: cerca exacta contra totes les files
+        valid_matrix = matrix if len(valid) == n else matrix[valid]
+        for block in self._blocks(dirty, n):
+            block_scores = matrix[block] @ valid_matrix.T
+            block_scores[np.arange(len(block)), np.searchsorted(valid, block)] = -np.inf
+            self._store(block, *self._top(block_scores, valid))
+
+        # Llistes existents: només cal mirar si alguna imatge nova hi entra
+        if len(new) and len(clean):
+            for block in self._blocks(clean, len(new)):
+                candidate_scores = matrix[block] @ matrix[new].T
+                cand, cand_scores = self._top(candidate_scores, new)
+                merged = np.concatenate((self.neighbours[block], cand), axis=1)
+                merged_scores = np.concatenate((self.scores[block], cand_scores), axis=1)
+                top = np.argsort(-merged_scores, axis=1, kind="stable")[:, :self.k]
+                self.neighbours[block] = np.take_along_axis(merged, top, axis=1)
+                self.scores[block] = np.take_along_axis(merged_scores, top, axis=1)
+        self._connect(matrix, valid)
+        return len(dirty)
+
+    def _edges(self):
+        sources = np.repeat(np.arange(len(self.uuids)), self.k)
+        targets = self.neighbours.ravel()
+        mask = targets >= 0
+        return (np.concatenate((sources[mask], self.bridges[:, 0])),
+                np.concatenate((targets[mask], self.bridges[:, 1])))
+
+    def _components(self):
+        """Etiqueta de component connex de cada fila (la fila més baixa del component)."""
+        a, b = self._edges()
+        sources = np.concatenate((a, b))
+        order = np.argsort(sources, kind="stable")
+        targets = np.concatenate((b, a))[order]
+        nodes, starts = np.unique(sources[order], return_index=True)
+        labels = np.arange(len(self.uuids))
+        while True:
+            # Cada fila pren l'etiqueta mínima dels seus veïns (i salta punters)
+            new = labels.copy()
+            if len(nodes):
+                new[nodes] = np.minimum(labels[nodes], np.minimum.reduceat(labels[targets], starts))
+            new = new[new]
+            if np.array_equal(new, labels):
+                return labels
+            labels = new
+
+    def _connect(self, matrix: np.ndarray, valid: np.ndarray) -> None:
+        """
+        Un graf kNN sovint queda partit en grups (imatges d'estils molt
+        diferents). A cada ronda, cada component s'uneix amb la imatge més
+        propera al seu centroide de fora del component (com Borůvka), fins
+        que només en queda un.
+        """
+        while True:
+            labels = self._components()[valid]
+            components, members = np.unique(labels, return_inverse=True)
+            if len(components) <= 1:
+                break
+            centroids = np.zeros((len(components), matrix.shape[1]), dtype=np.float32)
+            np.add.at(centroids, members, matrix[valid])
+            groups = np.split(valid[np.argsort(members, kind="stable")],
+                              np.cumsum(np.bincount(members))[:-1])
+            bridges = []
+            for block in self._blocks(np.arange(len(components)), len(valid)):
+                block_scores = centroids[block] @ matrix[valid].T
+                block_scores[members[None, :] == block[:, None]] = -np.inf
+                outside = valid[np.argmax(block_scores, axis=1)]
+                for component, v in zip(block.tolist(), outside.tolist()):
+                    inside = groups[component]
+                    bridges.append((inside[np.argmax(matrix[inside] @ matrix[v])], v))
+            self.bridges = np.concatenate((self.bridges, np.array(bridges, dtype=np.int64)))
+
+    def adjacency(self, matrix: np.ndarray):
+        """Graf no dirigit en format CSR: (offsets, veïns, pesos)."""
+        if self._adjacency is None:
+            n = len(self.uuids)
+            a, b = self._edges()
+            edges = np.unique(np.concatenate((a * n + b, b * n + a)))
+            sources, targets = edges // n, edges % n
+            offsets = np.concatenate(([0], np.cumsum(np.bincount(sources, minlength=n))))
+            weights = np.empty(len(edges), dtype=np.float64)
+            for start in range(0, len(edges), 65536):
+                block = slice(start, start + 65536)
+                similarity = np.einsum("ij,ij->i", matrix[sources[block]], matrix[targets[block]])
+                weights[block] = np.arccos(np.clip(similarity, -1.0, 1.0))
+            self._adjacency = (offsets, targets, weights)
+        return self._adjacency
+
+    def shortest_path(self, matrix: np.ndarray, source: int, target: int,
+                      budget: float = None, blocked=None) -> list:
+        if source == target:
+            return [source]
+        deadline = None if budget is None else time.perf_counter() + budget
+        offsets, adjacent, weights = self.adjacency(matrix)
+        # Distància angular de totes les files a l'objectiu i a l'origen (un
+        # sol producte matriu-vector en lloc d'un per node expandit)
+        ends = np.arccos(np.clip(matrix @ np.stack((matrix[target], matrix[source]), axis=1), -1.0, 1.0))
+        to_target = ends[:, 0].tolist()
+        to_source = ends[:, 1].tolist()
+
+        def expand(u):
+            """Veïns de 'u' amb el pes de l'aresta (distància angular)."""
+            edges = zip(adjacent[offsets[u]:offsets[u + 1]].tolist(),
+                        weights[offsets[u]:offsets[u + 1]].tolist())
+            if blocked:
+                return [(v, weight) for v, weight in edges if v not in blocked]
+            return edges
+
+        def out_of_time(steps):
+            return deadline is not None and steps % 16 == 0 and time.perf_counter() > deadline
+
+        # 1) Primer camí, ràpid però no òptim: best-first voraç cap a l'objectiu
+        parent = {source: None}
+        heap = [(to_target[source], source)]
+        steps = 0
+        while heap and target not in parent:
+            steps += 1
+            if out_of_time(steps):
+                return []
+            _, u = heapq.heappop(heap)
+            for v, _ in expand(u):
+                if v not in parent:
+                    parent[v] = u
+                    heapq.heappush(heap, (to_target[v], v))
+        if target not in parent:
+            return []
+        path = [target]
+        while parent[path[-1]] is not None:
+            path.append(parent[path[-1]])
+        path.reverse()
+
+        # 2) A* bidireccional amb el potencial mitjà p(v) = (d(v, target) - d(v, source)) / 2:
+        # amb pesos reduïts w(u, v) - p(u) + p(v) >= 0 les dues cerques són Dijkstra
+        # sobre el mateix graf i s'aturen quan min_f + min_r >= millor camí. Cada
+        # camí mesura (en pesos reduïts) la seva longitud real - d(source, target).
+        length = np.arccos(np.clip(np.einsum("ij,ij->i", matrix[path[:-1]], matrix[path[1:]]), -1.0, 1.0)).sum()
+        best, meeting = float(length) - to_target[source], None
+
+        def potential(v):
+            return (to_target[v] - to_source[v]) / 2
+
+        # Índex 0: cerca des de 'source'; índex 1: cerca (enrere) des de 'target'
+        dist = ({source: 0.0}, {target: 0.0})
+        parents = ({source: None}, {target: None})
+        heaps = ([(0.0, source)], [(0.0, target)])
+        done = (set(), set())
+        steps = 0
+        while heaps[0] and heaps[1]:
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+            steps += 1
+            if out_of_time(steps):
+                break
+            side = 0 if len(heaps[0]) <= len(heaps[1]) else 1
+            d, u = heapq.heappop(heaps[side])
+            if u in done[side]:
+                continue
+            done[side].add(u)
+            sign = 1 if side == 0 else -1
+            p_u = potential(u)
+            for v, weight in expand(u):
+                # Pes reduït de l'aresta en el sentit de la cerca
+                nd = d + weight + sign * (potential(v) - p_u)
+                if nd < dist[side].get(v, math.inf):
+                    dist[side][v] = nd
+                    parents[side][v] = u
+                    heapq.heappush(heaps[side], (nd, v))
+                other = dist[1 - side].get(v)
+                if other is not None and dist[side][v] + other < best:
+                    best, meeting = dist[side][v] + other, v
+
+        if meeting is None:
+            return path
+        path = []
+        node = meeting
+        while node is not None:
+            path.append(node)
+            node = parents[0][node]
+        path.reverse()
+        node = parents[1][meeting]
+        while node is not None:
+            path.append(node)
+            node = parents[1][node]
+        return path
+
+    def save(self, path: str) -> None:
+        np.savez(path, uuids=np.array(self.uuids, dtype=str), neighbours=self.neighbours,
+                 scores=self.scores, bridges=self.bridges, k=np.array(self.k))
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as data:
+            graph = cls(k=int(data["k"]))
+            graph.uuids = data["uuids"].tolist()
+            graph.neighbours = data["neighbours"]
+            graph.scores = data["scores"]
+            graph.bridges = data["bridges"]
+        return graph
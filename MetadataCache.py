@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+MetadataCache.py : Memòria cau persistent de metadades PNG per a ImageData.
+
+Guarda en un arxiu SQLite les metadades de text i les dimensions de cada
+imatge, indexades pel path relatiu i validades amb (mida, mtime_ns). Així,
+en tornar a arrencar, només cal llegir el PNG dels arxius nous o modificats.
+
+Mètodes:
+    - get(path: str, size: int, mtime_ns: int) -> tuple
+        Retorna (metadata, (width, height)) si hi ha una entrada vàlida
+        per a aquest arxiu, o None si no n'hi ha o ha canviat.
+
+    - put(path: str, size: int, mtime_ns: int, metadata: dict, dimensions: tuple) -> None
+        Afegeix o substitueix una entrada (s'escriu a disc en fer flush()).
+
+    - flush() -> None
+        Escriu a disc les entrades pendents en una sola transacció.
+
+    - close() -> None
+        Fa flush() i tanca la connexió.
+
+Notes:
+    - Tota la taula es llegeix a memòria en obrir la cau: una sola lectura
+      seqüencial en lloc d'una consulta per imatge.
+    - Les escriptures s'agrupen (FLUSH_EVERY) per no fer un commit per arxiu.
+"""
+import atexit
+import json
+import sqlite3
+import threading
+
+FLUSH_EVERY = 1000
+
+
+class MetadataCache:
+    def __init__(self, file: str):
+        self.file = file
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS metadata ("
+            " path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER,"
+            " width INTEGER, height INTEGER, fields TEXT)")
+        self._entries = {
+            path: (size, mtime_ns, width, height, fields)
+            for path, size, mtime_ns, width, height, fields
+            in self._conn.execute("SELECT path, size, mtime_ns, width, height, fields FROM metadata")
+        }
+        self._pending = []
+        atexit.register(self.close)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __str__(self) -> str:
+        return f"MetadataCache '{self.file}' ({len(self._entries)} entrades)"
+
+    def get(self, path: str, size: int, mtime_ns: int):
+        cached = self._entries.get(path)
+        if cached is None or cached[0] != size or cached[1] != mtime_ns:
+            return None
+        fields = cached[4]
+        if isinstance(fields, str):
+            # Els camps es deserialitzen només el primer cop que es demanen
+            fields = json.loads(fields)
+            self._entries[path] = cached[:4] + (fields,)
+        return fields, (cached[2], cached[3])
+
+    def put(self, path: str, size: int, mtime_ns: int, metadata: dict, dimensions: tuple) -> None:
+        width, height = dimensions
+        with self._lock:
+            self._entries[path] = (size, mtime_ns, width, height, metadata)
+            self._pending.append((path, size, mtime_ns, width, height,
+                                  json.dumps(metadata, ensure_ascii=False)))
+            if len(self._pending) >= FLUSH_EVERY:
+                self._flush_locked()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if not self._pending or self._conn is None:
+            return
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO metadata (path, size, mtime_ns, width, height, fields)"
+                " VALUES (?, ?, ?, ?, ?, ?)", self._pending)
+        self._pending = []
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is None:
+                return
+            self._flush_locked()
+            self._conn.close()
+            self._conn = None
+        atexit.unregister(self.close)
@@ -1,17 +1,67 @@
-import json
 import math
 import os
 
+import numpy as np
+
+from AnnIndex import IVFIndex
+from KnnGraph import SCORE_BYTES, KnnGraph
+from ResultCache import CACHE_SIZE, ResultCache
+from SharedEmbeddings import SharedEmbeddings
+from VectorStore import VectorStore, keys_path
+
+
+class GalleryObj:
+    def __init__(self, imgs): self.images = imgs
+
+
 class RecommenderSystem:
-    def __init__(self, vectors_path, image_data=None, image_id=None):
+    def __init__(self, vectors_path, image_data=None, image_id=None,
+                 cache_size=CACHE_SIZE, cache_ttl=None):
         self.image_data = image_data
         self.image_id = image_id
-        self.vectors_json = {}
-        self.uuid_to_vector = {}
+
+        # Vectors de l'arxiu (veure VectorStore). Si 'vectors_path' és un JSON
+        # i al costat hi ha el .npy convertit (i és més nou), s'obre aquest.
+        self.store = VectorStore()
+
+        # Matriu (N x d) float32 amb els embeddings normalitzats (norma L2 = 1)
+        # i la correspondència fila <-> UUID. La construeix preprocess().
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.has_vector = np.zeros(0, dtype=bool)
+        self.row_uuids = []
+        self.uuid_rows = {}
+        # Índex aproximat (IVF) per a find_similar_images(mode="ann") i els
+        # paràmetres amb què s'ha construït o carregat: preprocess() el conserva
+        # si les files no canvien i, si canvien, el reconstrueix amb aquests
+        self.ann = None
+        self.ann_params = None
+        # Graf de veïns per a find_transition_prompts: s'ha de construir
+        # (build_knn_graph) o carregar (load_knn_graph) abans de les consultes
+        self.graph = None
+        # Files que no es retornen a cap consulta: les que no tenen UUID i les
+        # d'imatges eliminades d'ImageData des de l'últim preprocess()
+        self.removed = set()
+        # Resultats de find_similar_images: (uuid, mode, nprobe) -> (k, uuids)
+        self.cache = ResultCache(cache_size, cache_ttl)
+        # Matriu a memòria compartida (veure share_embeddings / attach_embeddings)
+        self.shared = None
+        if image_data is not None:
+            image_data.subscribe(self._on_change)
 
         if os.path.exists(vectors_path):
-            with open(vectors_path, 'r') as f:
-                self.vectors_json = json.load(f).get("vectors", {})
+            binary = os.path.splitext(vectors_path)[0] + ".npy"
+            if vectors_path.endswith(".npy"):
+                self.store = VectorStore.open(vectors_path)
+            elif (os.path.exists(binary) and os.path.exists(keys_path(binary))
+                  and os.path.getmtime(binary) >= os.path.getmtime(vectors_path)):
+                self.store = VectorStore.open(binary)
+            else:
+                self.store = VectorStore.from_json(vectors_path)
+
+    @staticmethod
+    def convert_vectors(json_path, store_path=None):
+        """Converteix (un sol cop) l'arxiu de vectors JSON al magatzem binari .npy."""
+        return VectorStore.convert(json_path, store_path)
 
     def cosine_similarity(self, vec1, vec2):
         dot = sum(a * b for a, b in zip(vec1, vec2))
@@ -20,33 +70,276 @@ class RecommenderSystem:
         return dot / (norm_a * norm_b) if norm_a and norm_b else 0.0
 
     def preprocess(self):
+        if self.shared is not None and not self.shared.owner:
+            # Treballador: les files les publica el procés propietari
+            self.refresh_embeddings()
+            return
         if not self.image_id: return
         # [cite_start]El JSON usa filenames sense extensió com a claus [cite: 907]
-        for filename_no_ext, embeddings in self.vectors_json.items():
+        row_uuids = []
+        for filename_no_ext in self.store.keys:
             # Reconstruïm el nom que ha guardat ImageFiles
             filename = filename_no_ext + ".png"
-            uuid = self.image_id.get_uuid(filename)
-            if uuid:
-                self.uuid_to_vector[uuid] = embeddings.get("image_embedding")
-
-    def find_similar_images(self, query_uuid, k=10):
-        query_vec = self.uuid_to_vector.get(query_uuid)
-        if not query_vec:
-            class G:
-                def __init__(self): self.images = []
-            return G()
-
-        results = []
-        for uuid, vec in self.uuid_to_vector.items():
-            if uuid == query_uuid: continue
-            results.append((uuid, self.cosine_similarity(query_vec, vec)))
-        
-        results.sort(key=lambda x: x[1], reverse=True)
-        top_k = [r[0] for r in results[:k]]
-        
-        class GalleryObj:
-            def __init__(self, imgs): self.images = imgs
-        return GalleryObj(top_k)
-
-    def find_transition_prompts(self, uuid1, uuid2):
-        return []
+            row_uuids.append(self.image_id.get_uuid(filename) or "")
+        # La matriu es fa servir tal qual, també si hi ha files sense UUID (sense
+        # còpia; si és un memmap, les pàgines es comparteixen): aquestes files
+        # queden com a "sense vector" i _set_rows les exclou dels resultats
+        matrix, has_vector = self.store.matrix, self.store.has_vector
+        if not all(row_uuids):
+            has_vector = has_vector & np.array([bool(uuid) for uuid in row_uuids], dtype=bool)
+        if self.shared is not None:
+            # Propietari: publiquem una generació nova i hi passem a apuntar
+            self.shared.publish(matrix, row_uuids, has_vector)
+            matrix, has_vector = self.shared.matrix, self.shared.has_vector
+        self._set_rows(matrix, row_uuids, has_vector)
+        if self.shared is not None:
+            self.shared.release()
+
+    def _set_rows(self, matrix, row_uuids, has_vector):
+        same_rows = row_uuids == self.row_uuids
+        self.matrix = matrix
+        self.has_vector = has_vector
+        self.row_uuids = row_uuids
+        self.uuid_rows = {uuid: row for row, uuid in enumerate(row_uuids) if uuid}
+        # Les files sense UUID ("") no es poden retornar mai
+        self.removed = {row for row, uuid in enumerate(row_uuids) if not uuid}
+        # Els resultats desats ja no són vàlids i el graf de veïns només
+        # recalcula les imatges noves. L'índex aproximat es conserva si les
+        # files són les mateixes; si no, es reconstrueix amb els seus paràmetres
+        self.cache.invalidate()
+        if self.graph is not None:
+            self.graph.update(self.matrix, self.row_uuids, self.has_vector)
+        if not same_rows:
+            self.ann = None
+            if self.ann_params is not None and len(self.row_uuids):
+                self.build_ann_index(**self.ann_params)
+
+    def share_embeddings(self, name):
+        """
+        Publica la matriu actual (cal haver fet preprocess) a memòria
+        compartida amb el nom 'name'. Aquest procés en passa a ser el
+        propietari: cada preprocess() posterior publica una generació nova.
+        """
+        self.shared = SharedEmbeddings.create(name, self.matrix, self.row_uuids, self.has_vector)
+        self._set_rows(self.shared.matrix, self.shared.uuids, self.shared.has_vector)
+        self.shared.release()
+        return self.shared
+
+    @classmethod
+    def attach_embeddings(cls, name, image_data=None, image_id=None, **kwargs):
+        """
+        Crea un RecommenderSystem treballador connectat (sense còpia) a la
+        matriu que publica un altre procés amb share_embeddings(name).
+        """
+        recommender = cls("", image_data=image_data, image_id=image_id, **kwargs)
+        recommender.shared = SharedEmbeddings.attach(name)
+        recommender._set_rows(recommender.shared.matrix, recommender.shared.uuids,
+                              recommender.shared.has_vector)
+        return recommender
+
+    def refresh_embeddings(self):
+        """(Treballador) Passa a la darrera generació publicada. True si ha canviat."""
+        if self.shared is None or not self.shared.refresh():
+            return False
+        self._set_rows(self.shared.matrix, self.shared.uuids, self.shared.has_vector)
+        self.shared.release()
+        return True
+
+    def close_embeddings(self):
+        """Es desconnecta de la memòria compartida (el propietari l'esborra)."""
+        if self.shared is None:
+            return
+        self._set_rows(np.zeros((0, 0), dtype=np.float32), [], np.zeros(0, dtype=bool))
+        if self.shared.owner:
+            self.shared.unlink()
+        else:
+            self.shared.close()
+        self.shared = None
+
+    def build_ann_index(self, nlist=None, nprobe=8, iterations=10, seed=0):
+        """Construeix l'índex IVF sobre la matriu actual (cal haver fet preprocess)."""
+        self.ann = IVFIndex(nlist=nlist, nprobe=nprobe, iterations=iterations, seed=seed)
+        self.ann.build(self.matrix)
+        self.ann_params = {"nlist": nlist, "nprobe": nprobe, "iterations": iterations, "seed": seed}
+        self.cache.invalidate(lambda key, value: key[1] == "ann")
+
+    def save_ann_index(self, path):
+        if self.ann is None:
+            print("ERROR (RecommenderSystem): No hi ha cap índex aproximat construït.")
+            return
+        self.ann.save(path)
+
+    def load_ann_index(self, path):
+        index = IVFIndex.load(path)
+        if len(index) != len(self.row_uuids):
+            print(f"ERROR (RecommenderSystem): L'índex {path} no correspon als vectors carregats.")
+            return
+        self.ann = index
+        self.ann_params = {"nlist": index.nlist, "nprobe": index.nprobe,
+                           "iterations": index.iterations, "seed": index.seed}
+        self.cache.invalidate(lambda key, value: key[1] == "ann")
+
+    def _on_change(self, event, uuid, old, new):
+        """
+        Una imatge eliminada deixa de ser resultat de cap consulta (la seva
+        fila queda marcada a self.removed fins al proper preprocess) i es
+        descarten els resultats desats on apareix. Els canvis de metadades
+        no afecten la similitud entre embeddings.
+        """
+        if event == "remove":
+            row = self.uuid_rows.get(uuid)
+            if row is not None:
+                self.removed.add(row)
+            self.cache.invalidate(lambda key, value: key[0] == uuid or uuid in value[1])
+
+    def build_knn_graph(self, k=10, full=False):
+        """Construeix (o actualitza) el graf dels k veïns més propers."""
+        if self.graph is None or self.graph.k != k:
+            self.graph = KnnGraph(k)
+        self.graph.update(self.matrix, self.row_uuids, self.has_vector, full=full)
+
+    def save_knn_graph(self, path):
+        if self.graph is None:
+            print("ERROR (RecommenderSystem): No hi ha cap graf de veïns construït.")
+            return
+        self.graph.save(path)
+
+    def load_knn_graph(self, path):
+        """Carrega un graf desat i l'actualitza amb les imatges actuals."""
+        self.graph = KnnGraph.load(path)
+        self.graph.update(self.matrix, self.row_uuids, self.has_vector)
+
+    def _top_k(self, scores, k):
+        """
+        Índexs de les k puntuacions més altes, de més a menys similar. Amb
+        empats, primer la fila més baixa (el mateix ordre que l'ordenació
+        estable de la versió original).
+        """
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.zeros(0, dtype=np.intp)
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        # Incloem tots els empatats amb la k-èsima per desempatar per fila
+        kth = scores[candidates].min()
+        candidates = np.flatnonzero(scores >= kth)
+        order = np.lexsort((candidates, -scores[candidates]))
+        return candidates[order[:k]]
+
+    def find_similar_images(self, query_uuid, k=10, mode="exact", nprobe=None):
+        """
+        mode "exact": cerca exacta sobre tots els vectors.
+        mode "ann": cerca aproximada amb l'índex IVF; 'nprobe' ajusta el
+        compromís recall / latència. Cal haver construït o carregat l'índex
+        (build_ann_index / load_ann_index); si no, es fa la cerca exacta.
+        """
+        if mode == "ann" and self.ann is None:
+            # Construir l'índex és una operació de preprocés (k-means sobre
+            # tots els vectors): no es fa dins d'una consulta
+            print("WARNING (RecommenderSystem): No hi ha índex aproximat; cal cridar "
+                  "build_ann_index() o load_ann_index() abans. Es fa la cerca exacta.")
+            mode, nprobe = "exact", None
+        # Els k primers d'un resultat desat amb una k més gran són el mateix
+        # resultat (l'ordre de desempat és fix)
+        key = (query_uuid, mode, nprobe)
+        cached = self.cache.get(key, accept=lambda value: value[0] >= k)
+        if cached is not None:
+            return GalleryObj(cached[1][:k])
+
+        row = self.uuid_rows.get(query_uuid)
+        if row is None or row in self.removed or not self.has_vector[row]:
+            return GalleryObj([])
+
+        if mode == "ann":
+            exclude = [row, *self.removed] if self.removed else row
+            top = self.ann.search(self.matrix, self.matrix[row], k, nprobe=nprobe, exclude=exclude)
+        else:
+            scores = self.matrix @ self.matrix[row]
+            scores[row] = -np.inf
+            if self.removed:
+                scores[list(self.removed)] = -np.inf
+            top = self._top_k(scores, min(k, len(scores) - 1 - len(self.removed)))
+        images = [self.row_uuids[i] for i in top]
+        self.cache.put(key, (k, images))
+        return GalleryObj(list(images))
+
+    def find_similar_images_many(self, uuids, k=10, max_memory=256 * 2**20):
+        """
+        Veïns més similars de moltes imatges alhora: {uuid: [uuid, ...]}.
+        Les consultes es processen en blocs amb un producte matriu-matriu
+        (BLAS, multifil) de mida limitada per 'max_memory' bytes. Cada
+        llista és la mateixa que retornaria find_similar_images(uuid, k).
+        """
+        results = {}
+        queries = []
+        for uuid in uuids:
+            row = self.uuid_rows.get(uuid)
+            if row is not None and row not in self.removed and self.has_vector[row]:
+                queries.append(uuid)
+            else:
+                results[uuid] = []
+        n = len(self.row_uuids)
+        k = min(k, n - 1 - len(self.removed))
+        removed = list(self.removed)
+        if not queries or k <= 0:
+            results.update((uuid, []) for uuid in queries)
+            return results
+
+        # Cada fila del bloc ocupa n puntuacions (SCORE_BYTES cadascuna,
+        # comptant els índexs d'argpartition i la màscara d'empats)
+        block = max(1, int(max_memory // (n * SCORE_BYTES)))
+        for start in range(0, len(queries), block):
+            chunk = queries[start:start + block]
+            rows = np.array([self.uuid_rows[uuid] for uuid in chunk])
+            scores = self.matrix[rows] @ self.matrix.T
+            scores[np.arange(len(rows)), rows] = -np.inf
+            if removed:
+                scores[:, removed] = -np.inf
+            # Es nega al mateix bloc (sense còpia): la més similar és la més petita
+            np.negative(scores, out=scores)
+
+            top = np.argpartition(scores, k - 1, axis=1)[:, :k].copy()
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.lexsort((top, top_scores), axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            # Si hi ha empats amb la k-èsima fora del top, cal desempatar per fila
+            kth = top_scores.max(axis=1)
+            ties = (scores <= kth[:, None]).sum(axis=1) > k
+            for i, uuid in enumerate(chunk):
+                best = self._top_k(-scores[i], k) if ties[i] else top[i]
+                results[uuid] = [self.row_uuids[j] for j in best]
+        return results
+
+    def find_transition_path(self, uuid1, uuid2, budget=0.05):
+        """
+        Camí d'imatges visualment intermèdies entre uuid1 i uuid2 (inclosos)
+        sobre el graf de veïns, amb A* bidireccional i distància angular.
+        'budget' limita el temps de cerca (segons): si s'esgota es retorna el
+        millor camí trobat fins aleshores, o [] si no n'hi ha cap.
+        Cal haver construït o carregat el graf (build_knn_graph /
+        load_knn_graph); si no, retorna [].
+        """
+        row1 = self.uuid_rows.get(uuid1)
+        row2 = self.uuid_rows.get(uuid2)
+        if row1 is None or row2 is None or not (self.has_vector[row1] and self.has_vector[row2]):
+            return []
+        if row1 in self.removed or row2 in self.removed:
+            return []
+        if self.graph is None:
+            # Construir el graf és una operació de preprocés (pot trigar minuts):
+            # no es fa dins d'una consulta amb 'budget'
+            print("WARNING (RecommenderSystem): No hi ha graf de veïns; "
+                  "cal cridar build_knn_graph() o load_knn_graph() abans.")
+            return []
+        path = self.graph.shortest_path(self.matrix, row1, row2, budget=budget, blocked=self.removed)
+        return [self.row_uuids[row] for row in path]
+
+    def find_transition_prompts(self, uuid1, uuid2, budget=0.05):
+        """Prompts de les imatges intermèdies del camí entre uuid1 i uuid2."""
+        if self.image_data is None:
+            return []
+        intermediate = self.find_transition_path(uuid1, uuid2, budget)[1:-1]
+        missing = [uuid for uuid in intermediate if self.image_data.get_prompt(uuid) is None]
+        if missing:
+            self.image_data.load_metadata_many(missing)
+        prompts = (self.image_data.get_prompt(uuid) for uuid in intermediate)
+        return [prompt for prompt in prompts if prompt is not None]
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+ResultCache.py : Memòria cau de resultats de consultes (LRU + TTL).
+
+La fan servir RecommenderSystem (find_similar_images) i SearchMetadata
+(prompt) per no tornar a calcular les consultes que la interfície repeteix.
+Qui la fa servir és responsable d'invalidar les entrades quan canvien les
+dades (veure invalidate()).
+
+Mètodes:
+    - get(key, accept=None)
+        Retorna el valor desat per a 'key', o None si no n'hi ha, ha
+        caducat o accept(valor) és fals. Compta un encert o una fallada.
+
+    - put(key, value) -> None
+        Desa un valor. Si se supera 'max_entries' s'expulsa el que fa més
+        temps que no s'usa.
+
+    - invalidate(predicate=None) -> int
+        Elimina les entrades amb predicate(key, value) cert (totes si és
+        None). Retorna quantes n'ha eliminat.
+
+    - stats() -> dict
+        Comptadors hits, misses, evictions, expirations, invalidations i la
+        mida actual, per dimensionar la memòria cau.
+
+Notes:
+    - ttl (segons) None vol dir que les entrades no caduquen.
+    - max_entries = 0 desactiva la memòria cau (get sempre falla).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+# Mida per defecte (nombre d'entrades)
+CACHE_SIZE = 256
+
+
+class ResultCache:
+    def __init__(self, max_entries: int = CACHE_SIZE, ttl: float = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()   # key -> (valor, instant de caducitat)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __str__(self) -> str:
+        return (f"ResultCache ({len(self._entries)}/{self.max_entries} entrades, "
+                f"{self.hits} encerts, {self.misses} fallades)")
+
+    def get(self, key, accept=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None or (accept is not None and not accept(entry[0])):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value) -> None:
+        if self.max_entries <= 0:
+            return
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, predicate=None) -> int:
+        with self._lock:
+            if predicate is None:
+                removed = len(self._entries)
+                self._entries.clear()
+            else:
+                stale = [key for key, (value, _) in self._entries.items() if predicate(key, value)]
+                for key in stale:
+                    del self._entries[key]
+                removed = len(stale)
+            self.invalidations += removed
+            return removed
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "size": len(self._entries),
+        }
@@ -53,6 +53,25 @@ Notes:
     - Les llistes retornades poden estar buides
     - Els operadors lògics NO modifiquen les llistes originals
     - Aquests mètodes NO retornen objectes Gallery, sinó llistes simples
+    - SearchMetadata(image_data, use_index=True) (o build_index()) crea un
+      índex de trigrames per camp. Les cerques de menys de 3 caràcters fan
+      sempre el recorregut complet. L'índex es manté al dia subscrivint-se
+      als canvis d'ImageData (només es toquen els camps que canvien).
+    - seed_range, steps_range, cfg_scale_range i date_range retornen les
+      imatges amb el valor dins un interval (inclòs), ordenades per valor.
+      Amb índex fan servir bisect sobre llistes ordenades.
+    - query(expr) avalua expressions And/Or/Not sobre predicats Field i
+      Range (també amb &, | i ~), planificades segons la selectivitat de
+      cada predicat. El resultat es retorna en ordre d'inserció.
+    - Internament els resultats són Bitmaps sobre files denses (Bitmap.py);
+      query_bitmap(expr) els retorna sense convertir, i and_operator /
+      or_operator operen bit a bit quan reben dos Bitmaps.
+    - search_prompt_ranked(query, k) retorna els k prompts més rellevants
+      segons BM25 (índex de paraules incremental, top-k amb un heap).
+    - Els resultats de prompt(sub) es desen en una memòria cau LRU/TTL
+      (self.cache, veure ResultCache.py) que s'invalida amb els canvis de
+      prompt d'ImageData. cache_size=0 la desactiva. Els canvis s'acumulen
+      i s'apliquen tots junts a la següent crida a prompt().
 """
 
 # -*- coding: utf-8 -*-
@@ -64,10 +83,111 @@ Implementa Func6 (Cerca i Operadors Lògics).
 """
 
 # -*- coding: utf-8 -*-
+import heapq
+import math
+import re
+from bisect import bisect_left, bisect_right, insort
+from Bitmap import Bitmap, RowIndex
 from ImageData import ImageData
+from ResultCache import CACHE_SIZE, ResultCache
+
+# Camps amb índex de rang i com es converteixen els seus valors.
+# Les dates (YYYY-MM-DD) es comparen com a strings.
+RANGE_FIELDS = {"seed": int, "steps": int, "cfg_scale": float, "date": str}
+
+# Mida dels n-grames de l'índex. Les cerques més curtes no es poden
+# resoldre amb l'índex i fan un recorregut complet.
+NGRAM = 3
+
+
+# Prompts canviats que s'acumulen abans d'invalidar la memòria cau de
+# prompt(); si n'hi ha més, es buida sencera
+STALE_PROMPTS = 1024
+
+
+# Paràmetres de BM25 per a search_prompt_ranked()
+BM25_K1 = 1.2
+BM25_B = 0.75
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def _tokens(value: str) -> list:
+    return _TOKEN_RE.findall(value.lower())
+
+
+def _ngrams(value: str) -> set:
+    return {value[i:i + NGRAM] for i in range(len(value) - NGRAM + 1)}
+
+
+class _Node:
+    """Node d'una expressió de cerca. Es pot combinar amb &, | i ~."""
+    def __and__(self, other):
+        return And(self, other)
+
+    def __or__(self, other):
+        return Or(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+
+class Field(_Node):
+    """Imatges amb 'sub' dins el camp (mateixa semàntica que prompt(), model(), ...)."""
+    def __init__(self, field: str, sub: str):
+        self.field = field
+        self.sub = sub
+
+    def __repr__(self) -> str:
+        return f"Field({self.field!r}, {self.sub!r})"
+
+
+class Range(_Node):
+    """Imatges amb el valor del camp dins [low, high] (com seed_range(), ...)."""
+    def __init__(self, field: str, low=None, high=None):
+        self.field = field
+        self.low = low
+        self.high = high
+
+    def __repr__(self) -> str:
+        return f"Range({self.field!r}, {self.low!r}, {self.high!r})"
+
+
+class And(_Node):
+    def __init__(self, *children):
+        self.children = list(children)
+
+    def __repr__(self) -> str:
+        return f"And({', '.join(map(repr, self.children))})"
+
+
+class Or(_Node):
+    def __init__(self, *children):
+        self.children = list(children)
+
+    def __repr__(self) -> str:
+        return f"Or({', '.join(map(repr, self.children))})"
+
+
+class Not(_Node):
+    def __init__(self, child):
+        self.child = child
+
+    def __repr__(self) -> str:
+        return f"Not({self.child!r})"
+
+
+class InGallery(_Node):
+    """Imatges que pertanyen a una Gallery."""
+    def __init__(self, gallery):
+        self.gallery = gallery
+
+    def __repr__(self) -> str:
+        return f"InGallery({self.gallery.name!r})"
+
 
 class SearchMetadata:
-    def __init__(self, image_data: ImageData):
+    def __init__(self, image_data: ImageData, use_index: bool = False,
+                 cache_size: int = CACHE_SIZE, cache_ttl: float = None):
         self._image_data = image_data
         self._getter_map = {
             "prompt": self._image_data.get_prompt,
@@ -78,14 +198,276 @@ class SearchMetadata:
             "sampler": self._image_data.get_sampler,
             "date": self._image_data.get_created_date,
         }
+        # Nom del camp dins ImageData per a cada camp de cerca
+        self._field_keys = {field: field for field in self._getter_map}
+        self._field_keys["date"] = "created_date"
+        # Fila densa per a cada UUID: els resultats interns són Bitmaps
+        self._rows = RowIndex(self._image_data.get_all_uuids())
+        # Índex de trigrames: {camp: {trigrama: set(fila)}}
+        self._postings = {}
+        # Índex de rang: {camp: llista ordenada de (valor, fila)}
+        self._ranges = {}
+        # Índex BM25 dels prompts: {terme: {fila: freqüència}} i longituds
+        self._terms = None
+        self._doc_lengths = {}
+        self._total_length = 0
+        # Resultats de prompt(sub): sub -> llista d'UUID
+        self.cache = ResultCache(cache_size, cache_ttl)
+        # Prompts (vells i nous) canviats des de l'última consulta; None si
+        # n'hi ha més de STALE_PROMPTS (cal buidar la memòria cau)
+        self._stale_prompts = []
+        self._image_data.subscribe(self._on_change)
+        if use_index:
+            self.build_index()
 
     def __len__(self) -> int:
         return len(self._image_data.get_all_uuids())
 
+    @property
+    def rows(self) -> RowIndex:
+        """Correspondència UUID <-> fila, per convertir llistes i Bitmaps."""
+        return self._rows
+
+    def build_index(self, fields: list = None) -> None:
+        """
+        Construeix un índex invertit de trigrames per a cada camp (per
+        defecte tots). Les cerques de 3 o més caràcters intersequen les
+        llistes de cada trigrama de 'sub' i confirmen els candidats amb la
+        mateixa comparació 'sub in value', de manera que el resultat és
+        idèntic al del recorregut complet i en el mateix ordre.
+        """
+        fields = fields or list(self._getter_map)
+        rows = [(uuid, self._rows.row_of(uuid)) for uuid in self._image_data.get_all_uuids()]
+        self._postings = {}
+        for field in fields:
+            getter_func = self._getter_map[field]
+            postings = {}
+            for uuid, row in rows:
+                value = getter_func(uuid)
+                if value and isinstance(value, str):
+                    for gram in _ngrams(value):
+                        bucket = postings.get(gram)
+                        if bucket is None:
+                            postings[gram] = {row}
+                        else:
+                            bucket.add(row)
+            self._postings[field] = postings
+
+        # Índexs de rang sobre els valors numèrics i les dates
+        self._ranges = {}
+        for field in fields:
+            if field not in RANGE_FIELDS:
+                continue
+            getter_func = self._getter_map[field]
+            entries = []
+            for uuid, row in rows:
+                value = self._range_value(field, getter_func(uuid))
+                if value is not None:
+                    entries.append((value, row))
+            entries.sort()
+            self._ranges[field] = entries
+
+    def build_ranked_index(self) -> None:
+        """
+        Construeix l'índex invertit de paraules dels prompts per a
+        search_prompt_ranked(). Després es manté al dia amb els canvis
+        d'ImageData, com la resta d'índexs.
+        """
+        self._terms = {}
+        self._doc_lengths = {}
+        self._total_length = 0
+        for uuid in self._image_data.get_all_uuids():
+            self._add_document(self._rows.row_of(uuid), self._image_data.get_prompt(uuid))
+
+    def _add_document(self, row: int, prompt) -> None:
+        if not prompt or not isinstance(prompt, str):
+            return
+        tokens = _tokens(prompt)
+        self._doc_lengths[row] = len(tokens)
+        self._total_length += len(tokens)
+        for token in tokens:
+            bucket = self._terms.get(token)
+            if bucket is None:
+                self._terms[token] = {row: 1}
+            else:
+                bucket[row] = bucket.get(row, 0) + 1
+
+    def _remove_document(self, row: int, prompt) -> None:
+        if row not in self._doc_lengths:
+            return
+        self._total_length -= self._doc_lengths.pop(row)
+        for token in set(_tokens(prompt)):
+            bucket = self._terms.get(token)
+            if bucket is not None:
+                bucket.pop(row, None)
+                if not bucket:
+                    del self._terms[token]
+
+    def search_prompt_ranked(self, query: str, k: int = 10) -> list:
+        """
+        Retorna els k UUID amb el prompt més rellevant per a 'query' segons
+        BM25 (de més a menys rellevant). Les paraules es comparen en
+        minúscules. Només es puntuen les imatges que contenen algun terme i
+        el top-k es tria amb un heap, sense ordenar tots els resultats.
+        """
+        if self._terms is None:
+            self.build_ranked_index()
+        documents = len(self._doc_lengths)
+        if not documents or k <= 0:
+            return []
+        average = self._total_length / documents
+
+        scores = {}
+        for token in set(_tokens(query)):
+            bucket = self._terms.get(token)
+            if not bucket:
+                continue
+            idf = math.log(1 + (documents - len(bucket) + 0.5) / (len(bucket) + 0.5))
+            for row, tf in bucket.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._doc_lengths[row] / average)
+                scores[row] = scores.get(row, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        # Empat: primer la imatge inserida abans
+        best = heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+        uuid_of = self._rows.uuid_of
+        return [uuid_of(row) for row, _ in best]
+
+    def _range_value(self, field: str, value):
+        if not value or not isinstance(value, str):
+            return None
+        try:
+            return RANGE_FIELDS[field](value)
+        except ValueError:
+            return None
+
+    def _on_change(self, event: str, uuid: str, old: dict, new: dict) -> None:
+        """Actualitza les files i els índexs amb els canvis d'ImageData."""
+        if event == "add":
+            self._rows.add(uuid)
+        row = self._rows.row_of(uuid)
+        if row is None:
+            return
+        if event == "remove":
+            self._rows.remove(uuid)
+
+        if "prompt" in old or "prompt" in new:
+            # Només canvien els resultats de les subcadenes del prompt vell o
+            # nou. S'invaliden tots junts a la propera consulta (una càrrega
+            # massiva no recorre la memòria cau a cada imatge)
+            stale = self._stale_prompts
+            if stale is not None:
+                for value in (old.get("prompt"), new.get("prompt")):
+                    if isinstance(value, str):
+                        stale.append(value)
+                if len(stale) > STALE_PROMPTS:
+                    self._stale_prompts = None
+
+        if self._terms is not None and ("prompt" in old or "prompt" in new):
+            self._remove_document(row, old.get("prompt"))
+            self._add_document(row, new.get("prompt"))
+
+        for field, entries in self._ranges.items():
+            key = self._field_keys[field]
+            if key not in old and key not in new:
+                continue
+            old_value = self._range_value(field, old.get(key))
+            if old_value is not None:
+                i = bisect_left(entries, (old_value, row))
+                if i < len(entries) and entries[i][1] == row:
+                    del entries[i]
+            new_value = self._range_value(field, new.get(key))
+            if new_value is not None:
+                insort(entries, (new_value, row))
+
+        for field, postings in self._postings.items():
+            key = self._field_keys[field]
+            if key not in old and key not in new:
+                continue
+            old_value, new_value = old.get(key), new.get(key)
+            if old_value and isinstance(old_value, str):
+                for gram in _ngrams(old_value):
+                    bucket = postings.get(gram)
+                    if bucket is not None:
+                        bucket.discard(row)
+                        if not bucket:
+                            del postings[gram]
+            if new_value and isinstance(new_value, str):
+                for gram in _ngrams(new_value):
+                    bucket = postings.get(gram)
+                    if bucket is None:
+                        postings[gram] = {row}
+                    else:
+                        bucket.add(row)
+
+    def _search_indexed(self, field: str, sub: str) -> Bitmap:
+        return Bitmap.from_rows(self._match_indexed(field, sub), self._rows.size)
+
+    def _match_indexed(self, field: str, sub: str) -> list:
+        """Files (sense ordenar) on 'sub' apareix al camp, amb l'índex de trigrames."""
+        postings = self._postings[field]
+        buckets = []
+        for gram in _ngrams(sub):
+            bucket = postings.get(gram)
+            if not bucket:
+                return []
+            buckets.append(bucket)
+        # Intersecció començant per la llista més curta
+        buckets.sort(key=len)
+        candidates = buckets[0].intersection(*buckets[1:])
+
+        getter_func = self._getter_map[field]
+        uuid_of = self._rows.uuid_of
+        matches = []
+        for row in candidates:
+            value = getter_func(uuid_of(row))
+            if value and isinstance(value, str) and sub in value:
+                matches.append(row)
+        return matches
+
+    def _range_entries(self, field: str) -> list:
+        entries = self._ranges.get(field)
+        if entries is None:
+            getter_func = self._getter_map[field]
+            row_of = self._rows.row_of
+            entries = []
+            for uuid in self._image_data.get_all_uuids():
+                value = self._range_value(field, getter_func(uuid))
+                if value is not None:
+                    entries.append((value, row_of(uuid)))
+            entries.sort()
+        return entries
+
+    def _range_bounds(self, entries: list, low, high) -> tuple:
+        start = 0 if low is None else bisect_left(entries, (low,))
+        end = len(entries) if high is None else bisect_right(entries, (high, math.inf))
+        return start, end
+
+    def _limits(self, node) -> tuple:
+        # Les dates accepten prefixos com a límit superior (veure date_range)
+        if node.field == "date" and node.high is not None:
+            return node.low, node.high + "\uffff"
+        return node.low, node.high
+
+    def _search_range(self, field: str, low, high) -> list:
+        """
+        UUID amb el valor del camp dins [low, high] (None = sense límit),
+        ordenats per valor. Amb índex: O(log N + k) amb bisect; sense índex
+        es fa un recorregut complet.
+        """
+        entries = self._range_entries(field)
+        start, end = self._range_bounds(entries, low, high)
+        uuid_of = self._rows.uuid_of
+        return [uuid_of(entry[1]) for entry in entries[start:end]]
+
     def _search_by_field(self, field: str, sub: str) -> list:
         results = []
         getter_func = self._getter_map.get(field)
         if not getter_func: return []
+        if field in self._postings and len(sub) >= NGRAM:
+            # Les files en ordre creixent són l'ordre d'inserció: no cal
+            # passar per un Bitmap de tot l'univers
+            uuid_of = self._rows.uuid_of
+            return [uuid_of(row) for row in sorted(self._match_indexed(field, sub))]
 
         for uuid in self._image_data.get_all_uuids():
             value = getter_func(uuid)
@@ -94,8 +476,23 @@ class SearchMetadata:
                 results.append(uuid)
         return results
 
+    def _invalidate_stale(self) -> None:
+        stale, self._stale_prompts = self._stale_prompts, []
+        if stale is None:
+            self.cache.invalidate()
+        elif stale:
+            # Un sol text: una subcadena que conté el separador no pot ser
+            # d'un prompt, com a molt s'invalida de més
+            text = "\0".join(stale)
+            self.cache.invalidate(lambda sub, uuids: sub in text)
+
     def prompt(self, sub: str) -> list: 
-        return self._search_by_field("prompt", sub)
+        self._invalidate_stale()
+        results = self.cache.get(sub)
+        if results is None:
+            results = self._search_by_field("prompt", sub)
+            self.cache.put(sub, results)
+        return list(results)
     
     def model(self, sub: str) -> list: 
         return self._search_by_field("model", sub)
@@ -115,8 +512,153 @@ class SearchMetadata:
     def date(self, sub: str) -> list: 
         return self._search_by_field("date", sub)
 
+    def seed_range(self, low: int = None, high: int = None) -> list:
+        return self._search_range("seed", low, high)
+
+    def steps_range(self, low: int = None, high: int = None) -> list:
+        return self._search_range("steps", low, high)
+
+    def cfg_scale_range(self, low: float = None, high: float = None) -> list:
+        return self._search_range("cfg_scale", low, high)
+
+    def date_range(self, start: str = None, end: str = None) -> list:
+        """
+        Imatges creades entre 'start' i 'end' (inclosos). Accepta prefixos:
+        date_range("2025-03", "2025-03") retorna tot el mes de març.
+        """
+        return self._search_range("date", start, None if end is None else end + "\uffff")
+
+    def query(self, expr) -> list:
+        """
+        Avalua una expressió And/Or/Not sobre predicats Field, Range i
+        InGallery, p.ex.:
+            search.query(Field("prompt", "city") & Range("steps", 20, 50) & ~Field("model", "SD2"))
+        Abans d'executar-la s'estima la mida de cada predicat (amb els
+        índexs si n'hi ha): dins un And s'avaluen primer els més selectius,
+        s'atura quan el resultat és buit i, si el conjunt actual és petit,
+        es comproven els predicats restants fila a fila en lloc de calcular-los
+        sencers. Internament es treballa amb Bitmaps; el resultat final es
+        retorna en ordre d'inserció a ImageData.
+        """
+        return self._rows.to_uuids(self._evaluate(expr))
+
+    def query_bitmap(self, expr) -> Bitmap:
+        """Com query(), però retorna el Bitmap sense convertir-lo a UUID."""
+        return self._evaluate(expr)
+
+    def _estimate(self, node) -> int:
+        """
+        Cota superior (barata) del nombre de resultats d'un node. Ha de ser
+        una cota i no una aproximació: un 0 permet descartar la branca.
+        """
+        total = len(self._image_data)
+        if isinstance(node, Field):
+            postings = self._postings.get(node.field)
+            if postings is None or len(node.sub) < NGRAM:
+                return total
+            sizes = [len(postings.get(gram, ())) for gram in _ngrams(node.sub)]
+            return min(sizes)
+        if isinstance(node, Range):
+            entries = self._ranges.get(node.field)
+            if entries is None:
+                return total
+            start, end = self._range_bounds(entries, *self._limits(node))
+            return end - start
+        if isinstance(node, And):
+            return min((self._estimate(child) for child in node.children), default=total)
+        if isinstance(node, Or):
+            return min(total, sum(self._estimate(child) for child in node.children))
+        if isinstance(node, Not):
+            return total
+        if isinstance(node, InGallery):
+            return len(node.gallery)
+        raise TypeError(f"Node de cerca desconegut: {node!r}")
+
+    def _evaluate(self, node) -> Bitmap:
+        if isinstance(node, Field):
+            if node.field in self._postings and len(node.sub) >= NGRAM:
+                return self._search_indexed(node.field, node.sub)
+            return self._rows.bitmap(self._search_by_field(node.field, node.sub))
+        if isinstance(node, Range):
+            entries = self._range_entries(node.field)
+            start, end = self._range_bounds(entries, *self._limits(node))
+            return Bitmap.from_rows((entry[1] for entry in entries[start:end]), self._rows.size)
+        if isinstance(node, InGallery):
+            return node.gallery.to_bitmap(self._rows)
+        if isinstance(node, And):
+            return self._evaluate_and(node.children)
+        if isinstance(node, Or):
+            results = Bitmap()
+            for child in node.children:
+                if self._estimate(child) > 0:
+                    results = results | self._evaluate(child)
+            return results
+        if isinstance(node, Not):
+            return self._rows.live() - self._evaluate(node.child)
+        raise TypeError(f"Node de cerca desconegut: {node!r}")
+
+    def _filter(self, results: Bitmap, node, keep: bool) -> Bitmap:
+        """Comprova 'node' fila a fila només per a les files de 'results'."""
+        uuid_of = self._rows.uuid_of
+        rows = [row for row in results if self._test(node, uuid_of(row)) == keep]
+        return Bitmap.from_rows(rows, self._rows.size)
+
+    def _evaluate_and(self, children: list) -> Bitmap:
+        positives = [child for child in children if not isinstance(child, Not)]
+        negatives = [child.child for child in children if isinstance(child, Not)]
+        if not positives:
+            # Només negacions: cal partir de tot el conjunt
+            results = self._rows.live()
+        else:
+            planned = sorted((self._estimate(child), i, child) for i, child in enumerate(positives))
+            if planned[0][0] == 0:
+                return Bitmap()
+            results = self._evaluate(planned[0][2])
+            for estimate, _, child in planned[1:]:
+                if not results:
+                    return results
+                if len(results) < estimate:
+                    results = self._filter(results, child, True)
+                else:
+                    results = results & self._evaluate(child)
+        # Les negacions es resten del conjunt (mai es materialitza el complement)
+        for child in negatives:
+            if not results:
+                break
+            if len(results) < self._estimate(child):
+                results = self._filter(results, child, False)
+            else:
+                results = results - self._evaluate(child)
+        return results
+
+    def _test(self, node, uuid: str) -> bool:
+        """Comprova un node per a una sola imatge."""
+        if isinstance(node, Field):
+            value = self._getter_map[node.field](uuid)
+            return bool(value) and isinstance(value, str) and node.sub in value
+        if isinstance(node, Range):
+            value = self._range_value(node.field, self._getter_map[node.field](uuid))
+            if value is None:
+                return False
+            low, high = self._limits(node)
+            return (low is None or value >= low) and (high is None or value <= high)
+        if isinstance(node, And):
+            return all(self._test(child, uuid) for child in node.children)
+        if isinstance(node, Or):
+            return any(self._test(child, uuid) for child in node.children)
+        if isinstance(node, Not):
+            return not self._test(node.child, uuid)
+        if isinstance(node, InGallery):
+            return uuid in node.gallery
+        raise TypeError(f"Node de cerca desconegut: {node!r}")
+
     def and_operator(self, list1: list, list2: list) -> list:
+        # Amb dos Bitmaps (query_bitmap) l'operació es fa bit a bit
+        if isinstance(list1, Bitmap) and isinstance(list2, Bitmap):
+            return list1 & list2
         return list(set(list1) & set(list2))
 
     def or_operator(self, list1: list, list2: list) -> list:
+        if isinstance(list1, Bitmap) and isinstance(list2, Bitmap):
+            return list1 | list2
         return list(set(list1) | set(list2))
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+SharedEmbeddings.py : Matriu d'embeddings compartida entre processos.
+
+Un procés propietari publica la matriu normalitzada (i la llista d'UUID de
+cada fila) a multiprocessing.shared_memory; els processos treballadors s'hi
+connecten sense còpia, de manera que la memòria no es multiplica pel
+nombre de treballadors.
+
+Segments (Linux: /dev/shm):
+    - <name>         Control: número de la generació vigent.
+    - <name>_<gen>   Una generació: capçalera, matriu float32 (N x d),
+                     has_vector (N bytes) i els UUID (UTF-8, un per línia).
+
+Cicle de vida:
+    - SharedEmbeddings.create(name, matrix, uuids, has_vector) -> propietari
+        Crea el segment de control i publica la primera generació.
+
+    - SharedEmbeddings.attach(name) -> treballador
+        Es connecta a la generació vigent (només lectura).
+
+    - publish(matrix, uuids, has_vector) -> int
+        (Propietari) Escriu una generació nova en un segment nou, hi apunta
+        el control i esborra el nom del segment anterior. Els treballadors
+        que encara el tenen mapat el poden continuar fent servir.
+
+    - refresh() -> bool
+        (Treballador) Si hi ha una generació nova, s'hi connecta i allibera
+        l'anterior. Retorna True si ha canviat.
+
+    - release() -> None
+        Allibera els mapatges de generacions antigues que ja no es fan
+        servir (cal haver descartat els arrays que en depenen).
+
+    - close() / unlink()
+        close() allibera els mapatges d'aquest procés. unlink() (propietari)
+        a més esborra tots els segments.
+
+Notes:
+    - Els segments no es registren al resource_tracker de multiprocessing
+      (esborraria la memòria en sortir el primer procés que s'hi connecta):
+      el propietari els esborra amb unlink() o en sortir (atexit). Si el
+      propietari mor sense fer-ho, create() amb el mateix nom els recicla.
+    - Un segment no es pot alliberar mentre hi hagi arrays que el
+      referenciïn; en aquest cas es reintenta al següent refresh()/close().
+"""
+import atexit
+import inspect
+import struct
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+_MAGIC = b"EMBSHM01"
+_CONTROL = struct.Struct("<8sQ")        # magic, generació
+_HEADER = struct.Struct("<8sQQQ")       # magic, files, dimensió, bytes dels UUID
+_HEADER_SIZE = 64                       # la matriu comença alineada a 64 bytes
+_ATTACH_RETRIES = 5
+
+# Python >= 3.13 permet no registrar el segment al resource_tracker
+_HAS_TRACK = "track" in inspect.signature(shared_memory.SharedMemory.__init__).parameters
+
+
+def _open(name: str, create: bool = False, size: int = 0) -> shared_memory.SharedMemory:
+    if _HAS_TRACK:
+        return shared_memory.SharedMemory(name, create=create, size=size, track=False)
+    shm = shared_memory.SharedMemory(name, create=create, size=size)
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def _unlink(shm: shared_memory.SharedMemory) -> None:
+    if not _HAS_TRACK:
+        # unlink() dona de baixa el segment del tracker: abans l'hi tornem
+        resource_tracker.register(shm._name, "shared_memory")
+    shm.unlink()
+
+
+def _create(name: str, size: int) -> shared_memory.SharedMemory:
+    try:
+        return _open(name, create=True, size=size)
+    except FileExistsError:
+        # Segment d'un propietari anterior que no va acabar bé
+        _unlink(_open(name))
+        return _open(name, create=True, size=size)
+
+
+class SharedEmbeddings:
+    def __init__(self, name: str, owner: bool):
+        self.name = name
+        self.owner = owner
+        self.generation = 0
+        self.matrix = None
+        self.uuids = []
+        self.has_vector = None
+        self._control = None
+        self._segment = None
+        self._retired = []      # segments pendents d'alliberar
+
+    def __len__(self) -> int:
+        return len(self.uuids)
+
+    def __str__(self) -> str:
+        role = "propietari" if self.owner else "treballador"
+        return f"SharedEmbeddings '{self.name}' ({role}, generació {self.generation}, {len(self.uuids)} vectors)"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self.owner:
+            self.unlink()
+        else:
+            self.close()
+
+    @classmethod
+    def create(cls, name: str, matrix: np.ndarray, uuids: list, has_vector: np.ndarray):
+        shared = cls(name, owner=True)
+        shared._control = _create(name, _CONTROL.size)
+        _CONTROL.pack_into(shared._control.buf, 0, _MAGIC, 0)
+        atexit.register(shared.unlink)
+        shared.publish(matrix, uuids, has_vector)
+        return shared
+
+    @classmethod
+    def attach(cls, name: str):
+        shared = cls(name, owner=False)
+        shared._control = _open(name)
+        magic, _ = _CONTROL.unpack_from(shared._control.buf, 0)
+        if magic != _MAGIC:
+            shared._control.close()
+            raise ValueError(f"El segment '{name}' no conté embeddings compartits")
+        if not shared.refresh():
+            shared.close()
+            raise FileNotFoundError(f"No hi ha cap generació publicada a '{name}'")
+        return shared
+
+    def _segment_name(self, generation: int) -> str:
+        return f"{self.name}_{generation}"
+
+    def _map(self, segment: shared_memory.SharedMemory) -> None:
+        """Crea les vistes (sense còpia) sobre un segment de generació."""
+        magic, n, d, blob_size = _HEADER.unpack_from(segment.buf, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"El segment '{segment.name}' no conté embeddings compartits")
+        offset = _HEADER_SIZE
+        matrix = np.ndarray((n, d), dtype=np.float32, buffer=segment.buf, offset=offset)
+        offset += matrix.nbytes
+        has_vector = np.ndarray(n, dtype=bool, buffer=segment.buf, offset=offset)
+        offset += n
+        blob = bytes(segment.buf[offset:offset + blob_size])
+        if not self.owner:
+            matrix.flags.writeable = False
+            has_vector.flags.writeable = False
+        self.matrix = matrix
+        self.has_vector = has_vector
+        self.uuids = blob.decode("utf-8").split("\n") if n else []
+
+    def _retire(self, segment) -> None:
+        if segment is not None:
+            self._retired.append(segment)
+        self.release()
+
+    def release(self) -> None:
+        """Allibera els segments de generacions antigues que ja no es fan servir."""
+        still_used = []
+        for old in self._retired:
+            try:
+                old.close()
+            except BufferError:
+                # Encara hi ha arrays d'aquest segment en ús
+                still_used.append(old)
+        self._retired = still_used
+
+    def publish(self, matrix: np.ndarray, uuids: list, has_vector: np.ndarray) -> int:
+        if not self.owner:
+            raise PermissionError("Només el procés propietari pot publicar embeddings")
+        n, d = matrix.shape
+        blob = "\n".join(uuids).encode("utf-8")
+        generation = self.generation + 1
+        segment = _create(self._segment_name(generation), _HEADER_SIZE + n * d * 4 + n + len(blob))
+        _HEADER.pack_into(segment.buf, 0, _MAGIC, n, d, len(blob))
+        offset = _HEADER_SIZE
+        target = np.ndarray((n, d), dtype=np.float32, buffer=segment.buf, offset=offset)
+        target[:] = matrix
+        offset += n * d * 4
+        np.ndarray(n, dtype=bool, buffer=segment.buf, offset=offset)[:] = has_vector
+        offset += n
+        segment.buf[offset:offset + len(blob)] = blob
+        del target
+
+        # Canvi de generació: primer el control, després s'esborra l'antiga
+        previous = self._segment
+        self.matrix = self.has_vector = None
+        self._segment = segment
+        self.generation = generation
+        self._map(segment)
+        _CONTROL.pack_into(self._control.buf, 0, _MAGIC, generation)
+        if previous is not None:
+            _unlink(previous)
+            self._retire(previous)
+        return generation
+
+    def refresh(self) -> bool:
+        if self.owner or self._control is None:
+            return False
+        for _ in range(_ATTACH_RETRIES):
+            _, generation = _CONTROL.unpack_from(self._control.buf, 0)
+            if generation == 0 or generation == self.generation:
+                self._retire(None)
+                return False
+            try:
+                segment = _open(self._segment_name(generation))
+            except FileNotFoundError:
+                # El propietari ha publicat una altra generació mentrestant
+                continue
+            previous = self._segment
+            self.matrix = self.has_vector = None
+            self._segment = segment
+            self.generation = generation
+            self._map(segment)
+            self._retire(previous)
+            return True
+        return False
+
+    def close(self) -> None:
+        self.matrix = self.has_vector = None
+        self.uuids = []
+        self._retire(self._segment)
+        self._segment = None
+        if self._control is not None:
+            self._control.close()
+            self._control = None
+
+    def unlink(self) -> None:
+        if self.owner and self._control is not None:
+            if self._segment is not None:
+                _unlink(self._segment)
+            _unlink(self._control)
+            atexit.unregister(self.unlink)
+        self.close()
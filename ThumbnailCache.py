@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+ThumbnailCache.py : Memòria cau a disc de miniatures per a ImageViewer.
+
+Mostrar una imatge descodificant el PNG original sencer cada vegada és lent.
+Aquí cada imatge es descodifica una sola vegada a una miniatura JPEG (com a
+molt 'size' píxels, amb Image.draft/Image.thumbnail), que es desa a
+'cache_dir' i es reutilitza en endavant.
+
+Les miniatures s'identifiquen pel contingut de l'arxiu original (hash
+BLAKE2b), no pel path: dues còpies de la mateixa imatge comparteixen la
+miniatura, i una imatge modificada en genera una de nova.
+
+Mètodes:
+    - get(file: str) -> str
+        Retorna el path de la miniatura de 'file' (path absolut), creant-la
+        si cal. Si 'file' s'està descodificant en segon pla (prefetch),
+        n'espera el resultat. Retorna None si no es pot llegir.
+
+    - prefetch(files) -> int
+        Encarrega la descodificació dels arxius al pool de fils i retorna
+        immediatament quantes n'ha encarregat.
+
+    - stats() -> dict
+        Encerts, fallades, descodificacions, temps de descodificació i
+        d'espera, expulsions i mida actual de la memòria cau.
+
+    - close() -> None
+        Atura el pool de fils (cancel·la el que encara no ha començat).
+
+Notes:
+    - La mida total de 'cache_dir' queda limitada a 'max_bytes': quan se
+      supera, s'esborren les miniatures que fa més temps que no es fan
+      servir (LRU). L'ordre es conserva entre execucions amb el mtime de
+      cada miniatura, que s'actualitza a cada encert.
+    - El hash de cada arxiu es recorda mentre no en canviï (mida, mtime_ns).
+    - Les miniatures es desen en JPEG (RGB): es codifiquen i descodifiquen
+      molt més de pressa que en PNG i ocupen menys.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from PIL import Image
+
+# Mida màxima (amplada, alçada) de les miniatures
+THUMBNAIL_SIZE = (512, 512)
+# Mida màxima de la memòria cau a disc (bytes)
+CACHE_BYTES = 256 << 20
+JPEG_QUALITY = 90
+HASH_BLOCK = 1 << 20
+
+
+class ThumbnailCache:
+    def __init__(self, cache_dir: str, max_bytes: int = CACHE_BYTES,
+                 size: tuple = THUMBNAIL_SIZE, workers: int = 4):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.size = tuple(size)
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._pool = None
+        self._in_flight = {}            # path original -> Future
+        self._digests = {}              # path original -> (mida, mtime_ns, hash)
+        self._entries = OrderedDict()   # nom de la miniatura -> bytes (ordre LRU)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.evictions = 0
+        self.prefetched = 0
+        self.decodes = 0
+        self.decode_time = 0.0
+        self.wait_time = 0.0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        found = []
+        with os.scandir(cache_dir) as it:
+            for entry in it:
+                if not entry.is_file():
+                    continue
+                if entry.name.endswith(".tmp"):
+                    # Escriptura interrompuda d'una execució anterior
+                    os.remove(entry.path)
+                elif entry.name.endswith(".jpg"):
+                    stat = entry.stat()
+                    found.append((stat.st_mtime_ns, entry.name, stat.st_size))
+        for _, name, nbytes in sorted(found):
+            self._entries[name] = nbytes
+            self._bytes += nbytes
+        with self._lock:
+            self._evict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __str__(self) -> str:
+        return (f"ThumbnailCache '{self.cache_dir}' ({len(self._entries)} miniatures, "
+                f"{self._bytes / (1 << 20):.1f}/{self.max_bytes / (1 << 20):.0f} MB)")
+
+    def _digest(self, file: str) -> str:
+        stat = os.stat(file)
+        known = self._digests.get(file)
+        if known is not None and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known[2]
+        h = hashlib.blake2b(digest_size=16)
+        with open(file, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK), b""):
+                h.update(block)
+        digest = h.hexdigest()
+        self._digests[file] = (stat.st_size, stat.st_mtime_ns, digest)
+        return digest
+
+    def _evict(self) -> None:
+        # Cal tenir el lock. Es conserva sempre la miniatura més recent.
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            name, nbytes = self._entries.popitem(last=False)
+            self._bytes -= nbytes
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+    def _name(self, digest: str) -> str:
+        return f"{digest}_{self.size[0]}x{self.size[1]}.jpg"
+
+    def _thumbnail(self, file: str) -> tuple:
+        """Retorna (path de la miniatura, True si s'ha hagut de descodificar)."""
+        name = self._name(self._digest(file))
+        path = os.path.join(self.cache_dir, name)
+        with self._lock:
+            cached = name in self._entries
+            if cached:
+                self._entries.move_to_end(name)
+        if cached:
+            try:
+                os.utime(path)
+                return path, False
+            except FileNotFoundError:
+                # Esborrada per fora: es torna a generar
+                with self._lock:
+                    self._bytes -= self._entries.pop(name, 0)
+
+        start = time.perf_counter()
+        tmp_file = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with Image.open(file) as img:
+            # draft() redueix la descodificació als formats que ho permeten
+            # (JPEG); thumbnail() redueix primer per blocs (reducing_gap)
+            img.draft("RGB", self.size)
+            img.thumbnail(self.size, reducing_gap=2.0)
+            thumbnail = img if img.mode in ("RGB", "L") else img.convert("RGB")
+            thumbnail.save(tmp_file, "JPEG", quality=JPEG_QUALITY)
+        os.replace(tmp_file, path)
+        elapsed = time.perf_counter() - start
+
+        nbytes = os.path.getsize(path)
+        with self._lock:
+            self.decodes += 1
+            self.decode_time += elapsed
+            self._bytes += nbytes - self._entries.get(name, 0)
+            self._entries[name] = nbytes
+            self._entries.move_to_end(name)
+            self._evict()
+        return path, True
+
+    def _request(self, file: str) -> tuple:
+        """Retorna (Future, True si aquest fil l'ha de resoldre)."""
+        with self._lock:
+            future = self._in_flight.get(file)
+            if future is not None:
+                return future, False
+            future = self._in_flight[file] = Future()
+            return future, True
+
+    def _run(self, file: str, future: Future) -> None:
+        try:
+            future.set_result(self._thumbnail(file))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._in_flight.pop(file, None)
+
+    def get(self, file: str) -> str:
+        start = time.perf_counter()
+        future, owner = self._request(file)
+        if owner:
+            self._run(file, future)
+        try:
+            path, decoded = future.result()
+        except Exception as e:
+            print(f"ERROR (ThumbnailCache): No s'ha pogut crear la miniatura de {file}: {e}")
+            with self._lock:
+                self.errors += 1
+            return None
+        with self._lock:
+            # Una miniatura que ha descodificat el prefetch compta com a encert
+            if decoded and owner:
+                self.misses += 1
+            else:
+                self.hits += 1
+            self.wait_time += time.perf_counter() - start
+        return path
+
+    def prefetch(self, files) -> int:
+        count = 0
+        for file in files:
+            # Ja desada (segons el hash conegut): no cal encarregar-la
+            known = self._digests.get(file)
+            if known is not None and self._name(known[2]) in self._entries:
+                continue
+            future, owner = self._request(file)
+            if not owner:
+                continue
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers,
+                                                thread_name_prefix="thumbnail")
+            self._pool.submit(self._run, file, future)
+            count += 1
+        with self._lock:
+            self.prefetched += count
+        return count
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests if requests else 0.0,
+                "errors": self.errors,
+                "prefetched": self.prefetched,
+                "decodes": self.decodes,
+                "decode_time": self.decode_time,
+                "mean_decode_ms": 1000 * self.decode_time / self.decodes if self.decodes else 0.0,
+                "mean_wait_ms": 1000 * self.wait_time / (requests + self.errors) if requests + self.errors else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+        # Les peticions cancel·lades no s'arribaran a resoldre
+        with self._lock:
+            pending, self._in_flight = self._in_flight, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(RuntimeError("prefetch cancel·lat"))
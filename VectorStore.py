@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+VectorStore.py : Magatzem binari d'embeddings per a RecommenderSystem.
+
+L'arxiu de vectors JSON ({"vectors": {nom: {"image_embedding": [...]}}})
+es pot convertir una sola vegada a un magatzem binari:
+    - <base>.npy       Matriu (N x d) float32 amb els vectors ja normalitzats
+                       (norma L2 = 1; els que no tenen embedding, a zero).
+    - <base>.keys.json Nom (sense extensió) de cada fila, en ordre, i les
+                       files sense embedding.
+El magatzem s'obre amb np.memmap: l'arrencada no llegeix els vectors i les
+pàgines de l'arxiu es comparteixen entre tots els processos que l'obren.
+
+Mètodes:
+    - VectorStore.from_json(path: str) -> VectorStore
+        Llegeix l'arxiu JSON de manera incremental (JsonStream), sense
+        carregar tot el document.
+
+    - VectorStore.open(path: str) -> VectorStore
+        Obre un magatzem binari (.npy) en mode memmap de només lectura.
+
+    - save(path: str) -> None
+        Desa el magatzem en format binari (escriptura atòmica).
+
+    - VectorStore.convert(json_path: str, path: str = None) -> str
+        Conversió d'un sol cop de JSON a binari. Retorna el path del .npy.
+
+Atributs:
+    - keys: llista de noms, un per fila.
+    - matrix: matriu (N x d) float32 normalitzada (np.memmap si s'ha obert).
+    - has_vector: array booleà, False per a les files sense embedding.
+"""
+import json
+import os
+
+import numpy as np
+
+import JsonStream
+
+
+def keys_path(path: str) -> str:
+    """Path de l'índex de claus que acompanya el .npy 'path'."""
+    return os.path.splitext(path)[0] + ".keys.json"
+
+
+class VectorStore:
+    def __init__(self, keys=None, matrix=None, has_vector=None):
+        self.keys = keys if keys is not None else []
+        self.matrix = matrix if matrix is not None else np.zeros((0, 0), dtype=np.float32)
+        self.has_vector = has_vector if has_vector is not None else np.zeros(0, dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __str__(self) -> str:
+        return f"VectorStore ({len(self.keys)} vectors, dimensió {self.matrix.shape[1]})"
+
+    @classmethod
+    def from_json(cls, path: str):
+        # Com amb json.load, una clau repetida conserva la posició del primer
+        # cop que apareix i el valor de l'últim
+        vectors = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for member, value in JsonStream.iter_members(f, streamed=("vectors",)):
+                if len(member) != 2:
+                    continue
+                vec = value.get("image_embedding") if isinstance(value, dict) else None
+                vectors[member[1]] = np.asarray(vec, dtype=np.float32) if vec else None
+
+        dim = max((len(vec) for vec in vectors.values() if vec is not None), default=0)
+        matrix = np.zeros((len(vectors), dim), dtype=np.float32)
+        has_vector = np.zeros(len(vectors), dtype=bool)
+        for row, vec in enumerate(vectors.values()):
+            if vec is not None:
+                matrix[row, :len(vec)] = vec
+                has_vector[row] = True
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return cls(list(vectors), matrix, has_vector)
+
+    @classmethod
+    def open(cls, path: str):
+        with open(keys_path(path), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        matrix = np.load(path, mmap_mode="r")
+        keys = index["keys"]
+        if matrix.ndim != 2 or len(matrix) != len(keys):
+            raise ValueError(f"L'índex de claus no correspon a {path}")
+        has_vector = np.ones(len(keys), dtype=bool)
+        has_vector[index.get("missing", [])] = False
+        return cls(keys, matrix, has_vector)
+
+    def save(self, path: str) -> None:
+        # Primer el .npy i després les claus: open() valida que coincideixin
+        tmp = path + ".tmp"
+        with open(tmp, 'wb') as f:
+            np.save(f, np.ascontiguousarray(self.matrix, dtype=np.float32))
+        os.replace(tmp, path)
+
+        index = {"keys": self.keys, "missing": np.flatnonzero(~self.has_vector).tolist()}
+        tmp = keys_path(path) + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(tmp, keys_path(path))
+
+    @classmethod
+    def convert(cls, json_path: str, path: str = None) -> str:
+        path = path or os.path.splitext(json_path)[0] + ".npy"
+        cls.from_json(json_path).save(path)
+        return path
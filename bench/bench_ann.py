@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+bench_ann.py : recall@k i latència de find_similar_images(mode="ann")
+(índex IVF) respecte de la cerca exacta.
+
+    python bench/bench_ann.py --vectors 100000 --nprobe 1 4 8 16 64
+    python bench/bench_ann.py --vectors 100000 --clusters 0     # gaussiana isotròpica
+
+recall@k = fracció dels k veïns exactes que retorna la cerca aproximada,
+mitjana sobre --queries consultes. Amb --clusters 0 les dades no tenen
+estructura de grups, el pitjor cas per a IVF.
+"""
+import argparse
+import random
+import tempfile
+import time
+
+import synthetic
+from recommender import make_recommender
+
+
+def run(recommender, queries: list, k: int, mode: str, nprobe: int = None) -> tuple:
+    recommender.cache.invalidate()
+    start = time.perf_counter()
+    results = [recommender.find_similar_images(uuid, k, mode=mode, nprobe=nprobe).images
+               for uuid in queries]
+    return results, 1000 * (time.perf_counter() - start) / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--vectors", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--clusters", type=int, default=256)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nlist", type=int, default=None, help="per defecte, el de IVFIndex")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 64])
+    args = parser.parse_args()
+
+    matrix = synthetic.make_vectors(args.vectors, args.dim, clusters=args.clusters or None)
+    with tempfile.TemporaryDirectory() as directory:
+        recommender = make_recommender(directory, matrix)
+        queries = random.Random(0).sample(recommender.row_uuids, args.queries)
+
+        start = time.perf_counter()
+        recommender.build_ann_index(nlist=args.nlist)
+        build = time.perf_counter() - start
+        print(f"{args.vectors} vectors x {args.dim}, clusters={args.clusters}, "
+              f"nlist={recommender.ann.nlist}, construcció {build:.1f} s")
+
+        exact, exact_ms = run(recommender, queries, args.k, "exact")
+        print(f"  exacte           {exact_ms:8.2f} ms/consulta")
+        for nprobe in args.nprobe:
+            approx, ms = run(recommender, queries, args.k, "ann", nprobe)
+            recall = sum(len(set(a) & set(e)) / len(e) for a, e in zip(approx, exact) if e) / len(exact)
+            print(f"  ann nprobe={nprobe:<4} {ms:8.2f} ms/consulta  recall@{args.k} {recall:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+bench_bitmap.py : AND / OR de dos conjunts de resultats grans, amb
+llistes d'UUID (and_operator / or_operator originals, via set) contra
+Bitmap sobre files de RowIndex.
+
+    python bench/bench_bitmap.py --rows 1000000 --density 0.5
+"""
+import argparse
+import random
+import time
+
+import synthetic
+from Bitmap import RowIndex
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, 1000 * (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--density", type=float, default=0.5)
+    args = parser.parse_args()
+
+    uuids = synthetic.random_uuids(args.rows)
+    rng = random.Random(0)
+    list1 = [uuid for uuid in uuids if rng.random() < args.density]
+    list2 = [uuid for uuid in uuids if rng.random() < args.density]
+    rows = RowIndex(uuids)
+    bitmap1, bitmap2 = rows.bitmap(list1), rows.bitmap(list2)
+    print(f"{args.rows} files, resultats de {len(list1)} i {len(list2)} UUID")
+
+    list_and, ms = timed(lambda a, b: list(set(a) & set(b)), list1, list2)
+    print(f"  llista AND     {ms:9.2f} ms")
+    list_or, ms = timed(lambda a, b: list(set(a) | set(b)), list1, list2)
+    print(f"  llista OR      {ms:9.2f} ms")
+    bitmap_and, ms = timed(lambda a, b: a & b, bitmap1, bitmap2)
+    print(f"  Bitmap AND     {ms:9.2f} ms")
+    bitmap_or, ms = timed(lambda a, b: a | b, bitmap1, bitmap2)
+    print(f"  Bitmap OR      {ms:9.2f} ms")
+    _, ms = timed(lambda a: rows.live() - a, bitmap1)
+    print(f"  Bitmap NOT     {ms:9.2f} ms (primer cop, construeix les files vives)")
+    _, ms = timed(lambda a: rows.live() - a, bitmap1)
+    print(f"  Bitmap NOT     {ms:9.2f} ms")
+    and_uuids, ms = timed(rows.to_uuids, bitmap_and)
+    print(f"  to_uuids (AND) {ms:9.2f} ms")
+
+    same = set(and_uuids) == set(list_and) and set(rows.to_uuids(bitmap_or)) == set(list_or)
+    print(f"  Resultats idèntics: {same}")
+
+
+if __name__ == "__main__":
+    main()
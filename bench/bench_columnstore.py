@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+bench_columnstore.py : Memòria i temps d'accés de la base de dades
+d'ImageData en diccionari de diccionaris contra ColumnStore.
+
+    python bench/bench_columnstore.py --rows 1000000
+
+La memòria es mesura amb tracemalloc i inclou els strings de prompt; els
+UUID es generen abans de començar a mesurar (són els mateixos objectes a
+les dues representacions).
+"""
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+
+import synthetic
+from ColumnStore import ColumnStore
+
+GETTER_FIELDS = ("prompt", "model", "seed", "cfg_scale", "steps", "sampler", "generated", "created_date")
+
+
+def build(kind: str, uuids: list, seed: int):
+    rng = random.Random(seed)
+    store = {} if kind == "dict" else ColumnStore()
+    for i, uuid in enumerate(uuids):
+        store[uuid] = synthetic.random_metadata(rng, i)
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=400_000)
+    args = parser.parse_args()
+
+    uuids = synthetic.random_uuids(args.rows)
+    sample = random.Random(1).sample(uuids, min(args.lookups // len(GETTER_FIELDS), len(uuids)))
+    values = {}
+    for kind in ("dict", "columnar"):
+        gc.collect()
+        tracemalloc.start()
+        store = build(kind, uuids, seed=0)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        values[kind] = [store[uuid].get(field) for uuid in sample for field in GETTER_FIELDS]
+        elapsed = time.perf_counter() - start
+        print(f"  {kind:<9} {memory / 2**20:8.1f} MiB  {len(values[kind])} getters {elapsed:.2f} s")
+        del store
+    print(f"  Valors idèntics: {values['dict'] == values['columnar']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+bench_gallery.py : Operacions barrejades sobre una Gallery gran, amb la
+implementació original (llista) contra l'actual (deque + comptador).
+
+    python bench/bench_gallery.py --sizes 10000 100000 1000000 --list-max 100000
+
+Per a cada N: N add_image_at_end i després N operacions aleatòries (50%
+afegir, 20% treure la primera, 15% treure l'última, 15% consulta de
+pertinença). Es comprova que el contingut final i les respostes coincideixen.
+"""
+import argparse
+import random
+import time
+
+import synthetic
+from Gallery import Gallery
+
+
+class ListGallery:
+    """Les operacions de Gallery abans del deque (llista, cerca lineal)."""
+
+    def __init__(self):
+        self.uuids = []
+
+    def __contains__(self, uuid: str) -> bool:
+        return uuid in self.uuids
+
+    def add_image_at_end(self, uuid: str) -> None:
+        if uuid and uuid not in self.uuids:
+            self.uuids.append(uuid)
+
+    def remove_first_image(self) -> None:
+        if self.uuids:
+            self.uuids.pop(0)
+
+    def remove_last_image(self) -> None:
+        if self.uuids:
+            self.uuids.pop()
+
+
+def operations(n: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    uuids = synthetic.random_uuids(2 * n, seed)
+    ops = [("add", uuid) for uuid in uuids[:n]]
+    for _ in range(n):
+        r = rng.random()
+        if r < 0.5:
+            ops.append(("add", uuids[rng.randrange(2 * n)]))
+        elif r < 0.7:
+            ops.append(("first", None))
+        elif r < 0.85:
+            ops.append(("last", None))
+        else:
+            ops.append(("in", uuids[rng.randrange(2 * n)]))
+    return ops
+
+
+def run(gallery, ops: list) -> tuple:
+    answers = []
+    start = time.perf_counter()
+    for op, uuid in ops:
+        if op == "add":
+            gallery.add_image_at_end(uuid)
+        elif op == "first":
+            gallery.remove_first_image()
+        elif op == "last":
+            gallery.remove_last_image()
+        else:
+            answers.append(uuid in gallery)
+    return time.perf_counter() - start, list(gallery.uuids), answers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--list-max", type=int, default=10_000,
+                        help="N màxima per a la versió amb llista (és quadràtica)")
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        ops = operations(n)
+        elapsed, contents, answers = run(Gallery(), ops)
+        line = f"  N={n:<9} deque {elapsed:8.3f} s"
+        if n <= args.list_max:
+            list_elapsed, list_contents, list_answers = run(ListGallery(), ops)
+            same = contents == list_contents and answers == list_answers
+            line += f"   llista {list_elapsed:8.3f} s   idèntics: {same}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+bench_print.py : Llistar moltes imatges amb print_image (una per una)
+contra print_images (una sola passada, sortida en blocs).
+
+    python bench/bench_print.py --images 100000 --out devnull
+    python bench/bench_print.py --images 100000 --out pipe --columnar
+
+--out pipe escriu a una canonada cap a un procés 'cat' (com quan la
+sortida es redirigeix a un altre programa); devnull, a /dev/null.
+"""
+import argparse
+import contextlib
+import os
+import random
+import subprocess
+import time
+
+import synthetic
+from ImageData import ImageData
+from ImageViewer import ImageViewer
+
+
+def make_image_data(n: int, columnar: bool) -> tuple:
+    image_data = ImageData(columnar=columnar)
+    uuids = synthetic.random_uuids(n)
+    rng = random.Random(0)
+    for i, uuid in enumerate(uuids):
+        image_data.database[uuid] = synthetic.random_metadata(rng, i)
+    return image_data, uuids
+
+
+@contextlib.contextmanager
+def output(kind: str):
+    if kind == "devnull":
+        with open(os.devnull, 'w', encoding='utf-8') as out:
+            yield out
+        return
+    with subprocess.Popen(["cat"], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                          text=True, encoding='utf-8') as process:
+        yield process.stdin
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", type=int, default=100_000)
+    parser.add_argument("--out", choices=("devnull", "pipe"), default="devnull")
+    parser.add_argument("--columnar", action="store_true")
+    parser.add_argument("--formats", nargs="+", default=["table", "csv", "jsonl"])
+    args = parser.parse_args()
+
+    image_data, uuids = make_image_data(args.images, args.columnar)
+    viewer = ImageViewer(image_data)
+    print(f"{args.images} imatges -> {args.out} ({'ColumnStore' if args.columnar else 'dict'})")
+
+    with output(args.out) as out:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(out):
+            for uuid in uuids:
+                viewer.print_image(uuid)
+        out.flush()
+        print(f"  print_image x{args.images:<8}  {time.perf_counter() - start:7.2f} s")
+
+        for format in args.formats:
+            start = time.perf_counter()
+            viewer.print_images(uuids, format=format, out=out)
+            print(f"  print_images ({format:<5})    {time.perf_counter() - start:7.2f} s")
+
+
+if __name__ == "__main__":
+    main()
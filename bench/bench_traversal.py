@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+bench_traversal.py : ImageFiles.reload_fs seqüencial (os.walk) contra el
+recorregut paral·lel (workers=N) sobre arbres sintètics.
+
+    python bench/bench_traversal.py --layout wide --latency 2
+    python bench/bench_traversal.py --layout deep --workers 4 16
+
+--latency simula un sistema d'arxius remot (NFS): cada os.scandir espera
+aquests mil·lisegons abans de llistar el directori. Sense latència (disc
+local), el GIL fa que el pool sigui més lent que os.walk.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import synthetic
+from ImageFiles import ImageFiles
+
+
+def slow_scandir(latency: float):
+    scandir = os.scandir
+
+    def wrapper(*args, **kwargs):
+        time.sleep(latency)
+        return scandir(*args, **kwargs)
+    return wrapper
+
+
+def measure(root: str, workers: int, repeat: int) -> tuple:
+    best = float("inf")
+    files = None
+    for _ in range(repeat):
+        image_files = ImageFiles()
+        start = time.perf_counter()
+        image_files.reload_fs(root, workers=workers)
+        best = min(best, time.perf_counter() - start)
+        files = image_files.current_files
+    return best, files
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--layout", choices=("wide", "deep"), default="wide")
+    parser.add_argument("--dirs", type=int, default=2000)
+    parser.add_argument("--depth", type=int, default=40)
+    parser.add_argument("--files", type=int, default=25, help="arxius per directori")
+    parser.add_argument("--workers", type=int, nargs="+", default=[4, 16, 32])
+    parser.add_argument("--latency", type=float, default=0.0, help="ms per readdir")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        count = synthetic.make_tree(root, args.layout, args.dirs, args.files, args.depth)
+        print(f"Arbre '{args.layout}': {count} arxius, latència {args.latency} ms")
+        if args.latency:
+            os.scandir = slow_scandir(args.latency / 1000)
+
+        baseline, expected = measure(root, None, args.repeat)
+        print(f"  os.walk      {1000 * baseline:9.1f} ms  ({len(expected)} PNG)")
+        for workers in args.workers:
+            elapsed, files = measure(root, workers, args.repeat)
+            status = "" if files == expected else "  RESULTAT DIFERENT!"
+            print(f"  workers={workers:<4} {1000 * elapsed:9.1f} ms  "
+                  f"x{baseline / elapsed:.2f}{status}")
+
+
+if __name__ == "__main__":
+    main()
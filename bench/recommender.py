@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+recommender.py : Crea un RecommenderSystem sobre vectors sintètics, per als
+benchmarks de similitud (bench_similarity.py i bench_ann.py).
+
+Els vectors es desen a un magatzem binari (VectorStore) i els UUID es
+generen amb ImageID, com en una col·lecció real.
+"""
+import os
+
+import numpy as np
+
+from ImageID import ImageID
+from RecommenderSystem import RecommenderSystem
+from VectorStore import VectorStore
+
+
+def make_recommender(directory: str, matrix: np.ndarray) -> RecommenderSystem:
+    keys = [f"img{i:07d}" for i in range(len(matrix))]
+    path = os.path.join(directory, "vectors.npy")
+    VectorStore(keys, matrix, np.ones(len(keys), dtype=bool)).save(path)
+    image_id = ImageID()
+    for key in keys:
+        image_id.generate_uuid(key + ".png")
+    recommender = RecommenderSystem(path, image_id=image_id)
+    recommender.preprocess()
+    return recommender
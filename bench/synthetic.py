@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+synthetic.py : Generadors de dades sintètiques per als benchmarks de bench/.
+
+Totes les funcions són deterministes a partir de 'seed', de manera que dues
+execucions amb els mateixos paràmetres generen exactament les mateixes dades.
+
+Funcions:
+    - make_tree(root, layout, ...) -> int
+        Crea un arbre de directoris amb PNG buits ("wide": molts directoris
+        a un sol nivell; "deep": una cadena de directoris). Retorna el
+        nombre d'arxius creats.
+    - make_png(path, size, text, compressed, international) -> None
+        Escriu un PNG RGB amb chunks de text: tEXt, zTXt (claus de
+        'compressed') o iTXt comprimit (claus de 'international').
+    - random_metadata(rng, i) -> dict
+        Metadades d'imatge amb la mateixa forma que les de la col·lecció.
+    - random_uuids(n, seed) -> list
+    - make_vectors(n, d, clusters, seed) -> np.ndarray
+        Matriu (n x d) float32 normalitzada. Amb 'clusters' els vectors
+        s'agrupen al voltant de centres (dades semblants a embeddings
+        reals); sense, és una gaussiana isotròpica (el pitjor cas per a IVF).
+"""
+import os
+import random
+import sys
+import uuid as uuid_module
+
+import numpy as np
+
+# Els benchmarks importen els mòduls del projecte des de l'arrel del repositori
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+MODELS = ("SD2", "SDXL", "DALL-E", "Midjourney", "Kandinsky")
+SAMPLERS = ("Euler a", "DPM++ 2M", "DDIM", "LMS", "Heun")
+WORDS = ("cyberpunk", "city", "neon", "forest", "castle", "portrait", "sunset",
+         "ocean", "robot", "dragon", "watercolor", "cinematic", "night", "mountain")
+
+
+def make_tree(root: str, layout: str = "wide", dirs: int = 2000, files_per_dir: int = 25,
+              depth: int = 40) -> int:
+    """'wide': 'dirs' directoris germans; 'deep': 'depth' directoris imbricats."""
+    count = 0
+    if layout == "wide":
+        paths = [os.path.join(root, f"d{i:05d}") for i in range(dirs)]
+    elif layout == "deep":
+        paths = []
+        current = root
+        for i in range(depth):
+            current = os.path.join(current, f"level{i:03d}")
+            paths.append(current)
+    else:
+        raise ValueError(f"Disposició desconeguda: {layout} (wide o deep)")
+    for path in paths:
+        os.makedirs(path, exist_ok=True)
+        for j in range(files_per_dir):
+            # Un de cada cinc arxius no és un PNG (s'ha de filtrar)
+            name = f"img{count:07d}.png" if j % 5 else f"notes{count:07d}.txt"
+            open(os.path.join(path, name), 'wb').close()
+            count += 1
+    return count
+
+
+def make_png(path: str, size: tuple = (1024, 1024), text: dict = None,
+             compressed: tuple = (), international: tuple = (), seed: int = 0) -> None:
+    """PNG RGB amb soroll (perquè la descompressió dels píxels costi com una imatge real)."""
+    from PIL import Image
+    from PIL.PngImagePlugin import PngInfo
+
+    info = PngInfo()
+    for key, value in (text or {}).items():
+        if key in international:
+            info.add_itxt(key, value, zip=True)
+        elif key in compressed:
+            info.add_text(key, value, zip=True)
+        else:
+            info.add_text(key, value)
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    Image.fromarray(pixels, "RGB").save(path, pnginfo=info)
+
+
+def random_metadata(rng: random.Random, i: int) -> dict:
+    prompt = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 20)))
+    return {
+        "file_path": f"generated_images/batch{i // 1000:04d}/img{i:07d}.png",
+        "prompt": prompt,
+        "seed": str(rng.getrandbits(32)),
+        "cfg_scale": str(rng.choice((5, 6, 7, 7.5, 8, 9))),
+        "steps": str(rng.choice((20, 25, 30, 40, 50))),
+        "sampler": rng.choice(SAMPLERS),
+        "model": rng.choice(MODELS),
+        "generated": "true",
+        "created_date": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "width": 1024,
+        "height": 1024,
+    }
+
+
+def random_uuids(n: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    return [str(uuid_module.UUID(int=rng.getrandbits(128), version=4)) for _ in range(n)]
+
+
+def make_vectors(n: int, d: int = 128, clusters: int = None, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    if clusters:
+        centres = rng.standard_normal((clusters, d)).astype(np.float32)
+        labels = rng.integers(0, clusters, n)
+        matrix = centres[labels] + 0.3 * rng.standard_normal((n, d)).astype(np.float32)
+    else:
+        matrix = rng.standard_normal((n, d)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix
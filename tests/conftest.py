@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+"""
+conftest.py : Els tests importen els mòduls del projecte des de l'arrel.
+
+Els mòduls que depenen de cfg (ImageData, Gallery, ...) només es proven si
+cfg és importable; la resta no en depèn.
+"""
+import os
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
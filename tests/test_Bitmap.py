@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+test_Bitmap.py : Bitmap i RowIndex, tant amb poques files (camí bit a bit)
+com amb moltes (camí per bytes).
+"""
+import random
+
+import pytest
+
+from Bitmap import SPARSE_ROWS, Bitmap, RowIndex
+
+
+@pytest.mark.parametrize("count", [0, 1, SPARSE_ROWS, SPARSE_ROWS + 1, 1000, 30000])
+def test_from_rows_and_iter_round_trip(count):
+    size = 100_000
+    rows = sorted(random.Random(count).sample(range(size), count))
+    bitmap = Bitmap.from_rows(iter(rows), size)
+    assert list(bitmap) == rows
+    assert len(bitmap) == count
+    assert all(row in bitmap for row in rows[:50])
+
+
+def test_edges_of_the_universe():
+    for rows in ([0], [7, 8], [0, 63, 64, 65], list(range(0, 4096, 3)), [99_999]):
+        assert list(Bitmap.from_rows(rows, 100_000)) == rows
+
+
+def test_set_operations_match_python_sets():
+    rng = random.Random(1)
+    size = 5000
+    a = set(rng.sample(range(size), 1200))
+    b = set(rng.sample(range(size), 3))
+    bitmap_a, bitmap_b = Bitmap.from_rows(a, size), Bitmap.from_rows(b, size)
+    assert list(bitmap_a & bitmap_b) == sorted(a & b)
+    assert list(bitmap_a | bitmap_b) == sorted(a | b)
+    assert list(bitmap_a - bitmap_b) == sorted(a - b)
+    assert list(bitmap_a ^ bitmap_b) == sorted(a ^ b)
+
+
+def test_row_index_keeps_insertion_order_and_holes():
+    rows = RowIndex(["a", "b", "c"])
+    rows.remove("b")
+    assert rows.add("b") == 3
+    assert rows.to_uuids(rows.live()) == ["a", "c", "b"]
+    assert rows.to_uuids(rows.bitmap(["c", "zzz", "a"])) == ["a", "c"]
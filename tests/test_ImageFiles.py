@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+test_ImageFiles.py : Escaneig incremental i mode vigilància (inotify i
+polling) d'ImageFiles sobre arbres temporals.
+"""
+import errno
+import os
+import time
+
+import pytest
+
+import ImageFiles as image_files_module
+from ImageFiles import ImageFiles
+
+
+def touch(path, data: bytes = b"") -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def make_tree(root) -> None:
+    touch(os.path.join(root, "a.png"))
+    touch(os.path.join(root, "sub", "b.PNG"))
+    touch(os.path.join(root, "sub", "notes.txt"))
+    touch(os.path.join(root, "sub", "deep", "c.png"))
+
+
+def wait_for(check, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if check():
+            return True
+        time.sleep(0.02)
+    return check()
+
+
+def checkpoint_until(files: ImageFiles, root: str, added=(), removed=()) -> tuple:
+    """Fa punts de control fins que s'han vist totes les altes i baixes esperades."""
+    seen_added, seen_removed = set(), set()
+
+    def check():
+        files.reload_fs(root)
+        seen_added.update(files.files_added())
+        seen_removed.update(files.files_removed())
+        return set(added) <= seen_added and set(removed) <= seen_removed
+    wait_for(check)
+    return seen_added, seen_removed
+
+
+def inotify_available() -> bool:
+    try:
+        image_files_module._Inotify().close()
+    except (OSError, AttributeError):
+        return False
+    return True
+
+
+def test_incremental_scan_detects_in_place_rewrite(tmp_path):
+    root = str(tmp_path)
+    make_tree(root)
+    files = ImageFiles()
+    files.reload_fs(root, incremental=True)
+    assert files.current_files == {"a.png", "b.PNG", "c.png"}
+
+    # Mateixa mida i directori sense canvis de mtime: només canvia l'arxiu
+    path = os.path.join(root, "sub", "b.PNG")
+    touch(path, b"x")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    files.reload_fs(root, incremental=True)
+    assert files.files_modified() == ["b.PNG"]
+    assert files.files_added() == [] and files.files_removed() == []
+
+
+def test_parallel_scan_matches_os_walk(tmp_path):
+    root = str(tmp_path)
+    make_tree(root)
+    serial, parallel = ImageFiles(), ImageFiles()
+    serial.reload_fs(root)
+    parallel.reload_fs(root, workers=4)
+    assert serial.current_files == parallel.current_files == {"a.png", "b.PNG", "c.png"}
+
+
+@pytest.mark.parametrize("backend", ["poll", "inotify"])
+def test_watch_reports_changes(tmp_path, backend):
+    if backend == "inotify" and not inotify_available():
+        pytest.skip("inotify no disponible")
+    root = str(tmp_path)
+    make_tree(root)
+    files = ImageFiles()
+    files.start_watch(root, backend=backend, poll_interval=0.05, coalesce=0.01)
+    try:
+        # L'escaneig inicial el fa start_watch
+        assert files.current_files == {"a.png", "b.PNG", "c.png"}
+
+        touch(os.path.join(root, "new.png"))
+        touch(os.path.join(root, "sub", "newdir", "n.png"))
+        os.remove(os.path.join(root, "sub", "deep", "c.png"))
+        added, removed = checkpoint_until(files, root, {"new.png", "n.png"}, {"c.png"})
+        assert added == {"new.png", "n.png"}
+        assert removed == {"c.png"}
+    finally:
+        files.stop_watch()
+    assert files.current_files == {"a.png", "b.PNG", "new.png", "n.png"}
+
+
+def test_watch_catches_files_created_before_the_watch_exists(tmp_path, monkeypatch):
+    if not inotify_available():
+        pytest.skip("inotify no disponible")
+    root = str(tmp_path)
+    make_tree(root)
+    add_watch = ImageFiles._add_watch
+    created = []
+
+    def racy_add_watch(self, rel_dir):
+        # Un arxiu que apareix després de l'escaneig però abans dels watches
+        if not created:
+            touch(os.path.join(root, "sub", "deep", "late.png"))
+            created.append(True)
+        add_watch(self, rel_dir)
+
+    monkeypatch.setattr(ImageFiles, "_add_watch", racy_add_watch)
+    files = ImageFiles()
+    files.start_watch(root, backend="inotify", coalesce=0.01)
+    try:
+        added, _ = checkpoint_until(files, root, {"late.png"})
+        assert "late.png" in added
+    finally:
+        files.stop_watch()
+
+
+def test_watch_falls_back_to_polling_when_watches_run_out(tmp_path, monkeypatch, capsys):
+    if not inotify_available():
+        pytest.skip("inotify no disponible")
+
+    def no_space(self, path):
+        raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC), path)
+
+    monkeypatch.setattr(image_files_module._Inotify, "add_watch", no_space)
+    root = str(tmp_path)
+    make_tree(root)
+    files = ImageFiles()
+    files.start_watch(root, backend="inotify", poll_interval=0.05)
+    try:
+        assert "polling" in capsys.readouterr().out
+        assert files._inotify is None
+        touch(os.path.join(root, "sub", "deep", "polled.png"))
+        added, _ = checkpoint_until(files, root, {"polled.png"})
+        assert "polled.png" in added
+    finally:
+        files.stop_watch()
+
+
+def test_reload_other_path_stops_watching(tmp_path, capsys):
+    watched, other = tmp_path / "watched", tmp_path / "other"
+    make_tree(str(watched))
+    touch(str(other / "x.png"))
+    files = ImageFiles()
+    files.start_watch(str(watched), backend="poll", poll_interval=0.05)
+    files.reload_fs(str(other))
+    assert "WARNING" in capsys.readouterr().out
+    assert files._watch_thread is None
+    assert files.current_files == {"x.png"}
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+test_JsonStream.py : iter_members ha de donar el mateix que json.loads per
+a qualsevol mida de bloc, i fallar on json.loads falla.
+"""
+import io
+import json
+import random
+
+import pytest
+
+import JsonStream
+
+CHUNK_SIZES = (1, 2, 3, 7, 16, 64, 1 << 16)
+
+
+class ChunkedFile(io.StringIO):
+    """Arxiu que retorna com a molt 'chunk' caràcters per lectura."""
+
+    def __init__(self, text: str, chunk: int):
+        super().__init__(text)
+        self.chunk = chunk
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.chunk:
+            size = self.chunk
+        return super().read(size)
+
+
+def random_value(rng: random.Random, depth: int = 0):
+    kind = rng.randrange(8 if depth < 3 else 5)
+    if kind == 0:
+        return rng.randint(-10**12, 10**12)
+    if kind == 1:
+        return rng.choice((0.5, -1.25e-7, 3.0e21, 1.5, 123456.789))
+    if kind == 2:
+        return "".join(rng.choice('ab "\\/\n\té€😀,:{}[]') for _ in range(rng.randrange(12)))
+    if kind == 3:
+        return rng.choice((True, False, None))
+    if kind == 4:
+        return ""
+    if kind == 5:
+        return [random_value(rng, depth + 1) for _ in range(rng.randrange(6))]
+    return {f"k{i}": random_value(rng, depth + 1) for i in range(rng.randrange(6))}
+
+
+def parse(text: str, chunk: int, streamed=()) -> list:
+    return list(JsonStream.iter_members(ChunkedFile(text, chunk), streamed=streamed, chunk_size=chunk))
+
+
+def rebuild(members: list) -> dict:
+    """Torna a muntar el document a partir de les parelles (path, valor)."""
+    document = {}
+    for path, value in members:
+        if len(path) == 1:
+            document[path[0]] = value
+        elif isinstance(path[1], int):
+            document.setdefault(path[0], []).append(value)
+        else:
+            document.setdefault(path[0], {})[path[1]] = value
+    return document
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_documents_match_json_loads(seed):
+    rng = random.Random(seed)
+    document = {f"m{i}": random_value(rng) for i in range(rng.randrange(1, 8))}
+    document["images"] = [random_value(rng) for _ in range(rng.randrange(1, 20))]
+    document["vectors"] = {f"img{i}": {"image_embedding": [rng.random() for _ in range(4)]}
+                           for i in range(rng.randrange(1, 10))}
+    indent = rng.choice((None, 0, 2))
+    text = json.dumps(document, indent=indent, ensure_ascii=rng.random() < 0.5)
+    for chunk in CHUNK_SIZES:
+        members = parse(text, chunk, streamed=("images", "vectors"))
+        assert rebuild(members) == json.loads(text)
+
+
+def test_streamed_members_are_yielded_per_element():
+    text = '{"gallery_name": "Cyberpunk", "images": ["a.png", "b.png"], "vectors": {"a": {"x": 1}}}'
+    assert parse(text, 4, streamed=("images", "vectors")) == [
+        (("gallery_name",), "Cyberpunk"),
+        (("images", 0), "a.png"),
+        (("images", 1), "b.png"),
+        (("vectors", "a"), {"x": 1}),
+    ]
+    assert parse(text, 4) == [(("gallery_name",), "Cyberpunk"),
+                              (("images",), ["a.png", "b.png"]),
+                              (("vectors",), {"a": {"x": 1}})]
+
+
+@pytest.mark.parametrize("text", ['{"images": []}', '{"images": {}}', '{}', ' { } '])
+def test_empty_containers(text):
+    # Un membre 'streamed' buit no genera cap parella
+    for chunk in CHUNK_SIZES:
+        assert parse(text, chunk, streamed=("images",)) == []
+
+
+@pytest.mark.parametrize("number", ["1.5", "-12345678901234567890", "6.02e23", "1E-7", "0"])
+def test_number_split_across_chunks(number):
+    # Cada posició de tall del número ha de donar el número sencer
+    text = '{"images": [' + ", ".join([number] * 3) + '], "n": ' + number + '}'
+    expected = json.loads(text)
+    for chunk in range(1, len(text) + 1):
+        assert rebuild(parse(text, chunk, streamed=("images",))) == expected
+
+
+@pytest.mark.parametrize("text", [
+    '',
+    '[]',   # vàlid per a json.loads, però l'arrel ha de ser un objecte
+    '{"a": 1',
+    '{"a": 1,}',
+    '{"a" 1}',
+    '{a: 1}',
+    '{"images": [1, 2,]}',
+    '{"images": [1 2]}',
+    '{"images": [1, 2}',
+    '{"a": 1} extra',
+    '{"a": "unterminated}',
+    '{"a": tru}',
+])
+def test_invalid_documents_raise(text):
+    if text != '[]':
+        with pytest.raises(json.JSONDecodeError):
+            json.loads(text)
+    for chunk in CHUNK_SIZES:
+        with pytest.raises(json.JSONDecodeError):
+            parse(text, chunk, streamed=("images",))
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+test_KnnGraph.py : KnnGraph.update incremental ha de donar el mateix graf
+que una construcció completa i que la cerca exacta per força bruta.
+"""
+import numpy as np
+import pytest
+
+from KnnGraph import KnnGraph
+
+K = 5
+
+
+def vectors(n: int, d: int = 16, seed: int = 0) -> np.ndarray:
+    matrix = np.random.default_rng(seed).standard_normal((n, d)).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def brute_force(matrix: np.ndarray, has_vector: np.ndarray, k: int) -> list:
+    valid = np.flatnonzero(has_vector)
+    expected = []
+    for row in range(len(matrix)):
+        if not has_vector[row]:
+            expected.append([])
+            continue
+        others = valid[valid != row]
+        scores = matrix[others] @ matrix[row]
+        expected.append(others[np.argsort(-scores, kind="stable")[:k]].tolist())
+    return expected
+
+
+def neighbour_lists(graph: KnnGraph) -> list:
+    return [[int(v) for v in row if v >= 0] for row in graph.neighbours]
+
+
+def full_graph(matrix, uuids, has_vector) -> KnnGraph:
+    graph = KnnGraph(K)
+    graph.update(matrix, uuids, has_vector, full=True)
+    return graph
+
+
+def test_build_matches_brute_force():
+    matrix = vectors(200)
+    has_vector = np.ones(200, dtype=bool)
+    has_vector[[3, 50, 199]] = False
+    matrix[~has_vector] = 0
+    uuids = [f"u{i}" for i in range(200)]
+    graph = KnnGraph(K)
+    assert graph.update(matrix, uuids, has_vector) == 197
+    assert neighbour_lists(graph) == brute_force(matrix, has_vector, K)
+
+
+def test_unchanged_update_returns_early():
+    matrix = vectors(100)
+    uuids = [f"u{i}" for i in range(100)]
+    has_vector = np.ones(100, dtype=bool)
+    graph = full_graph(matrix, uuids, has_vector)
+    neighbours = graph.neighbours.copy()
+    assert graph.update(matrix, uuids, has_vector) == 0
+    assert np.array_equal(graph.neighbours, neighbours)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_incremental_add_matches_full_rebuild(seed):
+    matrix = vectors(300, seed=seed)
+    uuids = [f"u{i}" for i in range(300)]
+    has_vector = np.ones(300, dtype=bool)
+    graph = full_graph(matrix[:250], uuids[:250], has_vector[:250])
+
+    # Les imatges noves només fan recalcular les seves llistes
+    assert graph.update(matrix, uuids, has_vector) == 50
+    assert graph.uuids == uuids
+    assert neighbour_lists(graph) == neighbour_lists(full_graph(matrix, uuids, has_vector))
+    assert neighbour_lists(graph) == brute_force(matrix, has_vector, K)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_incremental_remove_matches_full_rebuild(seed):
+    matrix = vectors(300, seed=seed)
+    uuids = [f"u{i}" for i in range(300)]
+    has_vector = np.ones(300, dtype=bool)
+    graph = full_graph(matrix, uuids, has_vector)
+
+    rng = np.random.default_rng(seed)
+    keep = np.sort(rng.choice(300, 260, replace=False))
+    kept_uuids = [uuids[i] for i in keep]
+    dirty = graph.update(matrix[keep], kept_uuids, has_vector[keep])
+    # Només es recalculen les llistes que han perdut algun veí
+    assert 0 < dirty < 260
+    expected = full_graph(matrix[keep], kept_uuids, has_vector[keep])
+    assert neighbour_lists(graph) == neighbour_lists(expected)
+
+
+def test_incremental_reorder_add_and_remove():
+    matrix = vectors(220, seed=7)
+    uuids = [f"u{i}" for i in range(220)]
+    has_vector = np.ones(220, dtype=bool)
+    graph = full_graph(matrix[:200], uuids[:200], has_vector[:200])
+
+    # Canvia l'ordre de les files, en treu unes quantes i n'afegeix de noves
+    order = np.random.default_rng(7).permutation(220)
+    order = order[order % 13 != 0]
+    new_uuids = [uuids[i] for i in order]
+    graph.update(matrix[order], new_uuids, has_vector[order])
+    expected = full_graph(matrix[order], new_uuids, has_vector[order])
+    assert graph.uuids == new_uuids
+    assert neighbour_lists(graph) == neighbour_lists(expected)
+
+
+def test_save_and_load_round_trip(tmp_path):
+    matrix = vectors(80)
+    uuids = [f"u{i}" for i in range(80)]
+    has_vector = np.ones(80, dtype=bool)
+    graph = full_graph(matrix, uuids, has_vector)
+    path = str(tmp_path / "graph.npz")
+    graph.save(path)
+    loaded = KnnGraph.load(path)
+    assert loaded.uuids == uuids and loaded.k == K
+    assert np.array_equal(loaded.neighbours, graph.neighbours)
+    assert loaded.update(matrix, uuids, has_vector) == 0
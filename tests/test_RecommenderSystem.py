@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+test_RecommenderSystem.py : Memòria cau de find_similar_images i imatges
+eliminades d'ImageData, sobre vectors sintètics.
+"""
+import numpy as np
+import pytest
+
+pytest.importorskip("cfg")
+from ImageData import ImageData  # noqa: E402
+from ImageID import ImageID  # noqa: E402
+from RecommenderSystem import RecommenderSystem  # noqa: E402
+from VectorStore import VectorStore  # noqa: E402
+
+N = 60
+
+
+@pytest.fixture
+def setup(tmp_path):
+    matrix = np.random.default_rng(0).standard_normal((N, 8)).astype(np.float32)
+    keys = [f"img{i:03d}" for i in range(N)]
+    path = str(tmp_path / "vectors.npy")
+    VectorStore(keys, matrix, np.ones(N, dtype=bool)).save(path)
+    image_id, image_data = ImageID(), ImageData()
+    for key in keys:
+        uuid = image_id.generate_uuid(key + ".png")
+        image_data.add_image(uuid, key + ".png")
+    recommender = RecommenderSystem(path, image_data=image_data, image_id=image_id)
+    recommender.preprocess()
+    return recommender, image_data
+
+
+def exact(recommender: RecommenderSystem, uuid: str, k: int) -> list:
+    """Veïns per força bruta, sense memòria cau i sense les files eliminades."""
+    matrix = recommender.matrix
+    row = recommender.uuid_rows[uuid]
+    scores = matrix @ matrix[row]
+    order = sorted((i for i in range(N) if i != row and i not in recommender.removed),
+                   key=lambda i: (-scores[i], i))
+    return [recommender.row_uuids[i] for i in order[:k]]
+
+
+def test_smaller_k_is_served_from_cache(setup):
+    recommender, _ = setup
+    uuid = recommender.row_uuids[0]
+    assert recommender.find_similar_images(uuid, 10).images == exact(recommender, uuid, 10)
+    assert recommender.find_similar_images(uuid, 4).images == exact(recommender, uuid, 4)
+    assert recommender.cache.hits == 1
+    # Una k més gran no es pot servir des de la memòria cau
+    assert recommender.find_similar_images(uuid, 20).images == exact(recommender, uuid, 20)
+    assert recommender.cache.hits == 1
+
+
+def test_removed_images_are_never_returned(setup):
+    recommender, image_data = setup
+    query, other = recommender.row_uuids[0], recommender.row_uuids[1]
+    first = recommender.find_similar_images(query, 5).images
+    recommender.find_similar_images(other, 5)
+    gone = first[0]
+    image_data.remove_image(gone)
+
+    # Les entrades on apareix la imatge eliminada es descarten
+    results = recommender.find_similar_images(query, 5).images
+    assert gone not in results and results == exact(recommender, query, 5)
+    assert recommender.find_similar_images(gone, 5).images == []
+    many = recommender.find_similar_images_many([query, other], 5)
+    assert all(gone not in images for images in many.values())
+    assert many[query] == results
+
+
+def test_preprocess_invalidates_cache(setup):
+    recommender, _ = setup
+    uuid = recommender.row_uuids[0]
+    recommender.find_similar_images(uuid, 5)
+    assert len(recommender.cache) == 1
+    recommender.preprocess()
+    assert len(recommender.cache) == 0
+    assert recommender.find_similar_images(uuid, 5).images == exact(recommender, uuid, 5)
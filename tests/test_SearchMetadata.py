@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+"""
+test_SearchMetadata.py : Els índexs de SearchMetadata s'han de mantenir al
+dia amb els canvis d'ImageData i donar el mateix que el recorregut complet;
+query(expr) ha de donar el mateix que avaluar l'expressió imatge a imatge,
+i search_prompt_ranked el mateix que puntuar BM25 des de zero. La memòria
+cau de prompt() s'ha d'invalidar amb els canvis.
+"""
+import math
+import random
+
+import pytest
+
+import SearchMetadada
+
+pytest.importorskip("cfg")
+from Gallery import Gallery  # noqa: E402
+from ImageData import ImageData  # noqa: E402
+from SearchMetadada import BM25_B, BM25_K1, And, Field, InGallery, Not, Or, Range, SearchMetadata, _ngrams  # noqa: E402
+
+FIELDS = ("prompt", "model", "seed", "cfg_scale", "steps", "sampler", "date")
+PNG_KEYS = {"prompt": "Prompt", "model": "Model", "seed": "Seed", "cfg_scale": "CFG_Scale",
+            "steps": "Steps", "sampler": "Sampler", "date": "Created_Date"}
+WORDS = ("neon", "city", "castle", "forest", "night", "red", "dragon", "ocean", "portrait")
+
+
+def set_metadata(image_data: ImageData, uuid: str, **fields) -> None:
+    """Desa metadades com si s'haguessin llegit del PNG (genera un 'update')."""
+    png_metadata = {PNG_KEYS[field]: value for field, value in fields.items()}
+    image_data._store_metadata(uuid, image_data.database[uuid], png_metadata, 512, 512)
+
+
+def add(image_data: ImageData, uuid: str, **fields) -> None:
+    image_data.add_image(uuid, uuid + ".png")
+    set_metadata(image_data, uuid, **fields)
+
+
+def random_fields(rng: random.Random) -> dict:
+    return {
+        "prompt": " ".join(rng.choice(WORDS) for _ in range(rng.randrange(1, 6))),
+        "model": rng.choice(("SDXL", "SD2", "SD1.5")),
+        "seed": str(rng.randrange(100000)),
+        "cfg_scale": rng.choice(("5.5", "7", "7.5", "12")),
+        "steps": str(rng.randrange(10, 60)),
+        "sampler": rng.choice(("Euler a", "DPM++ 2M", "DDIM")),
+        "date": f"2025-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}",
+    }
+
+
+def make_data(n: int, seed: int = 0) -> ImageData:
+    rng = random.Random(seed)
+    image_data = ImageData()
+    for i in range(n):
+        add(image_data, f"u{i}", **random_fields(rng))
+    return image_data
+
+
+def assert_matches_full_scan(search: SearchMetadata, image_data: ImageData) -> None:
+    reference = SearchMetadata(image_data)
+    for field in FIELDS:
+        for sub in ("neon", "castle", "ty nig", "SDXL", "1.5", "Euler", "2025-03", "7.5", "12"):
+            assert search._search_by_field(field, sub) == reference._search_by_field(field, sub), (field, sub)
+    assert search.seed_range(20000, 60000) == reference.seed_range(20000, 60000)
+    assert search.steps_range(25) == reference.steps_range(25)
+    assert search.cfg_scale_range(6, 8) == reference.cfg_scale_range(6, 8)
+    assert search.date_range("2025-03", "2025-06") == reference.date_range("2025-03", "2025-06")
+
+
+def test_update_retracts_old_terms():
+    image_data = ImageData()
+    add(image_data, "a", prompt="red castle at night", seed="10", steps="20")
+    add(image_data, "b", prompt="neon city", seed="30", steps="40")
+    search = SearchMetadata(image_data, use_index=True)
+    assert search.model("SDXL") == []
+    assert search._search_by_field("prompt", "castle") == ["a"]
+
+    # Tornar a carregar l'arxiu canviat: els trigrames i valors vells desapareixen
+    set_metadata(image_data, "a", prompt="blue ocean", seed="50", steps="20", model="SDXL")
+    row = search.rows.row_of("a")
+    assert search._search_by_field("prompt", "castle") == []
+    assert search._search_by_field("prompt", "ocean") == ["a"]
+    grams = {gram for gram, rows in search._postings["prompt"].items() if row in rows}
+    assert grams == _ngrams("blue ocean")
+    assert "cas" not in search._postings["prompt"]
+    assert search.seed_range(0, 20) == []
+    assert search.seed_range(40, 60) == ["a"]
+    assert search.steps_range(20, 20) == ["a"]
+    assert search.model("SDXL") == ["a"]
+
+
+def test_remove_and_add_keep_indexes_current():
+    image_data = ImageData()
+    add(image_data, "a", prompt="red castle", seed="10")
+    add(image_data, "b", prompt="red dragon", seed="20")
+    search = SearchMetadata(image_data, use_index=True)
+
+    image_data.remove_image("a")
+    assert search._search_by_field("prompt", "red") == ["b"]
+    assert search._search_by_field("prompt", "castle") == []
+    assert search.seed_range() == ["b"]
+    assert all(values for values in search._postings["prompt"].values())
+
+    # Una imatge nova (o la mateixa tornada a afegir) va al final de l'ordre
+    add(image_data, "c", prompt="red forest", seed="5")
+    add(image_data, "a", prompt="red castle", seed="15")
+    assert search._search_by_field("prompt", "red") == ["b", "c", "a"]
+    assert search.seed_range() == ["c", "a", "b"]
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_random_mutations_match_full_scan(seed):
+    rng = random.Random(seed)
+    image_data = make_data(150, seed)
+    search = SearchMetadata(image_data, use_index=True)
+    next_id = 150
+    for _ in range(200):
+        uuids = image_data.get_all_uuids()
+        action = rng.random()
+        if action < 0.2 and uuids:
+            image_data.remove_image(rng.choice(list(uuids)))
+        elif action < 0.4:
+            add(image_data, f"u{next_id}", **random_fields(rng))
+            next_id += 1
+        elif uuids:
+            # Només canvien alguns camps
+            fields = random_fields(rng)
+            uuid = rng.choice(list(uuids))
+            current = {field: search._getter_map[field](uuid) for field in FIELDS}
+            for field in rng.sample(FIELDS, rng.randrange(1, 4)):
+                current[field] = fields[field]
+            set_metadata(image_data, uuid, **current)
+    assert_matches_full_scan(search, image_data)
+
+
+def matches(image_data: ImageData, uuid: str, node) -> bool:
+    """Avaluació de referència d'una expressió per a una sola imatge."""
+    entry = image_data.database[uuid]
+    if isinstance(node, Field):
+        value = entry.get("created_date" if node.field == "date" else node.field)
+        return isinstance(value, str) and node.sub in value
+    if isinstance(node, Range):
+        value = entry.get("created_date" if node.field == "date" else node.field)
+        if not value:
+            return False
+        if node.field == "date":
+            high = None if node.high is None else node.high + "\uffff"
+        else:
+            value, high = float(value), node.high
+        return (node.low is None or value >= node.low) and (high is None or value <= high)
+    if isinstance(node, And):
+        return all(matches(image_data, uuid, child) for child in node.children)
+    if isinstance(node, Or):
+        return any(matches(image_data, uuid, child) for child in node.children)
+    if isinstance(node, Not):
+        return not matches(image_data, uuid, node.child)
+    return uuid in node.gallery
+
+
+def random_expr(rng: random.Random, gallery: Gallery, depth: int = 0):
+    kind = rng.randrange(7 if depth < 3 else 3)
+    if kind == 0:
+        return Field("prompt", rng.choice(WORDS + ("ne", "zzz", "castle night")))
+    if kind == 1:
+        low = rng.randrange(10, 60)
+        return rng.choice((Range("steps", low, low + rng.randrange(20)), Range("seed", None, rng.randrange(100000)),
+                           Range("cfg_scale", 7), Range("date", "2025-03", "2025-05")))
+    if kind == 2:
+        return rng.choice((Field("model", "SD"), Field("sampler", "DDIM"), InGallery(gallery)))
+    if kind == 3:
+        return Not(random_expr(rng, gallery, depth + 1))
+    children = [random_expr(rng, gallery, depth + 1) for _ in range(rng.randrange(1, 4))]
+    return And(*children) if kind in (4, 5) else Or(*children)
+
+
+@pytest.mark.parametrize("use_index", [False, True])
+def test_query_matches_brute_force(use_index):
+    rng = random.Random(3)
+    image_data = make_data(300, 3)
+    search = SearchMetadata(image_data, use_index=use_index)
+    gallery = Gallery()
+    gallery.uuids = rng.sample(sorted(image_data.get_all_uuids()), 60)
+    for _ in range(300):
+        expr = random_expr(rng, gallery)
+        expected = [uuid for uuid in image_data.get_all_uuids() if matches(image_data, uuid, expr)]
+        assert search.query(expr) == expected, expr
+
+
+def test_query_after_mutations_uses_insertion_order():
+    image_data = make_data(50, 4)
+    search = SearchMetadata(image_data, use_index=True)
+    image_data.remove_image("u3")
+    add(image_data, "late", prompt="neon castle", steps="30", model="SDXL")
+    set_metadata(image_data, "u0", prompt="neon castle", steps="31", model="SD2")
+    expr = Field("prompt", "castle") & Range("steps", 30, 31) & ~Field("model", "SD1")
+    expected = [uuid for uuid in image_data.get_all_uuids() if matches(image_data, uuid, expr)]
+    assert search.query(expr) == expected
+    assert expected[0] == "u0" and expected[-1] == "late"
+    assert search.query(Not(Field("prompt", ""))) == []
+
+
+def test_and_short_circuits_empty_predicates(monkeypatch):
+    image_data = make_data(100, 5)
+    search = SearchMetadata(image_data, use_index=True)
+    evaluated = []
+    evaluate = search._evaluate
+
+    def spy(node):
+        evaluated.append(node)
+        return evaluate(node)
+
+    monkeypatch.setattr(search, "_evaluate", spy)
+    # Cap prompt conté "zzz": l'estimació és 0 i no s'avalua cap predicat
+    assert search.query(And(Field("model", "SD"), Field("prompt", "zzz"), Range("steps", 10))) == []
+    assert evaluated == [evaluated[0]] and isinstance(evaluated[0], And)
+    # El predicat més selectiu s'avalua primer
+    evaluated.clear()
+    search.query(Field("model", "SD") & Range("seed", 0, 1000))
+    assert isinstance(evaluated[1], Range)
+
+
+def bm25_ranking(image_data: ImageData, query: str) -> list:
+    """Rànquing BM25 de referència, calculat des de zero amb tots els documents."""
+    documents = {}
+    for uuid in image_data.get_all_uuids():
+        prompt = image_data.get_prompt(uuid)
+        if prompt:
+            documents[uuid] = prompt.lower().split()
+    average = sum(map(len, documents.values())) / len(documents)
+    scores = {}
+    for term in set(query.lower().split()):
+        having = [uuid for uuid, words in documents.items() if term in words]
+        idf = math.log(1 + (len(documents) - len(having) + 0.5) / (len(having) + 0.5))
+        for uuid in having:
+            tf = documents[uuid].count(term)
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * len(documents[uuid]) / average)
+            scores[uuid] = scores.get(uuid, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+    order = list(image_data.get_all_uuids())
+    return sorted(scores, key=lambda uuid: (-round(scores[uuid], 9), order.index(uuid)))
+
+
+def term_uuids(search: SearchMetadata) -> dict:
+    uuid_of = search.rows.uuid_of
+    return {term: {uuid_of(row): tf for row, tf in bucket.items()} for term, bucket in search._terms.items()}
+
+
+def test_ranked_search_orders_by_relevance():
+    image_data = ImageData()
+    add(image_data, "a", prompt="a castle on a hill")
+    add(image_data, "b", prompt="Castle castle CASTLE")
+    add(image_data, "c", prompt="neon city at night with a long list of unrelated words")
+    add(image_data, "d", prompt="castle in a neon city")
+    search = SearchMetadata(image_data)
+    assert search.search_prompt_ranked("castle", k=10) == ["b", "a", "d"]
+    assert search.search_prompt_ranked("neon castle", k=1) == ["d"]
+    assert search.search_prompt_ranked("dragon") == []
+    assert search.search_prompt_ranked("castle", k=0) == []
+
+
+def test_ranked_search_ties_keep_insertion_order():
+    image_data = ImageData()
+    for uuid in ("x", "y", "z"):
+        add(image_data, uuid, prompt="red dragon")
+    search = SearchMetadata(image_data)
+    assert search.search_prompt_ranked("dragon", k=2) == ["x", "y"]
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_ranked_index_is_incremental(seed):
+    rng = random.Random(seed)
+    image_data = make_data(120, seed)
+    search = SearchMetadata(image_data)
+    search.build_ranked_index()
+    next_id = 120
+    for _ in range(150):
+        uuids = list(image_data.get_all_uuids())
+        action = rng.random()
+        if action < 0.2:
+            image_data.remove_image(rng.choice(uuids))
+        elif action < 0.5:
+            add(image_data, f"u{next_id}", **random_fields(rng))
+            next_id += 1
+        else:
+            uuid = rng.choice(uuids)
+            set_metadata(image_data, uuid, **random_fields(rng))
+    for query in ("castle", "neon city", "red dragon night", "portrait portrait"):
+        expected = bm25_ranking(image_data, query)
+        assert search.search_prompt_ranked(query, k=len(expected)) == expected
+        assert search.search_prompt_ranked(query, k=5) == expected[:5]
+    # El mateix que un índex construït de nou (les files poden ser diferents)
+    fresh = SearchMetadata(image_data)
+    fresh.build_ranked_index()
+    assert term_uuids(search) == term_uuids(fresh)
+    assert search._total_length == fresh._total_length
+
+
+def test_prompt_cache_serves_repeats_and_sees_changes():
+    image_data = ImageData()
+    add(image_data, "a", prompt="red castle")
+    add(image_data, "b", prompt="neon city")
+    search = SearchMetadata(image_data)
+    assert search.prompt("castle") == ["a"]
+    assert search.prompt("city") == ["b"]
+    assert search.prompt("castle") == ["a"]
+    assert search.cache.hits == 1
+
+    # Només es descarten les subcadenes del prompt vell o nou
+    set_metadata(image_data, "b", prompt="neon castle")
+    assert search.prompt("castle") == ["a", "b"]
+    assert search.prompt("city") == []
+    add(image_data, "c", prompt="dark forest")
+    image_data.remove_image("a")
+    assert search.prompt("castle") == ["b"]
+    assert search.cache.hits == 1
+
+    # Una imatge afegida sense metadades no canvia cap resultat
+    image_data.add_image("d", "d.png")
+    assert search.prompt("castle") == ["b"]
+    assert search.cache.hits == 2
+
+    # Modificar el resultat retornat no altera la memòria cau
+    search.prompt("castle").append("zzz")
+    assert search.prompt("castle") == ["b"]
+
+
+def test_prompt_cache_is_dropped_after_many_changes(monkeypatch):
+    monkeypatch.setattr(SearchMetadada, "STALE_PROMPTS", 4)
+    image_data = make_data(20, 6)
+    search = SearchMetadata(image_data, use_index=True)
+    assert search.prompt("zzz") == []
+    for i in range(10):
+        set_metadata(image_data, f"u{i}", prompt="zzz")
+    assert search._stale_prompts is None
+    assert search.prompt("zzz") == [f"u{i}" for i in range(10)]
+    assert search.cache.stats()["invalidations"] == 1
+
+
+def test_prompt_cache_disabled():
+    image_data = make_data(10, 7)
+    search = SearchMetadata(image_data, cache_size=0)
+    assert search.prompt("ne") == search.prompt("ne")
+    assert search.cache.hits == 0 and len(search.cache) == 0
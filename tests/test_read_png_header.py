@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+test_read_png_header.py : Lector de chunks PNG d'ImageData (tEXt, zTXt,
+iTXt i IHDR), amb PNG construïts byte a byte.
+"""
+import struct
+import zlib
+
+import pytest
+
+pytest.importorskip("cfg")
+from ImageData import MAX_TEXT_CHUNK, PNG_SIGNATURE, read_png_header  # noqa: E402
+
+
+def chunk(ctype: bytes, data: bytes) -> bytes:
+    crc = zlib.crc32(ctype + data) & 0xffffffff
+    return struct.pack(">I", len(data)) + ctype + data + struct.pack(">I", crc)
+
+
+def ihdr(width: int, height: int) -> bytes:
+    return chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+
+def text(key: str, value: str) -> bytes:
+    return chunk(b"tEXt", key.encode("latin-1") + b"\0" + value.encode("latin-1"))
+
+
+def ztxt(key: str, value: bytes) -> bytes:
+    return chunk(b"zTXt", key.encode("latin-1") + b"\0\0" + zlib.compress(value))
+
+
+def itxt(key: str, value: str, compressed: bool) -> bytes:
+    data = value.encode("utf-8")
+    if compressed:
+        data = zlib.compress(data)
+    header = key.encode("latin-1") + b"\0" + bytes((int(compressed), 0)) + b"ca\0Clau\0"
+    return chunk(b"iTXt", header + data)
+
+
+def write_png(path, *chunks, width: int = 640, height: int = 480) -> str:
+    # Un IDAT de veritat no cal: el lector s'atura abans de llegir-lo
+    idat = chunk(b"IDAT", zlib.compress(b"\0" * (width * 3 + 1)))
+    with open(path, 'wb') as f:
+        f.write(PNG_SIGNATURE + ihdr(width, height) + b"".join(chunks) + idat + chunk(b"IEND", b""))
+    return str(path)
+
+
+def test_text_chunks_and_dimensions(tmp_path):
+    path = write_png(tmp_path / "a.png",
+                     text("Prompt", "a neon city at night"),
+                     ztxt("Model", b"SDXL"),
+                     itxt("Sampler", "Euler a · ñ", compressed=False),
+                     itxt("Seed", "12345", compressed=True),
+                     chunk(b"gAMA", struct.pack(">I", 45455)),
+                     width=1024, height=768)
+    metadata, dimensions = read_png_header(path)
+    assert tuple(dimensions) == (1024, 768)
+    assert metadata == {"Prompt": "a neon city at night", "Model": "SDXL",
+                        "Sampler": "Euler a · ñ", "Seed": "12345"}
+
+
+def test_matches_pil(tmp_path):
+    from PIL import Image
+    from PIL.PngImagePlugin import PngInfo
+
+    info = PngInfo()
+    info.add_text("Prompt", "castle " * 50, zip=True)
+    info.add_itxt("Description", "Imatge de prova", lang="ca", zip=True)
+    info.add_text("Steps", "30")
+    path = str(tmp_path / "pil.png")
+    Image.new("RGB", (33, 17)).save(path, pnginfo=info)
+    metadata, dimensions = read_png_header(path)
+    with Image.open(path) as img:
+        assert metadata == dict(img.text)
+        assert tuple(dimensions) == img.size
+
+
+def test_oversized_compressed_chunk_is_dropped(tmp_path):
+    # Més gran que MAX_TEXT_CHUNK un cop descomprimit: es descarta sencer
+    big = b"x" * (2 * MAX_TEXT_CHUNK)
+    path = write_png(tmp_path / "big.png",
+                     ztxt("Prompt", big),
+                     itxt("Description", big.decode(), compressed=True),
+                     text("Model", "SD2"))
+    metadata, _ = read_png_header(path)
+    assert metadata == {"Model": "SD2"}
+
+
+def test_corrupt_chunks_are_skipped(tmp_path):
+    path = write_png(tmp_path / "bad.png",
+                     chunk(b"zTXt", b"Prompt\0\0not zlib"),
+                     chunk(b"zTXt", b"Seed\0\0" + zlib.compress(b"123")[:-3]),
+                     chunk(b"tEXt", b"no separator"),
+                     text("Steps", "20"))
+    metadata, _ = read_png_header(path)
+    assert metadata == {"Steps": "20"}
+
+
+def test_stops_at_first_idat(tmp_path):
+    path = tmp_path / "late.png"
+    write_png(path, text("Model", "SD2"))
+    # Un chunk de text després de l'IDAT no es llegeix
+    data = path.read_bytes()
+    end = data.rindex(b"IEND") - 4
+    path.write_bytes(data[:end] + text("Late", "x") + data[end:])
+    metadata, _ = read_png_header(str(path))
+    assert metadata == {"Model": "SD2"}
+
+
+def test_not_a_png(tmp_path):
+    path = tmp_path / "fake.png"
+    path.write_bytes(b"GIF89a" + b"\0" * 32)
+    with pytest.raises(ValueError):
+        read_png_header(str(path))
+    path.write_bytes(PNG_SIGNATURE + chunk(b"IEND", b""))
+    with pytest.raises(ValueError):
+        read_png_header(str(path))
+
+
+def test_truncated_ihdr_raises_value_error(tmp_path):
+    path = tmp_path / "short.png"
+    path.write_bytes(PNG_SIGNATURE + struct.pack(">I", 13) + b"IHDR" + b"\0\0\0\x10")
+    with pytest.raises(ValueError):
+        read_png_header(str(path))